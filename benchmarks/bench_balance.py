@@ -0,0 +1,19 @@
+'''Time Account.balance reads as the ledger grows.
+
+The running balance should make reads cost the same whatever the ledger
+size; the full recount is shown alongside for comparison.
+'''
+from common import best_of, make_account
+
+
+def main(sizes=(1000, 10000, 100000, 300000)):
+    print '%10s %16s %16s' % ('ledger', 'balance (us)', 'recount (us)')
+    for size in sizes:
+        account = make_account(size)
+        read = best_of(lambda: account.balance, number=10000)
+        recount = best_of(account.recompute_balance, number=3)
+        print '%10d %16.3f %16.1f' % (size, read * 1e6, recount * 1e6)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+'''Time Account.get_budget_totals against the old nested loop.
+
+    $ python benchmarks/bench_budget_totals.py [transactions] [budgets]
+
+Defaults to 1M transactions across 500 budgets. The old loop walks every
+transaction once per budget, so it is only timed for a handful of
+budgets and scaled up.
+'''
+import sys
+
+from common import best_of, make_account
+
+try:
+    from cDecimal import Decimal
+except ImportError:
+    from decimal import Decimal
+
+
+def legacy_budget_totals(account, budgets):
+    totals = {}
+    for budget in budgets:
+        totals[budget.name] = 0
+        for purchase in account.transactions:
+            if purchase.direction < 0:
+                if purchase.category == budget.name:
+                    totals[budget.name] += purchase.amount
+        totals[budget.name] = Decimal(totals[budget.name]).quantize(Decimal('0.01'))
+    return totals
+
+
+def main(size=1000000, budgets=500):
+    account = make_account(size, budgets=budgets)
+    now = account.transactions[-1].timestamp
+
+    sample = account.budgets[:5]
+    legacy = best_of(lambda: legacy_budget_totals(account, sample), repeat=1)
+    legacy *= len(account.budgets) / float(len(sample))
+    totals = best_of(account.get_budget_totals)
+    current = best_of(lambda: account.get_budget_totals(timestamp=now))
+    one = best_of(lambda: account.get_budget_total('Budget0', timestamp=now), number=100)
+
+    assert legacy_budget_totals(account, sample) == dict((b.name, account.get_budget_total(b.name)) for b in sample)
+
+    print '%d transactions, %d budgets' % (size, budgets)
+    print '%-36s %12.3f ms' % ('nested loop, all budgets (scaled)', legacy * 1e3)
+    print '%-36s %12.3f ms' % ('get_budget_totals()', totals * 1e3)
+    print '%-36s %12.3f ms' % ('get_budget_totals(timestamp)', current * 1e3)
+    print '%-36s %12.3f ms' % ("get_budget_total('Budget0', now)", one * 1e3)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,97 @@
+'''Reads and writes on one account from several threads at once.
+
+    $ python benchmarks/bench_concurrency.py [transactions] [readers]
+
+One writer adds 200k made up transactions, by default, in chunks of
+10000, as a big mail backfill would, while readers on other threads
+(4 by default) read the balance and budget totals and page through
+transactions as fast as they can. Prints the writer's rows per second,
+the readers' reads per second, and how long reads took: the 99th
+percentile and the worst.
+
+Then it all runs again with every read taking the writer's lock, as a
+coarse lock around the whole account would have it, for comparison:
+reads then wait out whole chunks. Last the writer runs alone, for what
+it can do with nobody reading; readers and writer share one
+interpreter lock, so busy readers cost the writer time whatever else.
+'''
+import sys
+import time
+import threading
+
+from common import make_transactions
+from budgetkeeper.budgetkeeper import Account, MONTHLY
+from budgetkeeper.instrument import Histogram
+
+NAMES = ['Budget%d' % i for i in range(10)]
+
+
+def reads(account, locked):
+    '''The reads a web page does, either from a snapshot or under the writer's lock.'''
+    def read():
+        snapshot = account.snapshot()
+        snapshot.balance
+        snapshot.get_budget_totals()
+        account.page_transactions(limit=50)
+
+    if not locked:
+        return read
+
+    def read_locked():
+        with account._write_lock:
+            account.balance
+            account.get_budget_totals()
+            account.page_transactions(limit=50)
+    return read_locked
+
+
+def run(size, readers, locked):
+    account = Account()
+    for name in NAMES:
+        account.add_budget(name, interval=MONTHLY)
+    # Build the timeline up front, so paging doesn't wait for it.
+    account.page_transactions()
+    transactions = list(make_transactions(size, NAMES))
+
+    done = threading.Event()
+    latencies = [Histogram() for i in range(readers)]
+    read = reads(account, locked)
+
+    def reader(histogram):
+        while not done.is_set():
+            start = time.time()
+            read()
+            histogram.add(time.time() - start)
+
+    threads = [threading.Thread(target=reader, args=(histogram,)) for histogram in latencies]
+    for thread in threads:
+        thread.start()
+    start = time.time()
+    account.add_transactions(transactions, chunk_size=10000)
+    seconds = time.time() - start
+    done.set()
+    for thread in threads:
+        thread.join()
+
+    # All the readers' latencies together.
+    histogram = Histogram()
+    for each in latencies:
+        histogram.counts = [a + b for a, b in zip(histogram.counts, each.counts)]
+        histogram.count += each.count
+        histogram.total += each.total
+        histogram.max = max(histogram.max, each.max)
+    return size / seconds, histogram.count / seconds, histogram
+
+
+def main(size=200000, readers=4):
+    print '%-16s %14s %14s %12s %12s' % ('reads', 'writes rows/s', 'reads/s', 'p99 ms', 'max ms')
+    for name, locked in (('from snapshots', False), ('under the lock', True)):
+        writes, reads_per_second, histogram = run(size, readers, locked)
+        print '%-16s %14.0f %14.0f %12.1f %12.1f' % (
+            name, writes, reads_per_second, histogram.percentile(99) * 1000, histogram.max * 1000)
+    writes, reads_per_second, histogram = run(size, 0, False)
+    print '%-16s %14.0f' % ('no readers', writes)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,102 @@
+'''Rows per second exporting and importing, as CSV and in columns.
+
+    $ python benchmarks/bench_export.py [rows]
+
+Defaults to 10M rows. They're made by cycling through 100k made up
+transactions, so making them costs next to nothing and stays out of the
+way of both the timings and the memory. For each format this times
+writing every row to a temporary file and reading them all back, and
+prints the size of the file and the most memory the process used along
+the way; that staying put is what streaming buys. Pages of the column
+file mapped in are the operating system's to drop, so aren't counted.
+For the column file it also times opening it again and reading rows
+here and there.
+'''
+import os
+import sys
+import time
+import random
+import shutil
+import resource
+import tempfile
+import itertools
+
+from common import make_transactions
+from budgetkeeper import export
+
+POOL = 100000
+
+
+class Memory(object):
+    '''The most memory of the process's own seen, checked every so often.
+
+    That's RssAnon, where Linux has it, so the mapped file is left out.
+    '''
+    def __init__(self):
+        self.peak = 0
+
+    def check(self):
+        try:
+            with open('/proc/self/status') as status:
+                kb = [int(line.split()[1]) for line in status if line.startswith('RssAnon:')][0]
+        except (IOError, IndexError):
+            kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        self.peak = max(self.peak, kb / 1024.0)
+        return self.peak
+
+    def watch(self, iterable, every=4096):
+        for i, item in enumerate(iterable):
+            if not i % every:
+                self.check()
+            yield item
+
+
+def rows(size):
+    pool = list(make_transactions(POOL, ['Budget%d' % i for i in range(10)]))
+    return lambda: itertools.islice(itertools.cycle(pool), size)
+
+
+def timed(func):
+    start = time.time()
+    result = func()
+    return result, time.time() - start
+
+
+def count(iterable):
+    n = 0
+    for n, trans in enumerate(iterable, 1):
+        pass
+    return n
+
+
+def main(size=10000000):
+    source = rows(size)
+    directory = tempfile.mkdtemp()
+    memory = Memory()
+    print 'Memory with the %d transactions to cycle through: %.0f MB' % (POOL, memory.check())
+    print '%-8s %14s %14s %12s %14s' % ('format', 'write rows/s', 'read rows/s', 'bytes/row', 'peak memory')
+    try:
+        for name in ('ledger.csv', 'ledger.bk'):
+            path = os.path.join(directory, name)
+            memory = Memory()
+            written, write_seconds = timed(lambda: export.save(memory.watch(source()), path))
+            read, read_seconds = timed(lambda: count(memory.watch(export.load(path))))
+            assert written == read == size
+            print '%-8s %14.0f %14.0f %12.1f %11.0f MB' % (
+                os.path.splitext(name)[1], size / write_seconds, size / read_seconds,
+                os.path.getsize(path) / float(size), memory.peak)
+
+        path = os.path.join(directory, 'ledger.bk')
+        opened, seconds = timed(lambda: export.ColumnFile(path))
+        print 'Opening the column file: %.3f ms' % (seconds * 1000)
+        rand = random.Random(0)
+        picks = [rand.randrange(size) for i in range(100)]
+        found, seconds = timed(lambda: [opened[row] for row in picks])
+        print 'Reading a row at random from it: %.1f ms' % (seconds * 1000 / len(picks))
+        opened.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,38 @@
+'''Time forecasting a balance decades out, against generating every repeat.
+
+    $ python benchmarks/bench_forecast.py [recurring_items] [years]
+
+Defaults to 1000 bills and paychecks over a 30 year horizon. The
+forecast counts repeats per item, so its cost doesn't grow with the
+horizon; generating them does, in both time and memory.
+'''
+import sys
+import time
+import datetime
+
+from common import best_of
+from bench_recurring import START, make_account
+
+
+def main(count=1000, years=30):
+    until = START + datetime.timedelta(days=365 * years)
+
+    account = make_account(count)
+    forecast = best_of(lambda: account.forecast_balance(until))
+    expected = account.forecast_balance(until)
+    monthly = [START + datetime.timedelta(days=30 * month) for month in range(12 * years)]
+    series = best_of(lambda: list(account.forecast(monthly)), repeat=1)
+
+    start = time.time()
+    added = account.trigger_recurring(until)
+    generated = time.time() - start
+    assert account.balance == expected
+
+    print '%d recurring items, %d years, %d repeats' % (count, years, added)
+    print '%-36s %12.1f ms' % ('forecast_balance', forecast * 1e3)
+    print '%-36s %12.1f ms' % ('forecast at %d monthly points' % len(monthly), series * 1e3)
+    print '%-36s %12.1f ms' % ('generating every repeat', generated * 1e3)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
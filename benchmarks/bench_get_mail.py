@@ -0,0 +1,71 @@
+'''Round trips and bytes for syncing a mailbox, old way and new.
+
+    $ python benchmarks/bench_get_mail.py [messages] [new_messages]
+
+Runs against the fake IMAP server from the tests, with 5k messages in
+the mailbox by default and 20 new ones arriving before the next run.
+'''
+import os
+import sys
+import time
+import email
+import tempfile
+
+import common  # puts budgetkeeper on the path
+from budgetkeeper import settings
+from budgetkeeper.get_mail import SyncState, connect, get_mail
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'tests'))
+from fakeimap import FakeIMAPServer
+
+ME = 'me@example.com'
+BODY = 'Sent from my phone.\r\n' * 40
+
+
+def legacy_get_mail():
+    '''Search the whole mailbox, then fetch each whole message on its own.'''
+    mail = connect()
+    result, data = mail.uid('search', None, '(FROM "%s")' % ME)
+    for uid in data[0].split():
+        result, data = mail.uid('fetch', uid, '(RFC822)')
+        yield email.message_from_string(data[0][1])['Subject']
+    mail.logout()
+
+
+def incremental(state):
+    return [message for batch in get_mail(state) for message in batch]
+
+
+def measure(server, sync):
+    server.reset_stats()
+    start = time.time()
+    count = len(list(sync()))
+    return count, server.stats['commands'], server.stats['bytes'], time.time() - start
+
+
+def main(count=5000, new=20):
+    server = FakeIMAPServer()
+    server.start()
+    settings.IMAP_ENABLED, settings.IMAP_USE_SSL = True, False
+    settings.IMAP_SERVER, settings.IMAP_PORT, settings.IMAP_LABEL = '127.0.0.1', server.port, False
+    settings.AUTHENTICATION_EMAIL, settings.AUTHENTICATION_PASSWORD = ME, 'secret'
+    for i in range(count):
+        server.add_message(ME, 'Paid $%d for coffee' % (i % 10), body=BODY)
+
+    state = SyncState.load(os.path.join(tempfile.mkdtemp(), 'imap-state.json'))
+    rows = [('full search, RFC822 each',) + measure(server, legacy_get_mail),
+            ('first sync, batched headers',) + measure(server, lambda: incremental(state))]
+    for i in range(new):
+        server.add_message(ME, 'Paid $%d for lunch' % i, body=BODY)
+    rows.append(('old way, %d new' % new,) + measure(server, legacy_get_mail))
+    rows.append(('incremental, %d new' % new,) + measure(server, lambda: incremental(state)))
+    server.stop()
+
+    print '%d messages in the mailbox' % count
+    print '%-30s %8s %10s %12s %10s' % ('', 'fetched', 'commands', 'bytes', 'ms')
+    for name, fetched, commands, size, elapsed in rows:
+        print '%-30s %8d %10d %12d %10.1f' % (name, fetched, commands, size, elapsed * 1e3)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
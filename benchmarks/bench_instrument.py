@@ -0,0 +1,46 @@
+'''What instrumentation costs, off and on.
+
+    $ python benchmarks/bench_instrument.py [messages]
+
+Times Account.parse_messages over 100k subjects by default, with
+instrumentation off and on, and a timer() block on its own.
+'''
+import sys
+import time
+import timeit
+
+from common import make_messages
+from budgetkeeper import instrument
+from budgetkeeper.budgetkeeper import Account
+
+
+def run(messages):
+    account = Account()
+    for i in range(10):
+        account.add_budget('Budget%d' % i)
+    start = time.time()
+    account.parse_messages(iter(messages))
+    return len(messages) / (time.time() - start)
+
+
+def timer_cost(number=1000000):
+    def block():
+        with instrument.timer('bench'):
+            pass
+    return min(timeit.repeat(block, number=number, repeat=3)) / number
+
+
+def main(count=100000):
+    messages = make_messages(count)
+    print '%d messages' % count
+    for enabled in (False, True, False, True):
+        instrument.enable(enabled)
+        print '%-28s %12.0f msg/s' % ('on' if enabled else 'off', run(messages))
+    for enabled in (False, True):
+        instrument.enable(enabled)
+        print '%-28s %12.2f us' % ('timer() block, ' + ('on' if enabled else 'off'), timer_cost() * 1e6)
+    instrument.enable(False)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
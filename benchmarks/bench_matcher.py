@@ -0,0 +1,41 @@
+'''Time finding the budget in a description, as the number of budgets grows.
+
+The old way re-normalized the description and checked every budget
+name in turn; the matcher walks the description once.
+'''
+import re
+
+from common import best_of, make_messages
+from budgetkeeper import parsing
+from budgetkeeper.budgetkeeper import Budget
+from budgetkeeper.matcher import BudgetMatcher
+
+
+def linear_find(budgets, description):
+    for budget in budgets:
+        category = re.sub(r'[^\w]*', '', description).lower()
+        if budget.name.lower() in category.lower():
+            return budget
+
+
+def main(counts=(10, 100, 300, 1000)):
+    descriptions = [clause.description
+                    for message in make_messages(2000, budgets=10)
+                    for clause in parsing.parse(message)]
+
+    print '%8s %18s %18s' % ('budgets', 'linear (us/desc)', 'matcher (us/desc)')
+    for count in counts:
+        # The interesting budgets go last, which is the worst case for a scan.
+        names = ['Other%d' % i for i in range(count - 10)] + ['Budget%d' % i for i in range(10)]
+        budgets = [Budget(name) for name in names]
+        matcher = BudgetMatcher()
+        for budget in budgets:
+            matcher.add(budget.name, budget)
+
+        linear = best_of(lambda: [linear_find(budgets, d) for d in descriptions])
+        automaton = best_of(lambda: [matcher.find(d) for d in descriptions])
+        print '%8d %18.2f %18.2f' % (count, linear / len(descriptions) * 1e6, automaton / len(descriptions) * 1e6)
+
+
+if __name__ == "__main__":
+    main()
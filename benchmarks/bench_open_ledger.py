@@ -0,0 +1,46 @@
+'''Time opening an Account kept on disk.
+
+    $ python benchmarks/bench_open_ledger.py [transactions]
+
+Defaults to a 1M transaction ledger. Opening only reads the budgets and
+running totals; reading every transaction back is timed separately.
+'''
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+from common import best_of, make_account
+from budgetkeeper.budgetkeeper import Account
+
+
+def main(size=1000000):
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'ledger.db')
+    try:
+        start = time.time()
+        account = make_account(size, path=path)
+        account.close()
+        elapsed = time.time() - start
+
+        print '%d transactions, %.1f MB on disk' % (size, os.path.getsize(path) / 1e6)
+        print '%-36s %12.0f rows/s' % ('writing', size / elapsed)
+
+        def open_account():
+            account = Account(path)
+            account.balance, account.get_budget_totals()
+            account.close()
+        print '%-36s %12.3f ms' % ('open, balance and budget totals', best_of(open_account) * 1e3)
+
+        def read_all():
+            account = Account(path)
+            len(account.transactions)
+            account.close()
+        print '%-36s %12.3f ms' % ('open and read every transaction', best_of(read_all, repeat=1) * 1e3)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
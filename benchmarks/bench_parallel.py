@@ -0,0 +1,41 @@
+'''Messages per second through Account.parse_messages, serial and in a process pool.
+
+    $ python benchmarks/bench_parallel.py [messages] [chunk_size]
+
+Defaults to a corpus of 200k subjects. Budget matching and adding to
+the ledger stay in the parent process, so the speedup levels off once
+that becomes the bottleneck.
+'''
+import sys
+import time
+import datetime
+
+from common import make_messages
+from budgetkeeper.budgetkeeper import Account
+
+
+def ingest(messages, workers, chunk_size):
+    account = Account()
+    for i in range(10):
+        account.add_budget('Budget%d' % i)
+    start = time.time()
+    account.parse_messages(iter(messages), timestamp=datetime.datetime(2012, 1, 1),
+                           chunk_size=chunk_size, workers=workers)
+    return time.time() - start, account
+
+
+def main(count=200000, chunk_size=2000):
+    messages = make_messages(count)
+    # One worker means parsing in this process, without a pool.
+    serial, expected = ingest(messages, 1, chunk_size)
+    print '%d messages, chunks of %d' % (count, chunk_size)
+    print '%8s %14s %10s' % ('workers', 'msg/s', 'speedup')
+    print '%8d %14.0f %10.2f' % (1, count / serial, 1.0)
+    for workers in (2, 4, 8):
+        elapsed, account = ingest(messages, workers, chunk_size)
+        assert repr(account.transactions) == repr(expected.transactions)
+        print '%8d %14.0f %10.2f' % (workers, count / elapsed, serial / elapsed)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,58 @@
+'''Messages per second through Account.parse_messages, with and without the parse cache.
+
+    $ python benchmarks/bench_parse_cache.py [messages] [percent unique]
+
+Defaults to 100k subjects, all but 5% of them one of a handful of
+templates with a different amount, the way most people's mail looks.
+The rest are made unique, so they can only ever miss.
+'''
+import sys
+import time
+import random
+import string
+
+from common import make_messages
+from budgetkeeper.budgetkeeper import Account
+
+
+def make_corpus(count, unique, seed=0):
+    rand = random.Random(seed)
+    messages = make_messages(count, seed=seed)
+    for i in xrange(0, count, int(100 / unique) if unique else count + 1):
+        # No digits, or they'd be taken for amounts and templated away.
+        word = ''.join(rand.choice(string.ascii_lowercase) for letter in range(10))
+        messages[i] = 'Paid $%d for a %s' % (rand.randint(1, 200), word)
+    return messages
+
+
+def make_account(cache=True):
+    account = Account()
+    if not cache:
+        account.parse_cache = None
+    for i in range(10):
+        account.add_budget('Budget%d' % i)
+    return account
+
+
+def rate(func, messages):
+    start = time.time()
+    func(messages)
+    return len(messages) / (time.time() - start)
+
+
+def main(count=100000, unique=5):
+    messages = make_corpus(count, unique)
+    print '%d messages, %d%% unique' % (count, unique)
+    for cache in (False, True):
+        label = 'parse cache' if cache else 'no cache'
+        # Just turning messages into Purchases, then all the way into the ledger.
+        account = make_account(cache)
+        print '%-28s %12.0f msg/s' % (label + ', parse only', rate(lambda ms: [account._parse(m) for m in ms], messages))
+        account = make_account(cache)
+        print '%-28s %12.0f msg/s' % (label + ', parse_messages', rate(account.parse_messages, messages))
+    cache = account.parse_cache
+    print '%-28s %12.1f%% (%d templates cached)' % ('hit rate', 100.0 * cache.hits / (cache.hits + cache.misses), len(cache))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
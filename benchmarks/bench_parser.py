@@ -0,0 +1,89 @@
+'''Messages per second through the message parser, old and new.
+
+    $ python benchmarks/bench_parser.py [messages]
+
+Defaults to a corpus of 100k subjects. The old parser is kept below,
+as it was, so there is something to compare against.
+'''
+import re
+import sys
+import time
+
+from common import make_messages
+from budgetkeeper import parsing
+from budgetkeeper.budgetkeeper import Account
+
+
+class LegacyMessage(object):
+    money = r'\$?(\d*(\.\d\d?)?|\d+)'
+    only_money = re.compile(r'^%s.*$' % money)
+
+    @staticmethod
+    def get_money(message):
+        for word in message.split(' '):
+            result = LegacyMessage.only_money.findall(word)[0][0]
+            if result:
+                return result
+
+    @staticmethod
+    def get_description(message):
+        description = re.match(r'(?:paid )?(?:bought )?(?P<first_desc>.*) for (?P<description>.*)', message.lower(), flags=re.IGNORECASE)
+        if description:
+            first_desc_is_money = LegacyMessage.get_money(description.group('first_desc'))
+            if description.group('description') and first_desc_is_money:
+                return description.group('description').capitalize()
+
+        money = LegacyMessage.get_money(message)
+        if not money:
+            return
+
+        regex = r"( ?\$?(%s)[ ]?)" % re.escape(money)
+        msg = re.sub(regex, '', message, count=1)
+
+        ext_desc = r'bought (?P<description>.*) for[ ]?(?P<more_description>.*)'
+        extended_desc = re.match(ext_desc, msg, flags=re.IGNORECASE)
+        if extended_desc:
+            if extended_desc.group('description') or extended_desc.group('more_description'):
+                return (extended_desc.group('description').capitalize() + extended_desc.group('more_description'))
+
+        return message
+
+
+def legacy_parse(message):
+    clauses = []
+    for part in message.split('and'):
+        amount = LegacyMessage.get_money(part)
+        if not amount:
+            return
+        clauses.append((amount, LegacyMessage.get_description(part)))
+    return clauses
+
+
+def rate(func, messages):
+    start = time.time()
+    for message in messages:
+        func(message)
+    return len(messages) / (time.time() - start)
+
+
+def main(count=100000):
+    messages = make_messages(count)
+    print '%d messages' % count
+    print '%-28s %12.0f msg/s' % ('old split + regexes', rate(legacy_parse, messages))
+    print '%-28s %12.0f msg/s' % ('parsing.parse', rate(parsing.parse, messages))
+
+    account = Account()
+    for i in range(10):
+        account.add_budget('Budget%d' % i)
+    print '%-28s %12.0f msg/s' % ('Account.parse_message', rate(account.parse_message, messages))
+
+    account = Account()
+    for i in range(10):
+        account.add_budget('Budget%d' % i)
+    start = time.time()
+    account.parse_messages(iter(messages))
+    print '%-28s %12.0f msg/s' % ('Account.parse_messages', count / (time.time() - start))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
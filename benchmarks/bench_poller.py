@@ -0,0 +1,98 @@
+'''Ingest latency of the mail daemon, against running main() from cron.
+
+    $ python benchmarks/bench_poller.py [messages] [poll_interval]
+
+Runs against the fake IMAP server from the tests. Messages arrive one
+at a time, 50 by default, and each is timed from delivery to being in
+the ledger, with the server waiting in IDLE and then with polling every
+poll_interval seconds. A cron run pays for connecting and logging in
+every time, on top of waiting up to a whole cron interval.
+'''
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+
+import common  # puts budgetkeeper on the path
+from budgetkeeper import settings
+from budgetkeeper.budgetkeeper import Account
+from budgetkeeper.get_mail import SyncState, sync
+from budgetkeeper.poller import MailDaemon
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'tests'))
+from fakeimap import FakeIMAPServer
+
+ME = 'me@example.com'
+
+
+def serve(**options):
+    server = FakeIMAPServer(**options)
+    server.start()
+    settings.IMAP_ENABLED, settings.IMAP_USE_SSL = True, False
+    settings.IMAP_SERVER, settings.IMAP_PORT, settings.IMAP_LABEL = '127.0.0.1', server.port, False
+    settings.AUTHENTICATION_EMAIL, settings.AUTHENTICATION_PASSWORD = ME, 'secret'
+    return server
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[int(round((len(values) - 1) * percent / 100.0))]
+
+
+def daemon_latency(count, idle, poll_interval, directory):
+    server = serve(idle=idle)
+    daemon = MailDaemon(Account(), SyncState(os.path.join(directory, 'state-%s.json' % idle)),
+                        poll_interval=poll_interval)
+    daemon.start()
+    rand = random.Random(0)
+    latencies = []
+    server.reset_stats()
+    for i in range(count):
+        time.sleep(rand.uniform(0, 0.05))
+        delivered = time.time()
+        server.add_message(ME, 'Paid $%d for coffee' % i)
+        while not daemon.ingest(timeout=poll_interval * 2 + 1):
+            pass
+        latencies.append(time.time() - delivered)
+    daemon.stop()
+    commands = server.stats['commands']
+    server.stop()
+    return latencies, daemon.metrics, commands
+
+
+def cron_run(directory):
+    '''What main() does each time cron starts it, with one new message.'''
+    server = serve()
+    state_path = os.path.join(directory, 'state-cron.json')
+    sync(Account(), SyncState.load(state_path))
+    server.add_message(ME, 'Paid $3 for coffee')
+    server.reset_stats()
+    start = time.time()
+    sync(Account(), SyncState.load(state_path))
+    elapsed = time.time() - start
+    commands = server.stats['commands']
+    server.stop()
+    return elapsed, commands
+
+
+def main(count=50, poll_interval=1):
+    directory = tempfile.mkdtemp()
+    try:
+        print '%d messages, one at a time' % count
+        print '%-26s %10s %10s %12s %10s' % ('', 'p50 ms', 'p99 ms', 'poller p50', 'commands')
+        for name, idle in (('IDLE', True), ('poll every %ss' % poll_interval, False)):
+            latencies, metrics, commands = daemon_latency(count, idle, poll_interval, directory)
+            print '%-26s %10.1f %10.1f %12.1f %10d' % (name, percentile(latencies, 50) * 1e3,
+                                                      percentile(latencies, 99) * 1e3,
+                                                      metrics.percentile(50) * 1e3, commands)
+
+        elapsed, commands = cron_run(directory)
+        print '%-26s %10.1f ms and %d commands a run, plus the wait for cron' % ('cron', elapsed * 1e3, commands)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,70 @@
+'''Time Account.trigger_recurring catching up and keeping up.
+
+    $ python benchmarks/bench_recurring.py [recurring_items] [years]
+
+Defaults to 10k bills and paychecks, monthly, biweekly and yearly,
+caught up over 10 years in one call. Then it triggers once a day for a
+month, which with the heap only touches what is due; the scan it is
+compared against looks at every recurring item each time.
+'''
+import sys
+import time
+import datetime
+
+from common import best_of
+from budgetkeeper.budgetkeeper import Account, MONTHLY, BIWEEKLY, ANNUALLY
+from budgetkeeper.recurrence import occurrence
+
+START = datetime.datetime(2000, 1, 1)
+
+
+def make_account(count):
+    account = Account()
+    intervals = [MONTHLY, BIWEEKLY, ANNUALLY]
+    for i in xrange(count):
+        timestamp = START + datetime.timedelta(hours=i)
+        if i % 4 == 0:
+            account.add_paycheck(1000, description='Pay %d' % i, interval=intervals[i % 3], timestamp=timestamp)
+        else:
+            account.add_bill('%d.99' % (i % 100), description='Bill %d' % i, interval=intervals[i % 3], timestamp=timestamp)
+    return account
+
+
+def scan_due(items, progress, until):
+    '''Check every recurring item for anything due, the way a plain loop would.'''
+    due = []
+    for item in items:
+        n = progress.get(item, 1)
+        while occurrence(item.timestamp, item.interval, n) <= until:
+            due.append((occurrence(item.timestamp, item.interval, n), item))
+            n += 1
+        progress[item] = n
+    due.sort()
+    return due
+
+
+def main(count=10000, years=10):
+    account = make_account(count)
+    until = START + datetime.timedelta(days=365 * years)
+
+    start = time.time()
+    added = account.trigger_recurring(until)
+    elapsed = time.time() - start
+    assert account.balance == account.recompute_balance()
+
+    print '%d recurring items, %d years' % (count, years)
+    print '%-30s %12d' % ('occurrences added', added)
+    print '%-30s %12.1f s' % ('catch-up', elapsed)
+    print '%-30s %12.0f /s' % ('catch-up rate', added / elapsed)
+
+    items = [trans for trans in account.transactions[:count]]
+    progress = dict((item, account._schedule.next(item)) for item in items)
+    days = [until + datetime.timedelta(days=day) for day in range(1, 31)]
+    heap = best_of(lambda: [list(account._schedule.due(day)) for day in days], repeat=1) / len(days)
+    scan = best_of(lambda: [scan_due(items, progress, day) for day in days], repeat=1) / len(days)
+    print '%-30s %12.3f ms' % ('daily trigger, heap', heap * 1e3)
+    print '%-30s %12.3f ms' % ('daily trigger, scan', scan * 1e3)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,59 @@
+'''Time the NumPy reports against the same reports as Python loops.
+
+    $ python benchmarks/bench_reports.py [transactions]
+
+Defaults to 1M transactions. Copying the ledger into arrays is timed on
+its own, since it is paid once for any number of reports.
+'''
+import sys
+
+from common import best_of, make_account
+from budgetkeeper.reports import Report
+
+
+def loop_spending_by_month(transactions):
+    totals = {}
+    for trans in transactions:
+        if trans.direction < 0 and trans.category is not None:
+            month = trans.timestamp.date().replace(day=1)
+            months = totals.setdefault(trans.category, {})
+            months[month] = months.get(month, 0) + trans.amount
+    return totals
+
+
+def loop_top_descriptions(transactions, n=10):
+    totals = {}
+    for trans in transactions:
+        if trans.direction < 0:
+            totals[trans.description] = totals.get(trans.description, 0) + trans.amount
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:n]
+
+
+def loop_running_balance(transactions):
+    balance, balances = 0, []
+    for trans in sorted(transactions, key=lambda trans: trans.timestamp):
+        balance += trans.amount * trans.direction
+        balances.append(balance)
+    return balances
+
+
+def main(size=1000000):
+    account = make_account(size)
+    transactions = account.transactions
+    report = Report(transactions)
+    assert report.spending_by_month() == loop_spending_by_month(transactions)
+    assert report.running_balance()[1][-1] == loop_running_balance(transactions)[-1]
+
+    print '%d transactions' % size
+    print '%-22s %14s %14s' % ('', 'loop (ms)', 'numpy (ms)')
+    print '%-22s %14s %14.1f' % ('copy into arrays', '', best_of(lambda: Report(transactions), repeat=1) * 1e3)
+    for name, loop, vectorized in [
+            ('spending by month', loop_spending_by_month, report.spending_by_month),
+            ('top 10 descriptions', loop_top_descriptions, report.top_descriptions),
+            ('running balance', loop_running_balance, report.running_balance)]:
+        print '%-22s %14.1f %14.1f' % (name, best_of(lambda: loop(transactions), repeat=1) * 1e3,
+                                       best_of(vectorized) * 1e3)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
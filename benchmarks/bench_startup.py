@@ -0,0 +1,97 @@
+'''How long budget-keeper takes to start, each run in a fresh process.
+
+    $ python benchmarks/bench_startup.py [tree ...]
+
+Times imports of the main modules, the first read of a setting, and a
+whole command line run with IMAP turned off, against an empty ledger.
+Each is the best of several runs. Runs get their own empty XDG
+directories, and the files a run leaves in the config ones are counted.
+
+Give more than one source tree to compare them, e.g. against the last
+release checked out with git worktree:
+
+    $ git worktree add /tmp/before v1.0
+    $ python benchmarks/bench_startup.py /tmp/before .
+'''
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+
+RUNS = 10
+
+IMPORTS = [
+    ('import budgetkeeper', 'import budgetkeeper'),
+    ('import settings', 'from budgetkeeper import settings'),
+    ('first setting', 'from budgetkeeper import settings; settings.IMAP_PORT'),
+    ('import get_mail', 'import budgetkeeper.get_mail'),
+    ('import webui', 'import budgetkeeper.webui.webui'),
+]
+
+# Run in the child, so only the code under test is timed.
+TIMED = '''import time
+start = time.time()
+%s
+print time.time() - start
+'''
+
+# The command line run is timed from outside, interpreter start and all.
+CLI = None
+
+
+def environment(directory):
+    env = dict(os.environ)
+    for name in ('XDG_CONFIG_HOME', 'XDG_CONFIG_DIRS', 'XDG_DATA_HOME', 'XDG_DATA_DIRS'):
+        env[name] = os.path.join(directory, name.lower())
+        os.makedirs(env[name])
+    # A config turning IMAP off, so the command line run stays offline.
+    config = os.path.join(env['XDG_CONFIG_HOME'], 'budget-keeper')
+    os.makedirs(config)
+    with open(os.path.join(config, 'budget-keeper.conf'), 'w') as conf:
+        conf.write('[imap]\nenabled=no\n')
+    env['PYTHONPATH'] = '.'
+    return env
+
+
+def files_under(path):
+    return sum(len(files) for root, directories, files in os.walk(path))
+
+
+def best(tree, code):
+    '''Best seconds over RUNS fresh processes, and files left in the config directories.'''
+    times, files = [], 0
+    for i in range(RUNS):
+        directory = tempfile.mkdtemp()
+        try:
+            env = environment(directory)
+            before = files_under(env['XDG_CONFIG_DIRS']) + files_under(env['XDG_CONFIG_HOME'])
+            command = [sys.executable] + (['budgetkeeper/budgetkeeper.py'] if code is CLI else ['-c', code])
+            start = time.time()
+            process = subprocess.Popen(command, cwd=tree, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            out, err = process.communicate()
+            elapsed = time.time() - start
+            if process.returncode:
+                raise RuntimeError(err)
+            times.append(elapsed if code is CLI else float(out.split()[-1]))
+            files = files_under(env['XDG_CONFIG_DIRS']) + files_under(env['XDG_CONFIG_HOME']) - before
+        finally:
+            shutil.rmtree(directory)
+    return min(times), files
+
+
+def main(trees):
+    trees = [os.path.abspath(tree) for tree in trees]
+    print '%-20s' % '' + ''.join('%24s' % os.path.basename(tree) for tree in trees)
+    rows = [(name, TIMED % code) for name, code in IMPORTS] + [('command line run', CLI)]
+    for name, code in rows:
+        cells = []
+        for tree in trees:
+            seconds, files = best(tree, code)
+            cells.append('%10.1f ms %3d files' % (seconds * 1000, files))
+        print '%-20s' % name + ''.join('%24s' % cell for cell in cells)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or [os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)])
@@ -0,0 +1,103 @@
+'''Sync many tenants at once, against one after another.
+
+    $ python benchmarks/bench_tenants.py [tenants] [servers] [slow_delay_ms]
+
+Defaults to 1,000 tenants spread over 4 fake IMAP servers, with two new
+messages each. One server answers every command 10 ms late. Each run
+reports the wall time, and when the last tenant on a fast server was
+done, which the slow server shouldn't hold up.
+'''
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+import common  # puts budgetkeeper on the path
+from budgetkeeper import tenants as tenants_module
+from budgetkeeper.get_mail import MailConfig
+from budgetkeeper.tenants import ConnectionPool, Tenant, sync_tenant, sync_tenants
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'tests'))
+from fakeimap import FakeIMAPServer
+
+
+def deliver(count, servers):
+    for i in range(count):
+        email = 'user%d@example.com' % i
+        servers[i % len(servers)].add_message(email, 'Paid $%d for coffee' % (i % 10), user=email)
+        servers[i % len(servers)].add_message(email, 'Paid $%d for lunch' % (i % 20), user=email)
+
+
+def make_tenants(count, servers, directory):
+    '''Tenants starting from scratch, with ledgers under directory.'''
+    tenants = []
+    for i in range(count):
+        server = servers[i % len(servers)]
+        email = 'user%d@example.com' % i
+        tenants.append(Tenant('user%d' % i, MailConfig(email, 'secret', '127.0.0.1', server.port, False, False),
+                              os.path.join(directory, str(i))))
+    return tenants
+
+
+def timed(sync, finished):
+    def wrapper(tenant, *args, **kwargs):
+        result = sync(tenant, *args, **kwargs)
+        finished[tenant.name] = time.time()
+        return result
+    return wrapper
+
+
+def run(name, tenants, slow_port, sync_all):
+    finished = {}
+    tenants_module.sync_tenant = timed(sync_tenant, finished)
+    start = time.time()
+    sync_all()
+    elapsed = time.time() - start
+    tenants_module.sync_tenant = sync_tenant
+    fast = max(finished[t.name] for t in tenants if t.mail.port != slow_port) - start
+    print '%-34s %10.2f s %14.2f s' % (name, elapsed, fast)
+
+
+def serially(tenants):
+    '''One connection per tenant, one tenant at a time, like get_mail.'''
+    for tenant in tenants:
+        pool = ConnectionPool()
+        tenants_module.sync_tenant(tenant, pool)
+        pool.close()
+
+
+def main(count=1000, servers=4, slow_delay_ms=10):
+    fake = [FakeIMAPServer(delay=slow_delay_ms / 1000.0 if i == 0 else 0) for i in range(servers)]
+    for server in fake:
+        server.start()
+    directory = tempfile.mkdtemp()
+    try:
+        print '%d tenants on %d servers, one %d ms slower a command' % (count, servers, slow_delay_ms)
+        print '%-34s %12s %16s' % ('', 'all done', 'fast servers')
+        deliver(count, fake)
+        tenants = make_tenants(count, fake, os.path.join(directory, 'serial'))
+        run('one at a time, new connections', tenants, fake[0].port, lambda: serially(tenants))
+
+        tenants = make_tenants(count, fake, os.path.join(directory, 'pooled'))
+        pool = ConnectionPool(per_server=4)
+        run('concurrent, pooled', tenants, fake[0].port, lambda: sync_tenants(tenants, pool, workers=32))
+        run('again, nothing new', tenants, fake[0].port, lambda: sync_tenants(tenants, pool, workers=32))
+        print '%-34s %10d opened, %d reused' % ('connections', pool.opened, pool.reused)
+        pool.close()
+
+        # A server that allows a connection per tenant keeps them all logged in.
+        tenants = make_tenants(count, fake, os.path.join(directory, 'roomy'))
+        pool = ConnectionPool(per_server=count // servers + 1)
+        run('concurrent, a connection each', tenants, fake[0].port, lambda: sync_tenants(tenants, pool, workers=32))
+        run('again, nothing new', tenants, fake[0].port, lambda: sync_tenants(tenants, pool, workers=32))
+        print '%-34s %10d opened, %d reused' % ('connections', pool.opened, pool.reused)
+        pool.close()
+    finally:
+        for server in fake:
+            server.stop()
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,87 @@
+'''Time range queries, paging and late arrivals against the TimeIndex.
+
+    $ python benchmarks/bench_timeindex.py [transactions]
+
+Defaults to 1M transactions a minute apart, with one in fifty turning
+up late, so the ledger is mostly but not quite in time order. Each
+query is timed against the plain loop over the ledger it replaces.
+'''
+import sys
+import random
+import bisect
+import datetime
+
+from common import best_of
+from budgetkeeper.timeindex import TimeIndex
+
+START = datetime.datetime(2010, 1, 1)
+
+
+class Trans(object):
+    __slots__ = ('timestamp',)
+
+    def __init__(self, timestamp):
+        self.timestamp = timestamp
+
+
+def make_ledger(size, seed=0):
+    '''Transactions in the order they'd arrive, some a few days late.'''
+    rand = random.Random(seed)
+    ledger = []
+    for i in xrange(size):
+        minutes = i - rand.randint(0, 60 * 24 * 5) if i % 50 == 0 else i
+        ledger.append(Trans(START + datetime.timedelta(minutes=minutes)))
+    return ledger
+
+
+def scan(ledger, start, end):
+    return [trans for trans in ledger if start <= trans.timestamp < end]
+
+
+def main(size=1000000):
+    ledger = make_ledger(size)
+    index = best_of(lambda: TimeIndex(ledger), repeat=1)
+    timeline = TimeIndex(ledger)
+    print '%d transactions' % size
+    print '%-34s %12.3f s' % ('build index', index)
+
+    # A week, somewhere in the middle.
+    start = START + datetime.timedelta(minutes=size // 2)
+    end = start + datetime.timedelta(days=7)
+    assert set(timeline.range(start, end)) == set(scan(ledger, start, end))
+    print '%-34s %12.3f ms' % ('week range, index', best_of(lambda: list(timeline.range(start, end)), 10) * 1e3)
+    print '%-34s %12.3f ms' % ('week range, scan', best_of(lambda: scan(ledger, start, end)) * 1e3)
+
+    # Page 500 of 50, newest first: the cursor against an offset
+    # into a sorted copy of the ledger, which has to be kept sorted.
+    cursor = None
+    for page in xrange(499):
+        cursor = timeline.page(cursor, 50, reverse=True)[1]
+    ordered = sorted(ledger, key=lambda t: t.timestamp, reverse=True)
+    print '%-34s %12.3f ms' % ('page 500, cursor', best_of(lambda: timeline.page(cursor, 50, reverse=True), 100) * 1e3)
+    print '%-34s %12.3f ms' % ('page 500, filter and sort', best_of(
+        lambda: sorted(ledger, key=lambda t: t.timestamp, reverse=True)[499 * 50:500 * 50]) * 1e3)
+
+    # Late arrivals, from anywhere in the ledger's history.
+    rand = random.Random(1)
+    late = [Trans(START + datetime.timedelta(minutes=rand.randint(0, size))) for i in xrange(1000)]
+
+    def add_indexed():
+        for trans in late:
+            timeline.add(trans)
+        for trans in late:
+            timeline.remove(trans)
+
+    def insort_flat():
+        for trans in late:
+            bisect.insort(keys, trans.timestamp)
+        del keys[:]
+
+    print '%-34s %12.3f us' % ('late add and remove, index', best_of(add_indexed) / len(late) * 1e6)
+    keys = [trans.timestamp for trans in ordered[::-1]]
+    print '%-34s %12.3f us' % ('late insert, one sorted list', best_of(insort_flat, repeat=1) / len(late) * 1e6)
+    print '%-34s %12.3f ms' % ('late insert, re-sort', best_of(
+        lambda: ordered.sort(key=lambda t: t.timestamp), repeat=1) * 1e3)
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
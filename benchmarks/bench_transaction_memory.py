@@ -0,0 +1,44 @@
+'''Bytes per transaction in a big ledger, before and after slots.
+
+    $ python benchmarks/bench_transaction_memory.py [transactions]
+
+Defaults to 1M transactions. Counts each object's own size and its
+__dict__ if it has one, plus the amount and timestamp objects, which
+every transaction owns. Strings are mostly shared, so aren't counted.
+'''
+import sys
+
+from common import make_account
+
+
+class LegacyPurchase(object):
+    '''Purchase as it was, with a __dict__.'''
+    direction = -1
+    def __init__(self, amount=0, description="", timestamp=None, category=None):
+        self.timestamp = timestamp
+        self.amount = amount
+        self.description = description
+        self.category = category
+
+
+def size_of(trans):
+    size = sys.getsizeof(trans) + sys.getsizeof(trans.amount) + sys.getsizeof(trans.timestamp)
+    if hasattr(trans, '__dict__'):
+        size += sys.getsizeof(trans.__dict__)
+    return size
+
+
+def main(size=1000000):
+    account = make_account(size)
+    slotted = sum(size_of(trans) for trans in account.transactions)
+    legacy = sum(size_of(LegacyPurchase(trans.amount, trans.description, trans.timestamp, trans.category))
+                 for trans in account.transactions)
+    ledger = sys.getsizeof(account.transactions)
+
+    print '%d transactions' % size
+    print '%-24s %10.1f bytes/transaction' % ('with __dict__', float(legacy + ledger) / size)
+    print '%-24s %10.1f bytes/transaction' % ('with __slots__', float(slotted + ledger) / size)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,88 @@
+'''Load test the web UI: requests per second and p99 latency per endpoint.
+
+    $ python benchmarks/bench_webui.py [transactions] [seconds] [concurrency]
+
+Starts the app in a child process on a local port, serving an account
+on disk with 100k transactions by default, and hammers each endpoint
+for a few seconds. /legacy-balance opens the account on every request,
+the way the handlers used to, for comparison.
+'''
+import os
+import sys
+import time
+import shutil
+import tempfile
+import multiprocessing
+
+from common import make_account
+from budgetkeeper.budgetkeeper import Account
+from budgetkeeper.webui.webui import AccountHandler, make_app
+
+import tornado.gen
+import tornado.ioloop
+import tornado.web
+from tornado.httpclient import AsyncHTTPClient
+
+PORT = 8899
+PATHS = ['/balance', '/budgets', '/', '/transactions?start=2010-02-01&end=2010-02-08&limit=50', '/legacy-balance']
+
+
+class LegacyBalanceView(AccountHandler):
+    def get(self):
+        self.write(str(Account(self.settings['ledger_path']).balance))
+
+
+def serve(path, ready):
+    account = Account(path)
+    app = make_app(account)
+    app.settings['ledger_path'] = path
+    app.add_handlers('.*', [(r'/legacy-balance', LegacyBalanceView,
+                             {'account': account, 'executor': None, 'cache': {}})])
+    app.listen(PORT, '127.0.0.1')
+    ready.set()
+    tornado.ioloop.IOLoop.current().start()
+
+
+@tornado.gen.coroutine
+def hammer(path, seconds, concurrency):
+    client = AsyncHTTPClient(max_clients=concurrency)
+    latencies = []
+    deadline = time.time() + seconds
+
+    @tornado.gen.coroutine
+    def worker():
+        while time.time() < deadline:
+            start = time.time()
+            response = yield client.fetch('http://127.0.0.1:%d%s' % (PORT, path), raise_error=False)
+            assert response.code == 200, response
+            latencies.append(time.time() - start)
+
+    yield [worker() for i in range(concurrency)]
+    raise tornado.gen.Return(latencies)
+
+
+def main(size=100000, seconds=3, concurrency=10):
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'ledger.db')
+    make_account(size, path=path).close()
+
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(target=serve, args=(path, ready))
+    server.start()
+    ready.wait()
+    try:
+        print '%d transactions, %d concurrent clients, %ds per endpoint' % (size, concurrency, seconds)
+        print '%-38s %10s %10s %10s' % ('', 'req/s', 'p50 ms', 'p99 ms')
+        loop = tornado.ioloop.IOLoop.current()
+        for endpoint in PATHS:
+            latencies = sorted(loop.run_sync(lambda: hammer(endpoint, seconds, concurrency), timeout=seconds * 20))
+            print '%-38s %10.0f %10.2f %10.2f' % (endpoint, len(latencies) / float(seconds),
+                                                  latencies[len(latencies) // 2] * 1e3,
+                                                  latencies[int(len(latencies) * 0.99)] * 1e3)
+    finally:
+        server.terminate()
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
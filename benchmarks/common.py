@@ -0,0 +1,87 @@
+'''Helpers shared by the benchmark scripts.
+
+Each script in this directory can be run on its own, e.g.:
+
+    $ python benchmarks/bench_balance.py
+'''
+import os
+import sys
+import timeit
+import random
+import datetime
+import itertools
+
+from decimal import Decimal
+
+# Make the budgetkeeper package importable without installing it.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from budgetkeeper.budgetkeeper import Account, Income, Purchase, MONTHLY
+
+
+def best_of(func, number=1, repeat=3):
+    '''Seconds per call of func, taking the best of a few runs.'''
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / float(number)
+
+
+def make_transactions(size, names=(), seed=0):
+    '''Yield `size` transactions a minute apart from 2010: mostly purchases
+    filed under names, with an income every twentieth.'''
+    rand = random.Random(seed)
+    start = datetime.datetime(2010, 1, 1)
+    for i in xrange(size):
+        timestamp = start + datetime.timedelta(minutes=i)
+        if i % 20 == 0:
+            yield Income(amount=Decimal(rand.randint(100, 5000)), timestamp=timestamp)
+        else:
+            amount = Decimal('%d.%02d' % (rand.randint(0, 200), rand.randint(0, 99)))
+            yield Purchase(amount=amount, timestamp=timestamp,
+                           category=rand.choice(names) if names else None)
+
+
+def make_account(size, budgets=10, seed=0, path=None):
+    '''Build an Account holding `size` transactions spread over a few years.
+
+    Given a path, the account is kept on disk there.
+    '''
+    account = Account(path)
+    names = ['Budget%d' % i for i in range(budgets)]
+    for name in names:
+        account.add_budget(name, interval=MONTHLY)
+
+    # In batches, as parse_messages adds them, so a million doesn't take all day.
+    transactions = make_transactions(size, names, seed)
+    while True:
+        batch = list(itertools.islice(transactions, 10000))
+        if not batch:
+            break
+        account._extend(batch)
+    account.flush()
+    return account
+
+
+TEMPLATES = [
+    'Paid $%(money)s for %(budget)s.',
+    '%(money)s %(budget)s',
+    'Paid $%(money)s for some %(budget)s because I hunger.',
+    'Paid $%(money)s for %(budget)s and paid $%(more)s for %(other)s.',
+    'Paid $%(money)s for a book from the used bookstore.',
+    'Bought a new pair of pants for $%(money)s. Quite a steal.',
+    '[18:34] <joe> I bought a new widget today, was only $%(money)s',
+    'Bought candy and a band t-shirt for $%(money)s',
+]
+
+
+def make_messages(count, budgets=10, seed=0):
+    '''A list of `count` subjects in the shapes people actually send.'''
+    rand = random.Random(seed)
+    names = ['Budget%d' % i for i in range(budgets)] or ['stuff']
+    messages = []
+    for i in xrange(count):
+        messages.append(rand.choice(TEMPLATES) % {
+            'money': '%d.%02d' % (rand.randint(0, 200), rand.randint(0, 99)),
+            'more': rand.randint(1, 100),
+            'budget': rand.choice(names).lower(),
+            'other': rand.choice(names).lower(),
+        })
+    return messages
@@ -0,0 +1,174 @@
+'''The core benchmarks in one run, saved as a baseline or checked against one.
+
+    $ python benchmarks/suite.py [--scale 10k|100k|1M] [--repeat N]
+                                 [--save FILE] [--compare FILE] [--threshold PERCENT]
+
+Builds a ledger and a corpus of subjects of the given scale, 10k by
+default, and times the hot paths against them in operations per second:
+the balance, adding purchases, parsing messages, budget totals,
+Message.get_money and get_description, and the reprs the command line
+prints. Each case is the best of --repeat runs.
+
+--save writes the results out as JSON. --compare reads a saved run and
+flags every case that has got slower by more than --threshold percent,
+exiting 1 if any have. Baselines for this machine are in
+benchmarks/baselines; a different machine should save its own first.
+Nothing here needs the network.
+'''
+import sys
+import json
+import time
+import argparse
+import platform
+import datetime
+
+from common import make_account, make_messages
+from budgetkeeper.budgetkeeper import Message
+
+SCALES = {'10k': 10000, '100k': 100000, '1M': 1000000}
+
+# Cases that run once per message get at most this many, so the 1M
+# corpus doesn't take an hour a case.
+SAMPLE = 100000
+
+
+def rate(func, ops, repeat):
+    '''Best ops per second over repeat runs of func, which does ops operations.'''
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        func()
+        seconds = time.time() - start
+        best = seconds if best is None else min(best, seconds)
+    return ops / max(best, 1e-9)
+
+
+def cases(account, messages):
+    '''(name, func, ops) for each benchmark. Ones that add to the account come last.'''
+    sample = messages[:SAMPLE]
+    transactions = account.transactions[:SAMPLE]
+    now = datetime.datetime(2012, 6, 1)
+
+    def read_balance():
+        for i in xrange(10000):
+            account.balance
+
+    def budget_totals():
+        for i in xrange(100):
+            account.get_budget_totals()
+
+    def budget_totals_by_period():
+        for i in xrange(100):
+            account.get_budget_totals(timestamp=now)
+
+    def get_money():
+        for message in sample:
+            Message.get_money(message)
+
+    def get_description():
+        for message in sample:
+            Message.get_description(message)
+
+    def transaction_repr():
+        for trans in transactions:
+            repr(trans)
+
+    def summary_repr():
+        for i in xrange(10000):
+            str(account.balance)
+            repr(summary)
+
+    def add_purchase():
+        for i in xrange(10000):
+            account.add_purchase('4.50', description='Coffee', timestamp=now)
+
+    def parse_message():
+        for message in sample:
+            account.parse_message(message, now)
+
+    def parse_messages():
+        account.parse_messages(sample, now)
+
+    summary = account.parse_messages(messages[:100], now)
+    return [('balance', read_balance, 10000),
+            ('get_budget_totals', budget_totals, 100),
+            ('get_budget_totals_by_period', budget_totals_by_period, 100),
+            ('Message.get_money', get_money, len(sample)),
+            ('Message.get_description', get_description, len(sample)),
+            ('repr(transaction)', transaction_repr, len(transactions)),
+            ('CLI summary and balance', summary_repr, 10000),
+            ('add_purchase', add_purchase, 10000),
+            ('parse_message', parse_message, len(sample)),
+            ('parse_messages', parse_messages, len(sample))]
+
+
+def run(scale, repeat=5):
+    size = SCALES[scale]
+    start = time.time()
+    account = make_account(size)
+    messages = make_messages(size)
+    print >>sys.stderr, 'Built a %s ledger and corpus in %.1fs' % (scale, time.time() - start)
+
+    results = {}
+    for name, func, ops in cases(account, messages):
+        results[name] = rate(func, ops, repeat)
+        print >>sys.stderr, '%-30s %14.0f ops/s' % (name, results[name])
+    return {'scale': scale,
+            'repeat': repeat,
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'when': datetime.datetime.now().isoformat(),
+            'results': results}
+
+
+def compare(baseline, current, threshold):
+    '''Lines comparing two runs, and the names of cases slower by more than threshold percent.'''
+    lines = ['%-30s %14s %14s %8s' % ('case', 'baseline', 'now', 'change')]
+    regressions = []
+    for name in sorted(set(baseline['results']) | set(current['results'])):
+        old, new = baseline['results'].get(name), current['results'].get(name)
+        if old is None or new is None:
+            lines.append('%-30s %14s %14s %8s' % (name, old and '%.0f' % old or '-', new and '%.0f' % new or '-', ''))
+            continue
+        change = (new - old) / old * 100
+        flag = ''
+        if change < -threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        lines.append('%-30s %14.0f %14.0f %+7.1f%%%s' % (name, old, new, change, flag))
+    return lines, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the core benchmarks.')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='10k')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--save', metavar='FILE', help='write the results to FILE as JSON')
+    parser.add_argument('--compare', metavar='FILE', help='check the results against a saved run')
+    parser.add_argument('--threshold', type=float, default=20,
+                        help='percent slower that counts as a regression (default 20)')
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as saved:
+            baseline = json.load(saved)
+        if baseline['scale'] != args.scale:
+            parser.error('%s is a %s run, not %s' % (args.compare, baseline['scale'], args.scale))
+
+    current = run(args.scale, args.repeat)
+    if args.save:
+        with open(args.save, 'w') as out:
+            json.dump(current, out, indent=2, sort_keys=True, separators=(',', ': '))
+            out.write('\n')
+    if baseline is not None:
+        lines, regressions = compare(baseline, current, args.threshold)
+        print '\n'.join(lines)
+        if regressions:
+            print '%d regression(s) beyond %g%%: %s' % (len(regressions), args.threshold, ', '.join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
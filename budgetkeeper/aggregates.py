@@ -0,0 +1,156 @@
+'''Running spending totals per budget category, bucketed by day and month.
+
+Budgets only care about how much went out under their name during their
+current interval, so instead of walking the ledger every time we keep
+totals keyed by category and time bucket as purchases come in.
+'''
+import datetime
+from dateutil.relativedelta import relativedelta
+
+try:
+    from cDecimal import Decimal
+except ImportError:
+    from decimal import Decimal
+
+ONE_DAY = datetime.timedelta(days=1)
+
+
+def _months(interval):
+    return interval.years*12 + interval.months
+
+
+def period(interval, timestamp):
+    '''Get the (start, end) dates of the budget interval holding timestamp.
+
+    The end date is exclusive.
+
+    Month and year intervals line up with the calendar:
+    >>> period(relativedelta(months=1), datetime.datetime(2012, 2, 14, 9, 30))
+    (datetime.date(2012, 2, 1), datetime.date(2012, 3, 1))
+    >>> period(relativedelta(years=1), datetime.datetime(2012, 2, 14))
+    (datetime.date(2012, 1, 1), datetime.date(2013, 1, 1))
+
+    Day and week intervals are counted in whole days from 0001-01-01,
+    which was a Monday, so weekly budgets start on Mondays:
+    >>> period(relativedelta(days=1), datetime.datetime(2012, 2, 14, 9, 30))
+    (datetime.date(2012, 2, 14), datetime.date(2012, 2, 15))
+    >>> period(relativedelta(weeks=2), datetime.datetime(2012, 2, 14))
+    (datetime.date(2012, 2, 6), datetime.date(2012, 2, 20))
+
+    Budgets without an interval cover all time:
+    >>> period(None, datetime.datetime(2012, 2, 14))
+    (None, None)
+    '''
+    if interval is None:
+        return None, None
+
+    day = timestamp.date() if isinstance(timestamp, datetime.datetime) else timestamp
+    months = _months(interval)
+    if months and not interval.days:
+        index = day.year*12 + day.month - 1
+        index -= index % months
+        start = datetime.date(index // 12, index % 12 + 1, 1)
+        return start, start + relativedelta(months=months)
+    elif interval.days > 0 and not months:
+        ordinal = day.toordinal()
+        start = datetime.date.fromordinal(ordinal - (ordinal - 1) % interval.days)
+        return start, start + datetime.timedelta(days=interval.days)
+
+    raise ValueError("Can't split time into %r periods" % (interval,))
+
+
+class CategoryIndex(object):
+    '''Spending totals per category, overall and per day and month bucket.
+
+    >>> index = CategoryIndex()
+    >>> index.add('Groceries', datetime.datetime(2012, 1, 31), Decimal('10.00'))
+    >>> index.add('Groceries', datetime.datetime(2012, 2, 1), Decimal('4.50'))
+    >>> index.total('Groceries')
+    Decimal('14.50')
+    >>> index.total('Groceries', datetime.date(2012, 2, 1), datetime.date(2012, 3, 1))
+    Decimal('4.50')
+    >>> index.total('Booze')
+    Decimal('0')
+
+    Buckets are never changed once made. A change copies the ones it
+    touches and swaps the copies in, so frozen() can hand out the index
+    as it stands for the price of a reference, and it stays that way
+    however the original changes. Day buckets are filed by month, so
+    that's a month's worth of days copied, not years of them:
+    >>> frozen = index.frozen()
+    >>> index.add('Groceries', datetime.datetime(2012, 2, 2), Decimal('1.00'))
+    >>> frozen.total('Groceries'), index.total('Groceries')
+    (Decimal('14.50'), Decimal('15.50'))
+    '''
+    # A category with nothing spent: its total, month buckets and day buckets.
+    EMPTY = (0, {}, {})
+
+    def __init__(self):
+        # category -> (total, {(year, month): amount}, {(year, month): {day: amount}})
+        self._categories = {}
+
+    def add(self, category, timestamp, amount):
+        '''Add amount (negative to take it away) to category at timestamp.'''
+        self.update([(category, timestamp, amount)])
+
+    def update(self, entries):
+        '''Add a batch of (category, timestamp, amount) entries.
+
+        Entries landing in the same day are summed up before touching
+        the buckets, and each category's buckets are copied once.
+        '''
+        changes = {}
+        for category, timestamp, amount in entries:
+            day = timestamp.date() if isinstance(timestamp, datetime.datetime) else timestamp
+            days = changes.setdefault(category, {})
+            days[day] = days.get(day, 0) + amount
+        if not changes:
+            return
+
+        categories = dict(self._categories)
+        for category, days in changes.items():
+            total, months, months_days = categories.get(category, self.EMPTY)
+            months, months_days = dict(months), dict(months_days)
+            copied = set()
+            for day, amount in days.items():
+                month = (day.year, day.month)
+                if month not in copied:
+                    months_days[month] = dict(months_days.get(month, ()))
+                    copied.add(month)
+                total += amount
+                months[month] = months.get(month, 0) + amount
+                months_days[month][day] = months_days[month].get(day, 0) + amount
+            categories[category] = (total, months, months_days)
+        self._categories = categories
+
+    def frozen(self):
+        '''The index as it is now, unaffected by later changes.'''
+        index = CategoryIndex()
+        index._categories = self._categories
+        return index
+
+    def day(self, category, day):
+        '''What went out under category on day.'''
+        return self._categories.get(category, self.EMPTY)[2].get((day.year, day.month), {}).get(day, 0)
+
+    def total(self, category, start=None, end=None):
+        '''Sum of category between the start and (exclusive) end dates.
+
+        Whole months inside the range are read from the month buckets,
+        the ragged edges from the day buckets.
+        '''
+        overall, months, months_days = self._categories.get(category, self.EMPTY)
+        if start is None and end is None:
+            return Decimal(overall)
+
+        total = Decimal(0)
+        day = start
+        while day < end:
+            next_month = (day + relativedelta(months=1)).replace(day=1)
+            if day.day == 1 and next_month <= end:
+                total += months.get((day.year, day.month), 0)
+                day = next_month
+            else:
+                total += months_days.get((day.year, day.month), {}).get(day, 0)
+                day += ONE_DAY
+        return total
@@ -1,20 +1,87 @@
 
-import re
 import datetime
+import functools
+import itertools
+import operator
+import thread
 from dateutil.relativedelta import relativedelta
 
+from aggregates import CategoryIndex, period
+import parsing
+import parallel
+import parsecache
+import instrument
+import storage
+from matcher import BudgetMatcher
+from recurrence import Schedule, check_interval, count_between
+from timeindex import TimeIndex
+
 MONTHLY = relativedelta(months=1)
 BIWEEKLY = relativedelta(weeks=2)
 BIMONTHLY = BIWEEKLY # I never really did understand this, but whatever.
 DAILY = relativedelta(days=1)
 ANNUALLY = relativedelta(years=1)
 
+TICK = datetime.timedelta(microseconds=1)
+
 try:
     from cDecimal import Decimal
 except ImportError:
     from decimal import Decimal
 
 
+class WriteLock(object):
+    '''A lock the thread holding it can take again, like threading.RLock,
+    which on Python 2 is written in Python and costs a writer more than
+    a small write does.
+
+    >>> lock = WriteLock()
+    >>> with lock:
+    ...     with lock:
+    ...         lock.held()
+    True
+    >>> lock.held()
+    False
+    '''
+    __slots__ = ('_lock', '_owner', '_depth')
+
+    def __init__(self):
+        self._lock = thread.allocate_lock()
+        self._owner = None
+        self._depth = 0
+
+    def held(self):
+        '''Whether this thread holds the lock.'''
+        return self._owner == thread.get_ident()
+
+    def __enter__(self):
+        me = thread.get_ident()
+        if self._owner != me:
+            self._lock.acquire()
+            self._owner = me
+        self._depth += 1
+
+    def __exit__(self, *exc_info):
+        self._depth -= 1
+        if not self._depth:
+            self._owner = None
+            self._lock.release()
+
+
+def _writes(method):
+    '''Make an Account method one of the writers: it holds the account's
+    write lock throughout, and publishes a new Snapshot when it's done.'''
+    @functools.wraps(method)
+    def writes(self, *args, **kwargs):
+        with self._write_lock:
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                if self.version != self._snapshot.version:
+                    self._publish()
+    return writes
+
+
 class Account(object):
     '''Account contains transactions, which keep track of income and expenses.
 
@@ -51,41 +118,328 @@ class Account(object):
     >>> account.balance
     Decimal('995.88')
 
+    An account can also live on disk, see storage.Ledger.
+    Only the budgets and running totals are read when it is opened:
+    >>> import os, tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), 'ledger.db')
+    >>> account = Account(path)
+    >>> _ = account.add_budget('Groceries', interval=MONTHLY)
+    >>> _ = account.parse_message('Paid $14.57 for groceries.', timestamp=datetime.datetime(2012, 1, 1))
+    >>> account.close()
+    >>> account = Account(path)
+    >>> account.balance, account.get_budget_totals()
+    (Decimal('-14.57'), {'Groceries': Decimal('14.57')})
+
+    The transactions themselves are read the first time they're needed:
+    >>> account.transactions
+    [Purchase(amount=Decimal('14.57'), category='Groceries', description='', timestamp=datetime.datetime(2012, 1, 1, 0, 0))]
+
+    An account can be shared between threads, say the web UI's and one
+    taking in mail. Anything that changes it is a writer, and writers
+    take turns. Reading the balance and budget totals never waits for
+    them: those come from a Snapshot, which each write publishes once
+    it's done, and a big batch of mail publishes one per chunk as it
+    goes. Paging through transactions only waits while a writer files
+    a chunk into the timeline. Forecasts read the recurring schedule
+    that only writers touch, so they take their turn with the writers.
+    The transactions list itself belongs to the writer; walking it from
+    another thread may miss ones coming and going.
     '''
-    def __init__(self):
-        self.transactions = []
+    def __init__(self, path=None):
+        self._transactions = []
         self.budgets = []
 
-        # TODO: Load everything from disk
+        # Running total, kept up to date as transactions come and go.
+        self._balance = Decimal(0)
+
+        # Spending per budget category, bucketed by day and month.
+        self._spending = CategoryIndex()
+
+        # Budget names, for spotting them in message descriptions.
+        self._matcher = BudgetMatcher()
+
+        # How message templates parsed, see parsecache. None to not cache.
+        self.parse_cache = parsecache.ParseCache()
+
+        # Bumped on every change, so anything caching what it read
+        # from the account can tell when that has gone stale.
+        self.version = 0
+
+        # Recount the whole ledger on every balance read and complain
+        # if the running total has drifted. Slow, meant for debugging.
+        self.check_consistency = False
+
+        # Recurring bills and paychecks, by when they're next due.
+        # Built on the first trigger_recurring.
+        self._schedule = None
+
+        # Transactions in timestamp order, for range queries and
+        # paging. Built the first time one is asked for.
+        self._timeline = None
+
+        # One writer at a time, see _writes. A lock of its own guards
+        # the timeline, which writers reshuffle while readers page.
+        self._write_lock = WriteLock()
+        self._timeline_lock = thread.allocate_lock()
+
+        # Where the ledger is kept on disk, if anywhere.
+        self._store = None
+        if path is not None:
+            self._open(path)
+
+        # What readers see, until the next write is done.
+        self._snapshot = None
+        self._publish()
+
+    def _open(self, path):
+        self._store = storage.Ledger(path)
+        for name, interval, limit, description in self._store.budgets():
+            budget = Budget(name=name, interval=interval, limit=limit, description=description)
+            self.budgets.append(budget)
+            self._matcher.add(name, budget)
+        self._spending.update(self._store.spending())
+        self._balance = self._store.balance()
+        saved = self._store.meta('parse_cache')
+        if saved:
+            self.parse_cache = parsecache.ParseCache.load(saved, self._parse_fingerprint())
+        # Read lazily, see transactions.
+        self._transactions = None
+
+    @property
+    def transactions(self):
+        if self._transactions is None:
+            with self._write_lock:
+                if self._transactions is None:
+                    self.flush()
+                    self._transactions = self._store.transactions(TRANSACTION_KINDS)
+        return self._transactions
+
+    def iter_transactions(self):
+        '''Every transaction, in the order they were added.
+
+        If they haven't been read from disk yet they aren't all read in
+        at once, but the ones handed out can't be updated or removed.
+        '''
+        if self._transactions is not None:
+            return iter(self._transactions)
+        self.flush()
+        return self._store.iter_transactions(TRANSACTION_KINDS)
+
+    def snapshot(self):
+        '''The balance and budget totals as of the last finished write.'''
+        return self._snapshot
+
+    def _publish(self):
+        self._snapshot = Snapshot(self.version, self._balance, tuple(self.budgets), self._spending.frozen())
+
+    @_writes
+    def flush(self):
+        '''Write anything not yet saved out to disk.'''
+        if self._store is not None:
+            with instrument.timer('ledger.commit'):
+                self._store.commit(self._balance, self._spending)
+
+    def _saved(self):
+        '''Commit once enough changes have queued up.'''
+        if self._store.due():
+            self.flush()
+
+    @_writes
+    def close(self):
+        '''Flush and close the ledger on disk.'''
+        if self._store is not None:
+            if self.parse_cache is not None:
+                self._store.set_meta('parse_cache', self.parse_cache.dump(self._parse_fingerprint()))
+            self.flush()
+            self._store.close()
+            self._store = None
 
     @property
     def balance(self):
+        if self.check_consistency:
+            self.verify_balance()
+        return self._snapshot.balance
+
+    def recompute_balance(self):
+        '''Sum every transaction from scratch, ignoring the running total.'''
         total = sum([trans.amount*trans.direction for trans in self.transactions])
         return Decimal(total).quantize(Decimal('0.01'))
 
+    def verify_balance(self):
+        '''Check the running balance against a full recount of the ledger.
+
+        >>> account = Account()
+        >>> _ = account.add_income(100, timestamp=datetime.datetime(2012, 1, 1))
+        >>> account.verify_balance()
+        Decimal('100.00')
+
+        Editing a transaction behind the account's back is caught:
+        >>> account.transactions[0].amount = Decimal(50)
+        >>> account.verify_balance()
+        Traceback (most recent call last):
+        ...
+        ConsistencyError: Running balance 100.00 does not match recomputed balance 50.00
+        '''
+        expected = self.recompute_balance()
+        running = self._balance.quantize(Decimal('0.01'))
+        if running != expected:
+            raise ConsistencyError('Running balance %s does not match recomputed balance %s' % (running, expected))
+        return expected
+
+    def _apply(self, transactions, sign=1):
+        '''Fold transactions into (or, with sign=-1, out of) the running totals.'''
+        self.version += 1
+        self._balance += sum([trans.amount*trans.direction for trans in transactions])*sign
+        self._spending.update([(trans.category, trans.timestamp, trans.amount*sign)
+                               for trans in transactions
+                               if trans.direction < 0 and trans.category is not None])
+
+    def _add_transaction(self, trans):
+        return self._extend([trans])[0]
+
+    def _extend(self, transactions, track=True):
+        '''Add a batch of transactions, settling the running totals once.'''
+        if self._transactions is not None:
+            self._transactions.extend(transactions)
+        if self._timeline is not None:
+            with self._timeline_lock:
+                for trans in transactions:
+                    self._timeline.add(trans)
+        self._apply(transactions)
+        if self._store is not None:
+            self._store.add(transactions, track)
+            self._saved()
+        # Let readers see each batch as it goes in.
+        self._publish()
+        return transactions
+
+    @_writes
+    def add_transactions(self, transactions, chunk_size=10000):
+        '''Add transactions from any iterable, a chunk at a time, and return how many.
+
+        >>> account = Account()
+        >>> account.add_transactions(Purchase(amount) for amount in (Decimal(3), Decimal(2)))
+        2
+        >>> account.balance
+        Decimal('-5.00')
+
+        Into a ledger on disk whose transactions haven't been read yet,
+        they're written out without being kept, so memory stays flat
+        however many there are.
+        '''
+        # Until the transactions are read from disk, whoever asks for
+        # them gets fresh ones, so these needn't be remembered.
+        track = self._transactions is not None
+        count = 0
+        for chunk in parallel.chunked(transactions, chunk_size):
+            self._extend(chunk, track)
+            for trans in chunk:
+                if getattr(trans, 'interval', None) is not None:
+                    self._schedule_changed(trans)
+            count += len(chunk)
+        self.flush()
+        return count
+
+    @_writes
+    def remove_transaction(self, trans):
+        '''Take a transaction back out of the account.
+
+        >>> account = Account()
+        >>> coffee = account.add_purchase(4.12, description="Morning Coffee")
+        >>> account.balance
+        Decimal('-4.12')
+        >>> account.remove_transaction(coffee)
+        >>> account.balance
+        Decimal('0.00')
+        '''
+        self.transactions.remove(trans)
+        if self._timeline is not None:
+            with self._timeline_lock:
+                self._timeline.remove(trans)
+        self._apply([trans], -1)
+        self._schedule_changed(trans, removed=True)
+        if self._store is not None:
+            self._store.remove(trans)
+            self._saved()
+
+    @_writes
+    def update_transaction(self, trans, **changes):
+        '''Edit a transaction in place, keeping the balance in step.
+
+        >>> account = Account()
+        >>> coffee = account.add_purchase(4.12, description="Morning Coffee")
+        >>> account.update_transaction(coffee, amount=5) # doctest: +ELLIPSIS
+        Purchase(amount=Decimal('5.00'), ...)
+        >>> account.balance
+        Decimal('-5.00')
+        '''
+        for attrib in changes:
+            if not hasattr(trans, attrib):
+                raise AttributeError('%s has no attribute %r' % (trans.__class__.__name__, attrib))
+        if 'amount' in changes:
+            # Purchases are kept to the cent, however they came to be.
+            if type(trans) is Purchase:
+                changes['amount'] = self._purchase_amount(changes['amount'])
+            else:
+                changes['amount'] = Decimal(changes['amount'])
+        if ('interval' in changes or 'timestamp' in changes) and getattr(trans, 'interval', None) is not None:
+            interval = changes.get('interval', trans.interval)
+            if interval is not None:
+                check_interval(changes.get('timestamp', trans.timestamp), interval)
+
+        self._apply([trans], -1)
+        if self._store is not None:
+            self._store.before_update(trans)
+        for attrib, value in changes.items():
+            setattr(trans, attrib, value)
+        self._apply([trans])
+        if self._timeline is not None and 'timestamp' in changes:
+            with self._timeline_lock:
+                self._timeline.move(trans)
+        self._schedule_changed(trans)
+        if self._store is not None:
+            self._store.update(trans)
+            self._saved()
+        return trans
+
+    @_writes
     def add_income(self, amount, description="", timestamp=None, category=None):
         income = Income(amount=Decimal(amount), description=description, timestamp=timestamp, category=category)
-        self.transactions.append(income)
-        return income
+        return self._add_transaction(income)
 
+    @_writes
     def add_purchase(self, amount, description="", timestamp=None, category=None):
-        purchase = Purchase(amount=Decimal(amount).quantize(Decimal('0.01')),
-                            description=description,
-                            timestamp=timestamp,
-                            category=category)
-        self.transactions.append(purchase)
-        return purchase
+        return self._add_transaction(self._new_purchase(amount, description, timestamp, category))
 
+    @staticmethod
+    def _purchase_amount(amount):
+        return Decimal(amount).quantize(Decimal('0.01'))
+
+    def _new_purchase(self, amount, description="", timestamp=None, category=None):
+        return Purchase(amount=self._purchase_amount(amount),
+                        description=description,
+                        timestamp=timestamp,
+                        category=category)
+
+    @_writes
     def add_bill(self, amount, description="", timestamp=None, category=None, interval=None):
         bill = Bill(amount=Decimal(amount), description=description, timestamp=timestamp, category=category, interval=interval)
-        self.transactions.append(bill)
+        if interval is not None:
+            check_interval(bill.timestamp, interval)
+        self._add_transaction(bill)
+        self._schedule_changed(bill)
         return bill
 
+    @_writes
     def add_paycheck(self, amount, description="", timestamp=None, category=None, interval=None):
         paycheck = PayCheck(amount=Decimal(amount), description=description, timestamp=timestamp, category=category, interval=interval)
-        self.transactions.append(paycheck)
+        if interval is not None:
+            check_interval(paycheck.timestamp, interval)
+        self._add_transaction(paycheck)
+        self._schedule_changed(paycheck)
         return paycheck
 
+    @_writes
     def parse_message(self, message, timestamp=None):
         '''
         >>> account = Account()
@@ -124,40 +478,310 @@ class Account(object):
         >>> account.parse_message('Paid $14.57 for groceries and paid $50 for booze.') # doctest: +ELLIPSIS
         [Purchase(amount=Decimal('14.57'), category='Groceries', ...), Purchase(amount=Decimal('50.00'), category='Booze', ...)]
         '''
-        parts = message.split('and')
+        purchases = self._parse(message, timestamp)
+        if not purchases:
+            return
+
+        self._extend(purchases)
+        return purchases[0] if len(purchases) == 1 else purchases
+
+    def _parse(self, message, timestamp=None):
+        '''Turn a message into Purchases, without adding them to the account.
+
+        Messages that only differ by their amounts are parsed once:
+        >>> account = Account()
+        >>> _ = account.add_budget('Coffee')
+        >>> [account._parse('Paid $%s for coffee' % amount)[0].amount for amount in ('4.50', '3', '.99')]
+        [Decimal('4.50'), Decimal('3.00'), Decimal('0.99')]
+        >>> account.parse_cache.hits, account.parse_cache.misses
+        (2, 1)
+        '''
+        cache = self.parse_cache
+        key, amounts = parsecache.template(message) if cache is not None else (None, None)
+        if key is None:
+            return self._purchases(parsing.parse(message), timestamp)
+
+        entry = cache.get(key)
+        if entry is None:
+            clauses = parsing.parse(message)
+            entry = self._cache_entry(key, amounts, clauses)
+            cache.put(key, entry)
+            return self._purchases(clauses, timestamp)
+        if entry is False:
+            # Known not to work as a template.
+            return self._purchases(parsing.parse(message), timestamp)
+
         purchases = []
-        for message in parts:
-            amount = Message.get_money(message)
-            if not amount:
-                return
+        for amount, description, uses, budget, whole in entry:
+            if uses:
+                description = parsecache.render(description, uses, amounts)
+                budget, whole = self._matcher.find(description)
+            elif budget is not None:
+                budget = self.budgets[budget]
+            purchases.append(self._purchase(amounts[amount], description, budget, whole, timestamp))
+        return purchases
 
-            description = Message.get_description(message)
+    def _cache_entry(self, key, amounts, clauses):
+        '''What to cache for a template: a list of
+        [amount's position, description, stand-ins in it, budget's position, whole]
+        per clause, or False if the template can't stand in for the message.
+        '''
+        stand_ins = parsecache.stand_ins(key, len(amounts))
+        if stand_ins is None:
+            return False
+        stand_in = parsecache.fill(key, stand_ins)
+        if parsecache.template(stand_in)[0] != key:
+            return False
+
+        entry = []
+        for clause in parsing.parse(stand_in):
+            if clause.amount not in stand_ins:
+                return False
+            uses = [i for i, number in enumerate(stand_ins) if number in clause.description]
+            budget, whole = None, False
+            if not uses:
+                budget, whole = self._matcher.find(clause.description)
+                if budget is not None:
+                    budget = self.budgets.index(budget)
+            entry.append([stand_ins.index(clause.amount), clause.description, uses, budget, whole])
+
+        # Check it gives back just what parsing the message itself did.
+        expected = [(clause.amount, clause.description) for clause in clauses]
+        if [(amounts[amount], parsecache.render(description, uses, amounts))
+                for amount, description, uses, budget, whole in entry] != expected:
+            return False
+        return entry
 
-            purchase = None
+    def record_metrics(self):
+        '''Put the parse cache's hits and misses in with the instrument counters.'''
+        if self.parse_cache is not None:
+            instrument.count('parse_cache.hits', self.parse_cache.hits)
+            instrument.count('parse_cache.misses', self.parse_cache.misses)
 
+    def _parse_fingerprint(self):
+        return parsecache.fingerprint(budget.name for budget in self.budgets)
+
+    def _purchases(self, clauses, timestamp=None):
+        '''Turn parsed clauses into Purchases, filing them under budgets.'''
+        purchases = []
+        for clause in clauses:
             # Is any of our budget names in the description?
-            for budget in self.budgets:
-                # if description (minus nonletter characters) in categories:
-                category = re.sub(r'[^\w]*', '', description).lower()
-                if budget.name.lower() in category.lower():
-                    # Set the category instead of the description
-                    description = '' if budget.name.lower() == category.lower() else description
-                    purchase = self.add_purchase(amount, category=budget.name, timestamp=timestamp, description=description)
-                    break
-
-            purchases.append(purchase or self.add_purchase(amount, description, timestamp))
-        return purchases[0] if len(purchases) == 1 else purchases
+            budget, whole = self._matcher.find(clause.description)
+            purchases.append(self._purchase(clause.amount, clause.description, budget, whole, timestamp))
+        return purchases
+
+    def _purchase(self, amount, description, budget, whole, timestamp):
+        if budget:
+            # Set the category instead of the description
+            description = '' if whole else description
+            return self._new_purchase(amount, category=budget.name, timestamp=timestamp, description=description)
+        return self._new_purchase(amount, description, timestamp)
+
+    @_writes
+    def parse_messages(self, messages, timestamp=None, chunk_size=1000, workers=1):
+        '''Parse a stream of messages, adding their purchases a chunk at a time.
+
+        Messages can be plain strings or (message, timestamp) pairs, and
+        can come from a generator; only one chunk is held at once.
+        Rather than every purchase, you get a summary back:
+        >>> account = Account()
+        >>> _ = account.add_budget('Groceries')
+        >>> account.parse_messages(['Paid $14.57 for groceries.', 'Lunch with Bob', '$3 coffee and $2 donut'])
+        IngestSummary(failures=1, messages=3, total=Decimal('19.57'), transactions=3)
+        >>> account.get_budget_totals()
+        {'Groceries': Decimal('14.57')}
+
+        For big backfills, workers > 1 parses the chunks in that many
+        processes. Purchases still go into the ledger in message order.
+        '''
+        summary = IngestSummary()
+        chunks = parallel.chunked(self._timestamped(messages, timestamp), chunk_size)
+        for chunk, parsed in self._parse_chunks(chunks, workers):
+            purchases = []
+            for found in parsed:
+                if not found:
+                    summary.failures += 1
+                purchases.extend(found)
+
+            with instrument.timer('ledger.add'):
+                self._extend(purchases)
+            summary.add(len(chunk), purchases)
+        self.flush()
+        instrument.count('messages', summary.messages)
+        instrument.count('messages.failed', summary.failures)
+        instrument.count('transactions', summary.transactions)
+        return summary
+
+    def _parse_chunks(self, chunks, workers):
+        '''Yield (chunk, the Purchases from each message in it).'''
+        # Parsing and matching budgets are timed together, a chunk at a
+        # time; timing every message would cost more than the matching.
+        if workers <= 1:
+            # In process, where the parse cache can help.
+            for chunk in chunks:
+                with instrument.timer('parse'):
+                    parsed = [self._parse(message, when) for message, when in chunk]
+                yield chunk, parsed
+            return
+        for chunk, parsed in parallel.parse_chunks(chunks, workers, text=operator.itemgetter(0)):
+            # The regexes ran in the workers; this is just the matching.
+            with instrument.timer('parse.match'):
+                parsed = [self._purchases(clauses, when) for (message, when), clauses in itertools.izip(chunk, parsed)]
+            yield chunk, parsed
+
+    @staticmethod
+    def _timestamped(messages, timestamp=None):
+        '''Yield (message, timestamp) pairs, filling in timestamp where missing.'''
+        for message in messages:
+            if isinstance(message, tuple):
+                yield message
+            else:
+                yield message, timestamp
+
+    @_writes
+    def trigger_recurring(self, timestamp=None, batch_size=1000):
+        '''Add every repeat of a bill or paycheck that has come due by timestamp.
+
+        Each repeat is a plain Purchase or Income. Returns how many were added.
+        >>> account = Account()
+        >>> _ = account.add_bill(50, description="Internet", interval=MONTHLY, timestamp=datetime.datetime(2012, 1, 15))
+        >>> account.trigger_recurring(datetime.datetime(2012, 3, 31))
+        2
+        >>> account.transactions[-1]
+        Purchase(amount=Decimal('50'), category=None, description='Internet', timestamp=datetime.datetime(2012, 3, 15, 0, 0))
+        >>> account.balance
+        Decimal('-150.00')
+
+        Catching up after a long time away adds batch_size at a time,
+        so the running totals and the disk see a few big writes.
+        '''
+        if timestamp is None:
+            timestamp = datetime.datetime.now()
+        schedule = self._recurring()
+
+        added, batch, touched = 0, [], set()
+        for when, item in schedule.due(timestamp):
+            batch.append(item.recurs_as(amount=item.amount, description=item.description,
+                                        timestamp=when, category=item.category))
+            touched.add(item)
+            if len(batch) >= batch_size:
+                added += self._add_recurrences(batch, touched)
+                batch, touched = [], set()
+        if batch:
+            added += self._add_recurrences(batch, touched)
+        self.flush()
+        return added
+
+    def _add_recurrences(self, batch, touched):
+        self._extend(batch)
+        if self._store is not None:
+            self._store.save_progress([(item, self._schedule.next(item)) for item in touched])
+        return len(batch)
 
-    def trigger_recurring(self, timestamp=None):
-        '''Trigger all recurring transactions.'''
-        pass
+    def _recurring(self):
+        '''The Schedule of recurring transactions, built the first time it's needed.'''
+        if self._schedule is None:
+            progress = self._store.progress() if self._store is not None else {}
+            schedule = Schedule()
+            for trans in self.transactions:
+                if getattr(trans, 'interval', None) is not None:
+                    n = progress.get(self._store.id(trans), 1) if progress else 1
+                    schedule.add(trans, n)
+            self._schedule = schedule
+        return self._schedule
+
+    def _schedule_changed(self, trans, removed=False):
+        '''Keep the schedule, if there is one yet, in step with trans.'''
+        if self._schedule is None:
+            return
+        if removed or getattr(trans, 'interval', None) is None:
+            self._schedule.remove(trans)
+        else:
+            self._schedule.add(trans, self._schedule.next(trans) if trans in self._schedule else 1)
+
+    def _time_index(self):
+        '''The TimeIndex of every transaction, built the first time it's needed.'''
+        if self._timeline is None:
+            # Built by a writer, so none of the transactions go missing.
+            with self._write_lock:
+                if self._timeline is None:
+                    self._timeline = TimeIndex(self.transactions)
+        return self._timeline
+
+    def transactions_between(self, start=None, end=None, kind=None):
+        '''Transactions from start up to, but not including, end, oldest first.
+
+        >>> account = Account()
+        >>> _ = account.add_purchase(5, timestamp=datetime.datetime(2012, 3, 9))
+        >>> _ = account.add_purchase(7, timestamp=datetime.datetime(2012, 4, 1))
+        >>> _ = account.add_income(9, timestamp=datetime.datetime(2012, 3, 2))
+        >>> [trans.amount for trans in account.transactions_between(datetime.datetime(2012, 3, 1), datetime.datetime(2012, 4, 1))]
+        [Decimal('9'), Decimal('5.00')]
+        >>> [trans.amount for trans in account.transactions_between(datetime.datetime(2012, 3, 1), kind=Purchase)]
+        [Decimal('5.00'), Decimal('7.00')]
+        '''
+        index = self._time_index()
+        with self._timeline_lock:
+            transactions = index.range(start, end)
+            if kind is not None:
+                return [trans for trans in transactions if isinstance(trans, kind)]
+            return list(transactions)
+
+    def page_transactions(self, cursor=None, limit=50, start=None, end=None, newest_first=True):
+        '''A page of transactions, and the cursor for the page after it.
+
+        Pages pick up from the cursor rather than an offset, so they
+        don't shift about as transactions come in. The cursor is None
+        on the last page.
+        >>> account = Account()
+        >>> for day in (1, 2, 3):
+        ...     _ = account.add_income(day, timestamp=datetime.datetime(2012, 1, day))
+        >>> page, cursor = account.page_transactions(limit=2)
+        >>> [trans.amount for trans in page]
+        [Decimal('3'), Decimal('2')]
+        >>> page, cursor = account.page_transactions(cursor, limit=2)
+        >>> [trans.amount for trans in page], cursor
+        ([Decimal('1')], None)
+        '''
+        index = self._time_index()
+        with self._timeline_lock:
+            return index.page(cursor, limit, start, end, reverse=newest_first)
 
+    @_writes
     def add_budget(self, name, interval=None, limit=100, description=""):
         budget = Budget(name=name, interval=interval, limit=Decimal(limit), description=description)
         self.budgets.append(budget)
+        self._matcher.add(name, budget)
+        if self.parse_cache is not None:
+            # Cached templates may have missed the new budget.
+            self.parse_cache.clear()
+        self.version += 1
+        if self._store is not None:
+            self._store.add_budget(budget)
+            self._saved()
         return budget
 
-    def get_budget_totals(self):
+    def get_budget(self, name):
+        '''Get the budget called name, or None.'''
+        return self._snapshot.get_budget(name)
+
+    def get_budget_total(self, name, timestamp=None):
+        '''Get how much has been spent under a budget.
+
+        Without a timestamp this is everything ever spent in the category,
+        otherwise it's just the budget's interval holding the timestamp.
+        >>> account = Account()
+        >>> budget = account.add_budget('Groceries', interval=MONTHLY)
+        >>> _ = account.add_purchase(10, category='Groceries', timestamp=datetime.datetime(2012, 1, 31))
+        >>> _ = account.add_purchase(20, category='Groceries', timestamp=datetime.datetime(2012, 2, 1))
+        >>> account.get_budget_total('Groceries')
+        Decimal('30.00')
+        >>> account.get_budget_total('Groceries', timestamp=datetime.datetime(2012, 2, 14))
+        Decimal('20.00')
+        '''
+        return self._snapshot.get_budget_total(name, timestamp)
+
+    def get_budget_totals(self, timestamp=None):
         '''Get a dict of totals for all budgets.
         >>> account = Account()
         >>> budget = account.add_budget('Thing')
@@ -165,20 +789,110 @@ class Account(object):
         Purchase(amount=Decimal('100.00'), category='Thing', description='Morning Coffee', timestamp=datetime.datetime(2012, 1, 1, 0, 0))
         >>> account.get_budget_totals()
         {'Thing': Decimal('100.00')}
+
+        Pass a timestamp to only count each budget's current interval.
         '''
-        totals = {}
-        for budget in self.budgets:
-            totals[budget.name] = 0
-            for purchase in self.transactions:
-                if purchase.direction < 0: # If its direction says its a debit
-                    if purchase.category == budget.name:
-                        totals[budget.name] += purchase.amount
-            totals[budget.name] = totals[budget.name].quantize(Decimal('0.01'))
-        return totals
+        return self._snapshot.get_budget_totals(timestamp)
+
+    def forecast_balance(self, timestamp):
+        '''What the balance will be at timestamp, once bills and paychecks recur.
+
+        Repeats not added yet are counted, not generated, so looking
+        decades ahead costs the same as looking a week ahead.
+        >>> account = Account()
+        >>> _ = account.add_paycheck(1000, interval=MONTHLY, timestamp=datetime.datetime(2012, 1, 1))
+        >>> _ = account.add_bill(200, interval=BIWEEKLY, timestamp=datetime.datetime(2012, 1, 1))
+        >>> account.forecast_balance(datetime.datetime(2042, 1, 1))
+        Decimal('204400.00')
+        >>> account.trigger_recurring(datetime.datetime(2042, 1, 1))
+        1142
+        >>> account.balance
+        Decimal('204400.00')
+        '''
+        with self._write_lock:
+            return (self._balance + self._coming(self._recurring().items(), timestamp)).quantize(Decimal('0.01'))
+
+    def _coming(self, recurring, until, after=datetime.datetime.min):
+        '''Net money from recurring (item, next repeat) pairs that falls after after, up to until.'''
+        total = Decimal(0)
+        for item, n in recurring:
+            count = count_between(item.timestamp, item.interval, after, until, n)
+            if count:
+                total += item.amount * item.direction * count
+        return total
+
+    def forecast(self, timestamps):
+        '''Yield (timestamp, forecast balance) for each of a rising series of timestamps.
+
+        Each step only counts the repeats since the last, and nothing
+        is kept, so a long series of dates takes no extra memory.
+        >>> account = Account()
+        >>> _ = account.add_bill(100, interval=MONTHLY, timestamp=datetime.datetime(2012, 1, 1))
+        >>> [balance for when, balance in account.forecast(datetime.datetime(2012, month, 15) for month in (1, 6, 12))]
+        [Decimal('-100.00'), Decimal('-600.00'), Decimal('-1200.00')]
+        '''
+        # Taken in one go, rather than holding up writers between steps.
+        with self._write_lock:
+            balance, recurring = self._balance, list(self._recurring().items())
+        last = datetime.datetime.min
+        for timestamp in timestamps:
+            balance += self._coming(recurring, timestamp, last)
+            last = timestamp
+            yield timestamp, balance.quantize(Decimal('0.01'))
+
+    def forecast_budget(self, name, timestamp=None):
+        '''How a budget's interval around timestamp (default now) is shaping up.
+
+        Bills filed under the budget that will recur before the
+        interval ends are counted as already spent:
+        >>> account = Account()
+        >>> _ = account.add_budget('Utilities', interval=MONTHLY, limit=150)
+        >>> _ = account.add_bill(60, category='Utilities', interval=BIWEEKLY, timestamp=datetime.datetime(2012, 1, 2))
+        >>> forecast = account.forecast_budget('Utilities', datetime.datetime(2012, 1, 10))
+        >>> forecast.spent, forecast.scheduled, forecast.over
+        (Decimal('60.00'), Decimal('120.00'), True)
+
+        There's no forecast for a budget the account doesn't have:
+        >>> account.forecast_budget('Rent')
+        Traceback (most recent call last):
+        ...
+        KeyError: "No budget called 'Rent'"
+        '''
+        if timestamp is None:
+            timestamp = datetime.datetime.now()
+        with self._write_lock:
+            budget = self.get_budget(name)
+            if budget is None:
+                raise KeyError('No budget called %r' % (name,))
+            start, end = period(budget.interval, timestamp)
+            spent = self._spending.total(name, start, end)
+
+            scheduled = Decimal(0)
+            if end is not None:
+                # Count repeats in [start, end), i.e. after the instant before start.
+                after = datetime.datetime.combine(start, datetime.time()) - TICK
+                until = datetime.datetime.combine(end, datetime.time()) - TICK
+                for item, n in self._recurring().items():
+                    if item.direction < 0 and item.category == name:
+                        scheduled += item.amount * count_between(item.timestamp, item.interval, after, until, n)
+        return BudgetForecast(budget, start, end, spent, scheduled)
+
+    def forecast_budgets(self, timestamp=None):
+        '''forecast_budget for every budget, by name.'''
+        with self._write_lock:
+            return dict((budget.name, self.forecast_budget(budget.name, timestamp)) for budget in self.budgets)
+
+    def report(self):
+        '''A reports.Report over every transaction. Needs NumPy.'''
+        from reports import Report
+        return Report(self.transactions)
+
+class ConsistencyError(Exception):
+    '''Raised when the running totals disagree with the ledger itself.'''
+
 
 class Message(object):
-    money = r'\$?(\d*(\.\d\d?)?|\d+)'
-    only_money = re.compile(r'^%s.*$' % money)
+    money = parsing.MONEY
 
     @staticmethod
     def get_money(message):
@@ -190,10 +904,7 @@ class Message(object):
         >>> Message.get_money("[18:34] <joe> I bought a new widget today, was only $0.99.")
         '0.99'
         '''
-        for word in message.split(' '):
-            result = Message.only_money.findall(word)[0][0]
-            if result:
-                return result
+        return parsing.get_money(message)
 
     @staticmethod
     def get_description(message):
@@ -217,44 +928,118 @@ class Message(object):
         >>> Message.get_description("[18:34] <joe> I bought a new widget today, was only $0.99")
         '[18:34] <joe> I bought a new widget today, was only $0.99'
         '''
-        # TODO: pyparsing may be the way to go here.
-
-        # Try to match the well behaved version first:
-        description = re.match(r'(?:paid )?(?:bought )?(?P<first_desc>.*) for (?P<description>.*)', message.lower(), flags=re.IGNORECASE)
-        if description:
-            # If the first part of the description is actually money,
-            # Then use this well behaved version, if it's actually more
-            # description, move on to the extended description version.
-            first_desc_is_money = Message.get_money(description.group('first_desc'))
-            if description.group('description') and first_desc_is_money:
-                return description.group('description').capitalize()
-
-        # Try getting the extended description version:
-        # Remove the money from the message.
-        money = Message.get_money(message)
-        if not money:
-            # Couldn't get a money from the message
-            return
-
-        regex = r"( ?\$?(%s)[ ]?)" % re.escape(money)
-        msg = re.sub(regex, '', message, count=1)
-
-        # Now grab all the parts of our description.
-        ext_desc = r'bought (?P<description>.*) for[ ]?(?P<more_description>.*)'
-        extended_desc = re.match(ext_desc, msg, flags=re.IGNORECASE)
-        if extended_desc:
-            if extended_desc.group('description') or extended_desc.group('more_description'):
-                return (extended_desc.group('description').capitalize() + extended_desc.group('more_description'))
-
-        # Nothing matched, just return the whole thing.
-        return message
+        return parsing.get_description(message)
 
 
 class ReprableClass(object):
+    __slots__ = ()
+
     def __repr__(self):
-        kwargs = ', '.join(['%s=%r' % (attrib, getattr(self, attrib)) for attrib in sorted(vars(self).keys())])
+        kwargs = ', '.join(['%s=%r' % (attrib, getattr(self, attrib)) for attrib in self._fields()])
         return "%s(%s)" % (self.__class__.__name__, kwargs)
 
+    def _fields(self):
+        '''Attribute names to show, sorted: every slot, plus anything in __dict__.'''
+        cls = self.__class__
+        fields = cls.__dict__.get('_slot_fields')
+        if fields is None:
+            fields = set()
+            for klass in cls.__mro__:
+                fields.update(klass.__dict__.get('__slots__', ()))
+            fields = cls._slot_fields = tuple(sorted(fields))
+        if hasattr(self, '__dict__'):
+            return sorted(set(fields).union(vars(self)))
+        return fields
+
+class BudgetForecast(ReprableClass):
+    '''Spending under a budget for one interval: so far, and still to come.'''
+    def __init__(self, budget, start, end, spent, scheduled):
+        self.name = budget.name
+        self.limit = budget.limit
+        self.start = start
+        self.end = end
+        self.spent = spent.quantize(Decimal('0.01'))
+        self.scheduled = scheduled.quantize(Decimal('0.01'))
+
+    @property
+    def projected(self):
+        return self.spent + self.scheduled
+
+    @property
+    def over(self):
+        '''Whether the interval is on course to go over the limit.'''
+        return self.projected > self.limit
+
+class IngestSummary(ReprableClass):
+    '''What came of parsing a batch of messages.'''
+    def __init__(self):
+        self.messages = 0
+        self.transactions = 0
+        self.failures = 0
+        self.total = Decimal('0.00')
+
+    def add(self, messages, transactions):
+        self.messages += messages
+        self.transactions += len(transactions)
+        self.total += sum([trans.amount for trans in transactions])
+
+    def merge(self, other):
+        '''Fold another summary into this one.'''
+        self.messages += other.messages
+        self.transactions += other.transactions
+        self.failures += other.failures
+        self.total += other.total
+        return self
+
+class Snapshot(object):
+    '''An account's balance and budget totals as they were after one write.
+
+    Writers publish a new one when they're done rather than changing
+    this one, so reading it never has to wait for them:
+    >>> account = Account()
+    >>> _ = account.add_budget('Coffee')
+    >>> snapshot = account.snapshot()
+    >>> _ = account.add_purchase(3, category='Coffee')
+    >>> snapshot.balance, snapshot.get_budget_totals(), account.balance
+    (Decimal('0.00'), {'Coffee': Decimal('0.00')}, Decimal('-3.00'))
+    '''
+    __slots__ = ('version', '_balance', 'budgets', '_spending')
+
+    def __init__(self, version, balance, budgets, spending):
+        self.version = version
+        self._balance = balance
+        self.budgets = budgets
+        self._spending = spending
+
+    @property
+    def balance(self):
+        return self._balance.quantize(Decimal('0.01'))
+
+    def get_budget(self, name):
+        '''Get the budget called name, or None.'''
+        for budget in self.budgets:
+            if budget.name == name:
+                return budget
+
+    def get_budget_total(self, name, timestamp=None):
+        '''See Account.get_budget_total.'''
+        start = end = None
+        if timestamp is not None:
+            budget = self.get_budget(name)
+            start, end = period(budget.interval if budget else None, timestamp)
+        return self._spending.total(name, start, end).quantize(Decimal('0.01'))
+
+    def get_budget_totals(self, timestamp=None):
+        '''See Account.get_budget_totals.'''
+        totals = {}
+        with instrument.timer('budget_totals'):
+            for budget in self.budgets:
+                start = end = None
+                if timestamp is not None:
+                    start, end = period(budget.interval, timestamp)
+                totals[budget.name] = self._spending.total(budget.name, start, end).quantize(Decimal('0.01'))
+        return totals
+
 class Budget(ReprableClass):
     '''Budgets are categories that purchases fall under.
     '''
@@ -265,11 +1050,20 @@ class Budget(ReprableClass):
         self.description = description
 
 class Transaction(ReprableClass):
-    '''Transactions are any money going in or out of an Account.'''
+    '''Transactions are any money going in or out of an Account.
+
+    There can be millions of these, so they have slots instead of a
+    __dict__ and their categories are interned.
+    >>> Purchase(4, category='Coffee').category is Purchase(5, category=''.join(['Cof', 'fee'])).category
+    True
+    '''
+    __slots__ = ('timestamp', 'amount', 'description', 'category')
     direction = 0
     def __init__(self, amount=0, description="", timestamp=None, category=None):
         if not timestamp:
             timestamp = datetime.datetime.now()
+        if type(category) is str:
+            category = intern(category)
         self.timestamp = timestamp
         self.amount = amount
         self.description = description
@@ -277,14 +1071,18 @@ class Transaction(ReprableClass):
 
 class Income(Transaction):
     '''Income is money going into the account.'''
+    __slots__ = ()
     direction = +1
 
 class Purchase(Transaction):
     '''An Expense is money going out of the account.'''
+    __slots__ = ()
     direction = -1
 
 class PayCheck(Income):
     '''A Paycheck is income that is deposited on a recurring basis.'''
+    __slots__ = ('interval',)
+    recurs_as = Income
     def __init__(self, amount, description="", timestamp=None, category=None, interval=None):
         super(PayCheck, self).__init__(amount=amount, description=description,
                                        timestamp=timestamp, category=category)
@@ -292,22 +1090,74 @@ class PayCheck(Income):
 
 class Bill(Purchase):
     '''A Bill is a purchase that is made on a recurring basis.'''
+    __slots__ = ('interval',)
+    recurs_as = Purchase
     def __init__(self, amount, description="", timestamp=None, category=None, interval=None):
         super(Bill, self).__init__(amount=amount, description=description,
                                    timestamp=timestamp, category=category)
         self.interval = interval
 
-def main():
+TRANSACTION_KINDS = dict((cls.__name__, cls) for cls in (Income, Purchase, PayCheck, Bill))
+
+def main(argv=None):
     '''Checks a mail account for new messages since the last time it checked,
     and parse them for the account information.
-    Should be called on a cron.'''
-    from get_mail import get_mail
-    account = Account()
-    for message in get_mail():
-        print message
-        account.parse_message(message)
+    Should be called on a cron, or run with --daemon to keep watching for mail.
+    With --tenants, syncs everyone in tenants.conf instead.
+
+    --metrics prints where the time went at the end, and --profile PATH
+    saves a cProfile of the whole run to PATH.
+
+    --export PATH writes the ledger out to PATH instead, and --import PATH
+    adds what's in PATH to it: as CSV if PATH ends in .csv, and in the
+    binary column format otherwise. See export.'''
+    import sys
+    import settings
+    argv = sys.argv[1:] if argv is None else argv
+    # Somewhere for the user to fill in their details, the first time.
+    settings.install_config()
+    if '--metrics' in argv or settings.INSTRUMENT_ENABLED:
+        instrument.enable()
+    profile_path = settings.INSTRUMENT_PROFILE
+    if '--profile' in argv:
+        profile_path = argv[argv.index('--profile') + 1]
+
+    if profile_path:
+        with instrument.profile(profile_path):
+            _run(argv)
+    else:
+        _run(argv)
+    if instrument.metrics.enabled:
+        print instrument.report()
+
 
+def _run(argv):
+    import settings
+    if '--tenants' in argv:
+        import tenants
+        return tenants.main()
+    account = Account(storage.default_path())
+    if '--export' in argv or '--import' in argv:
+        import export
+        if '--export' in argv:
+            path = argv[argv.index('--export') + 1]
+            print '%d transactions written to %s' % (export.save(account.iter_transactions(), path), path)
+        else:
+            path = argv[argv.index('--import') + 1]
+            print '%d transactions read from %s' % (account.add_transactions(export.load(path)), path)
+    elif '--daemon' in argv:
+        import logging
+        from poller import MailDaemon
+        logging.basicConfig(level=logging.INFO)
+        daemon = MailDaemon(account, idle=settings.IMAP_IDLE, poll_interval=settings.IMAP_POLL_INTERVAL)
+        daemon.run()
+        print daemon.metrics.summary()
+    else:
+        from get_mail import sync
+        print sync(account, workers=settings.PARSE_WORKERS)
     print account.balance
+    account.record_metrics()
+    account.close()
 
 if __name__ == "__main__":
     main()
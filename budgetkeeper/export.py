@@ -0,0 +1,401 @@
+'''Transactions out of an Account and back in again, as CSV or as a
+compact binary file of columns.
+
+Both stream, a chunk at a time, so memory use stays the same however
+long the ledger is. Both round trip exactly: amounts come back as the
+same Decimals to the last digit, and intervals as the same relativedeltas.
+
+>>> import StringIO
+>>> bill = Bill(Decimal('49.99'), 'Internet', datetime.datetime(2012, 1, 3), 'Bills', relativedelta(months=1))
+>>> out = StringIO.StringIO()
+>>> write_csv([bill, Income(Decimal('1E+3'), None, datetime.datetime(2012, 1, 4))], out)
+2
+>>> print out.getvalue(),
+kind,amount,timestamp,description,category,interval
+Bill,49.99,2012-01-03T00:00:00.000000,Internet,Bills,months=+1
+Income,1E+3,2012-01-04T00:00:00.000000,\\N,\\N,\\N
+>>> list(read_csv(StringIO.StringIO(out.getvalue())))[0]
+Bill(amount=Decimal('49.99'), category='Bills', description='Internet', interval=relativedelta(months=+1), timestamp=datetime.datetime(2012, 1, 3, 0, 0))
+
+In CSV, \\N stands for None. A text value that really starts with a
+backslash gets another one in front.
+
+The binary format (see write_columns) keeps each chunk's columns as
+packed arrays, and an index of the chunks at the end of the file. A
+ColumnFile memory maps it and only reads that index to open it, so
+opening is instant whatever the size, and any row can be read without
+reading the rest.
+'''
+import os
+import csv
+import json
+import mmap
+import bisect
+import struct
+import datetime
+
+import numpy
+from dateutil.relativedelta import relativedelta
+
+from budgetkeeper import Income, Purchase, PayCheck, Bill, TRANSACTION_KINDS
+from formats import dump_interval, load_interval, dump_timestamp, load_timestamp
+from parallel import chunked
+
+try:
+    from cDecimal import Decimal
+except ImportError:
+    from decimal import Decimal
+
+CHUNK_ROWS = 16384
+
+FIELDS = ('kind', 'amount', 'timestamp', 'description', 'category', 'interval')
+NULL = '\\N'
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def _dump_interval(interval):
+    return NULL if interval is None else dump_interval(interval)
+
+
+def _load_interval(text):
+    return None if text == NULL else load_interval(text)
+
+
+def _dump_text(text):
+    if text is None:
+        return NULL
+    return '\\' + text if text.startswith('\\') else text
+
+
+def _load_text(text):
+    if text == NULL:
+        return None
+    return text[1:] if text.startswith('\\') else text
+
+
+def _transaction(cls, amount, description, timestamp, category, interval):
+    if interval is None:
+        return cls(amount, description, timestamp, category)
+    return cls(amount, description, timestamp, category, interval)
+
+
+def write_csv(transactions, out):
+    '''Write transactions to the file object out as CSV. Returns how many.'''
+    writer = csv.writer(out, lineterminator='\n')
+    writer.writerow(FIELDS)
+    rows = 0
+    for chunk in chunked(transactions, CHUNK_ROWS):
+        writer.writerows([(trans.__class__.__name__, str(trans.amount), dump_timestamp(trans.timestamp),
+                           _dump_text(trans.description), _dump_text(trans.category),
+                           _dump_interval(getattr(trans, 'interval', None)))
+                          for trans in chunk])
+        rows += len(chunk)
+    return rows
+
+
+def read_csv(infile):
+    '''Yield the transactions in a file written by write_csv.'''
+    reader = csv.reader(infile)
+    header = next(reader, None)
+    if header is None:
+        return
+    if tuple(header) != FIELDS:
+        raise ValueError('Not a budget-keeper CSV export, the columns are %r' % (header,))
+    for kind, amount, timestamp, description, category, interval in reader:
+        try:
+            cls = TRANSACTION_KINDS[kind]
+        except KeyError:
+            raise ValueError('Unknown kind of transaction %r on line %d' % (kind, reader.line_num))
+        yield _transaction(cls, Decimal(amount), _load_text(description), load_timestamp(timestamp),
+                           _load_text(category), _load_interval(interval))
+
+
+# The binary column format. A file is MAGIC, then the chunks, then the
+# index: where each chunk starts, and how many rows come before it,
+# then TRAILER. A chunk is CHUNK_HEADER then the sections in _layout,
+# each padded out to 8 bytes.
+MAGIC = 'BKCOLS\x00\x01'
+KINDS = (Income, Purchase, PayCheck, Bill)
+# Rows, bytes of descriptions, bytes of the chunk's lists, and spare.
+CHUNK_HEADER = struct.Struct('<IIII')
+# Where the index starts, how many chunks there are, and MAGIC again.
+TRAILER = struct.Struct('<QQ8s')
+# The exponent for an amount that doesn't fit in the columns; its
+# coefficient is then its place in the chunk's list of such amounts.
+OVERFLOW = -128
+
+
+def _layout(rows, descriptions, lists):
+    '''(name, numpy type or None for bytes, count) of each section of a chunk.'''
+    return [('kind', 'u1', rows),
+            ('coefficient', '<i8', rows),
+            ('exponent', 'i1', rows),
+            ('timestamp', '<i8', rows),
+            ('category', '<i4', rows),
+            ('interval', '<i4', rows),
+            ('offsets', '<u4', rows + 1),
+            ('descriptions', None, descriptions),
+            ('lists', None, lists)]
+
+
+def _padding(size):
+    return '\x00' * (-size % 8)
+
+
+def _split_amount(amount):
+    '''(coefficient, exponent) with amount == coefficient * 10 ** exponent, or None if it won't fit.
+
+    >>> _split_amount(Decimal('-14.570')), _split_amount(Decimal('1E+3')), _split_amount(Decimal('-0'))
+    ((-14570, -3), (1, 3), None)
+    >>> _join_amount(-14570, -3), _join_amount(1, 3)
+    (Decimal('-14.570'), Decimal('1E+3'))
+    '''
+    # Going by the text is quicker than as_tuple() without cDecimal.
+    mantissa, e, exponent = str(amount).partition('E')
+    exponent = int(exponent or 0)
+    whole, point, fraction = mantissa.partition('.')
+    try:
+        coefficient = int(whole + fraction)
+    except ValueError:
+        # NaN or Infinity
+        return None
+    exponent -= len(fraction)
+    if not -127 <= exponent <= 127 or len(whole.lstrip('-') + fraction) > 18 or (not coefficient and mantissa[0] == '-'):
+        # Too big, or -0, which would come back as 0.
+        return None
+    return coefficient, exponent
+
+
+def _join_amount(coefficient, exponent):
+    return Decimal('%dE%d' % (coefficient, exponent))
+
+
+def _microseconds(timestamp):
+    delta = timestamp - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def _encode_chunk(chunk):
+    kind_codes = dict((cls, code) for code, cls in enumerate(KINDS))
+    rows = len(chunk)
+    kinds, coefficients, exponents, timestamps, category_codes, interval_codes = [], [], [], [], [], []
+    descriptions, undescribed = [], []
+    categories, intervals, overflow = {}, {}, []
+
+    for row, trans in enumerate(chunk):
+        try:
+            kinds.append(kind_codes[trans.__class__])
+        except KeyError:
+            raise ValueError('Can only export %s, not %r' % (', '.join(cls.__name__ for cls in KINDS), trans))
+        split = _split_amount(trans.amount)
+        if split is None:
+            split = (len(overflow), OVERFLOW)
+            overflow.append(str(trans.amount))
+        coefficients.append(split[0])
+        exponents.append(split[1])
+        timestamps.append(_microseconds(trans.timestamp))
+
+        category = trans.category
+        category_codes.append(-1 if category is None else categories.setdefault(category, len(categories)))
+        interval = getattr(trans, 'interval', None)
+        interval_codes.append(-1 if interval is None
+                              else intervals.setdefault(dump_interval(interval), len(intervals)))
+        if trans.description is None:
+            undescribed.append(row)
+            descriptions.append('')
+        else:
+            descriptions.append(trans.description)
+
+    offsets = numpy.zeros(rows + 1, '<u4')
+    numpy.cumsum([len(description) for description in descriptions], out=offsets[1:])
+    lists = json.dumps({'categories': sorted(categories, key=categories.get),
+                        'intervals': sorted(intervals, key=intervals.get),
+                        'amounts': overflow,
+                        'undescribed': undescribed}, encoding='latin-1')
+    blob = ''.join(descriptions)
+
+    sections = {'kind': kinds, 'coefficient': coefficients, 'exponent': exponents,
+                'timestamp': timestamps, 'category': category_codes, 'interval': interval_codes}
+    parts = [CHUNK_HEADER.pack(rows, len(blob), len(lists), 0)]
+    for name, dtype, count in _layout(rows, len(blob), len(lists)):
+        if name == 'offsets':
+            data = offsets.tostring()
+        elif dtype is None:
+            data = blob if name == 'descriptions' else lists
+        else:
+            data = numpy.array(sections[name], dtype).tostring()
+        parts.append(data)
+        parts.append(_padding(len(data)))
+    return ''.join(parts)
+
+
+def write_columns(transactions, out, chunk_size=CHUNK_ROWS):
+    '''Write transactions to the file object out in the binary column format. Returns how many.
+
+    Each chunk of chunk_size rows holds its columns as packed arrays:
+    kinds, amounts as a whole number and a power of ten, timestamps in
+    microseconds, categories and intervals as places in the chunk's
+    list of them, and descriptions end to end.
+    '''
+    out.write(MAGIC)
+    position = len(MAGIC)
+    offsets, starts = [], [0]
+    for chunk in chunked(transactions, chunk_size):
+        data = _encode_chunk(chunk)
+        offsets.append(position)
+        starts.append(starts[-1] + len(chunk))
+        out.write(data)
+        position += len(data)
+    out.write(numpy.array(offsets, '<u8').tostring())
+    out.write(numpy.array(starts, '<u8').tostring())
+    out.write(TRAILER.pack(position, len(offsets), MAGIC))
+    return starts[-1]
+
+
+def _decode_lists(data):
+    def text(value):
+        # JSON hands strings back as unicode; the ledger deals in str.
+        return value.encode('latin-1')
+    lists = json.loads(data)
+    return ([text(category) for category in lists['categories']],
+            [load_interval(text(interval)) for interval in lists['intervals']],
+            [Decimal(text(amount)) for amount in lists['amounts']],
+            set(lists['undescribed']))
+
+
+class ColumnFile(object):
+    '''A file written by write_columns, memory mapped.
+
+    Opening it only reads the index at the end. Iterating over it reads
+    a chunk at a time; indexing it reads just the row wanted.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < len(MAGIC) + TRAILER.size:
+            self._file.close()
+            raise ValueError('%s is too short to be a budget-keeper column file' % path)
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        index, chunks, magic = TRAILER.unpack_from(self._map, size - TRAILER.size)
+        if self._map[:len(MAGIC)] != MAGIC or magic != MAGIC:
+            self.close()
+            raise ValueError('%s is not a budget-keeper column file' % path)
+        # Copied out, so nothing points into the map once it's closed.
+        self._offsets = numpy.frombuffer(self._map, '<u8', chunks, index).tolist()
+        self._starts = numpy.frombuffer(self._map, '<u8', chunks + 1, index + 8 * chunks).tolist()
+        self._cached_lists = None
+
+    def __len__(self):
+        return self._starts[-1]
+
+    @property
+    def chunks(self):
+        return len(self._offsets)
+
+    def __iter__(self):
+        for i in xrange(self.chunks):
+            for trans in self.chunk(i):
+                yield trans
+
+    def __getitem__(self, row):
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError('row %d of %d' % (row, len(self)))
+        i = bisect.bisect_right(self._starts, row) - 1
+        row -= self._starts[i]
+        return self._read(i, row, row + 1)[0]
+
+    def chunk(self, i):
+        '''The transactions in chunk i, as a list.'''
+        return self._read(i)
+
+    def _sections(self, i):
+        '''(rows, {section name: (offset, count, numpy type or None for bytes)}) for chunk i.'''
+        offset = self._offsets[i]
+        rows, descriptions, lists, spare = CHUNK_HEADER.unpack_from(self._map, offset)
+        offset += CHUNK_HEADER.size
+        sections = {}
+        for name, dtype, count in _layout(rows, descriptions, lists):
+            sections[name] = (offset, count, dtype)
+            size = count if dtype is None else numpy.dtype(dtype).itemsize * count
+            offset += size + -size % 8
+        return rows, sections
+
+    def _lists(self, i, sections):
+        # Random reads tend to come back to the same chunk.
+        if self._cached_lists is None or self._cached_lists[0] != i:
+            offset, count, dtype = sections['lists']
+            self._cached_lists = (i, _decode_lists(self._map[offset:offset + count]))
+        return self._cached_lists[1]
+
+    def _read(self, i, start=0, stop=None):
+        '''Rows start to stop of chunk i, reading only those.'''
+        rows, sections = self._sections(i)
+        stop = rows if stop is None else stop
+
+        def column(name, extra=0):
+            offset, count, dtype = sections[name]
+            size = numpy.dtype(dtype).itemsize
+            return numpy.frombuffer(self._map, dtype, stop - start + extra, offset + start * size).tolist()
+
+        categories, intervals, overflow, undescribed = self._lists(i, sections)
+        offsets = column('offsets', 1)
+        base = sections['descriptions'][0]
+        blob = self._map[base + offsets[0]:base + offsets[-1]]
+        first = offsets[0]
+        # Amounts repeat a lot, and Decimals never change, so share them.
+        amounts = {}
+        transactions = []
+        for row, (kind, coefficient, exponent, microseconds, category, interval) in enumerate(zip(
+                column('kind'), column('coefficient'), column('exponent'),
+                column('timestamp'), column('category'), column('interval')), start):
+            if exponent == OVERFLOW:
+                amount = overflow[coefficient]
+            else:
+                amount = amounts.get((coefficient, exponent))
+                if amount is None:
+                    amount = amounts[coefficient, exponent] = _join_amount(coefficient, exponent)
+            if row in undescribed:
+                description = None
+            else:
+                description = blob[offsets[row - start] - first:offsets[row - start + 1] - first]
+            transactions.append(_transaction(
+                KINDS[kind], amount, description, EPOCH + datetime.timedelta(microseconds=microseconds),
+                None if category < 0 else categories[category], None if interval < 0 else intervals[interval]))
+        return transactions
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def save(transactions, path):
+    '''Write transactions to path, as CSV if it ends in .csv and in columns otherwise.
+
+    Returns how many were written.
+    '''
+    with open(path, 'wb') as out:
+        if path.endswith('.csv'):
+            return write_csv(transactions, out)
+        return write_columns(transactions, out)
+
+
+def load(path):
+    '''Yield the transactions saved to path by save().'''
+    if path.endswith('.csv'):
+        with open(path, 'rb') as infile:
+            for trans in read_csv(infile):
+                yield trans
+    else:
+        with ColumnFile(path) as columns:
+            for trans in columns:
+                yield trans
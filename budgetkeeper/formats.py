@@ -0,0 +1,88 @@
+'''Intervals and timestamps as text, the same way everywhere.
+
+The ledger on disk, exports and the web UI all write them with these,
+so there's one format to keep readable, not one per place they go.
+'''
+import datetime
+from dateutil.relativedelta import relativedelta
+
+# The parts of a relativedelta an interval is made of, in the order
+# they're written. The absolute ones (year=, weekday= and so on) aren't
+# intervals, and aren't kept.
+INTERVAL_FIELDS = ('years', 'months', 'days', 'hours', 'minutes', 'seconds', 'microseconds')
+ABSOLUTE_FIELDS = ('year', 'month', 'day', 'weekday', 'hour', 'minute', 'second', 'microsecond')
+
+
+def check_interval(interval):
+    '''Raise ValueError if interval has parts that can't be written down.
+
+    >>> check_interval(relativedelta(months=1, day=1))
+    Traceback (most recent call last):
+    ...
+    ValueError: relativedelta(months=+1, day=1) is not an interval that can be saved
+    '''
+    if interval.leapdays or any(getattr(interval, field) is not None for field in ABSOLUTE_FIELDS):
+        raise ValueError('%r is not an interval that can be saved' % (interval,))
+
+
+def interval_fields(interval):
+    '''[(field, value)] for each of interval's parts that isn't zero.
+
+    >>> interval_fields(relativedelta(weeks=2, hours=-3))
+    [('days', 14), ('hours', -3)]
+    '''
+    check_interval(interval)
+    return [(field, getattr(interval, field)) for field in INTERVAL_FIELDS if getattr(interval, field)]
+
+
+def dump_interval(interval):
+    '''An interval as text, and back again with load_interval.
+
+    >>> dump_interval(relativedelta(weeks=2, hours=-3))
+    'days=+14 hours=-3'
+    >>> load_interval(dump_interval(relativedelta(weeks=2, hours=-3)))
+    relativedelta(days=+14, hours=-3)
+    >>> dump_interval(None) is None
+    True
+    '''
+    if interval is None:
+        return None
+    return ' '.join('%s=%+d' % part for part in interval_fields(interval))
+
+
+def load_interval(text):
+    '''
+    Ledgers used to keep intervals as bare numbers, years first:
+    >>> load_interval('0 1 0'), load_interval('0 0 1 12 0 0 0')
+    (relativedelta(months=+1), relativedelta(days=+1, hours=+12))
+    '''
+    if text is None:
+        return None
+    parts = text.split()
+    if parts and '=' not in parts[0]:
+        return relativedelta(**dict(zip(INTERVAL_FIELDS, [int(part) for part in parts])))
+    return relativedelta(**dict((field, int(value)) for field, value in (part.split('=') for part in parts)))
+
+
+def dump_timestamp(timestamp):
+    '''
+    strftime can't do years before 1900 on Python 2, so it's spelled out:
+    >>> dump_timestamp(datetime.datetime(1899, 12, 31, 9, 30))
+    '1899-12-31T09:30:00.000000'
+    '''
+    return '%04d-%02d-%02dT%02d:%02d:%02d.%06d' % (
+        timestamp.year, timestamp.month, timestamp.day,
+        timestamp.hour, timestamp.minute, timestamp.second, timestamp.microsecond)
+
+
+def load_timestamp(text):
+    '''
+    >>> load_timestamp(dump_timestamp(datetime.datetime(1899, 12, 31, 23, 59, 58, 7)))
+    datetime.datetime(1899, 12, 31, 23, 59, 58, 7)
+
+    Ledgers used to have a space between the date and the time:
+    >>> load_timestamp('2012-01-01 09:30:00.000000')
+    datetime.datetime(2012, 1, 1, 9, 30)
+    '''
+    return datetime.datetime(int(text[0:4]), int(text[5:7]), int(text[8:10]),
+                             int(text[11:13]), int(text[14:16]), int(text[17:19]), int(text[20:26]))
@@ -1,32 +1,216 @@
+'''Fetch the subjects of new messages from the IMAP server.
 
-import imaplib
-import email
+Only messages that arrived since the last run are fetched. The mailbox's
+UIDVALIDITY and the highest UID seen are kept in a small state file, so
+each run searches "UID n+1:*" instead of the whole mailbox, and only the
+Subject and Date headers are downloaded, many messages per FETCH.
+'''
+import os
+import re
+import json
+import datetime
+import collections
 
 import settings
+import instrument
 
-def get_mail():
-    if settings.IMAP_ENABLED:
-        # Log in to the IMAP account.
-        if settings.IMAP_USE_SSL:
-            mail = imaplib.IMAP4_SSL(settings.IMAP_SERVER, settings.IMAP_PORT)
+uid_pattern = re.compile(r'\bUID (\d+)')
+
+FETCH_HEADERS = '(BODY.PEEK[HEADER.FIELDS (SUBJECT DATE)])'
+
+
+class SyncState(object):
+    '''Where the last sync of a mailbox left off.
+
+    >>> state = SyncState()
+    >>> state.reset('me@example.com@imap.example.com/inbox', 42)
+    >>> state.last_uid = 17
+    >>> state.first_uid('me@example.com@imap.example.com/inbox', 42)
+    18
+
+    If the server renumbers the mailbox, start again from the top:
+    >>> state.first_uid('me@example.com@imap.example.com/inbox', 43)
+    1
+    '''
+    def __init__(self, path=None):
+        self.path = path
+        self.mailbox = None
+        self.uidvalidity = None
+        self.last_uid = 0
+
+    @classmethod
+    def load(cls, path):
+        state = cls(path)
+        if path and os.path.exists(path):
+            with open(path) as f:
+                saved = json.load(f)
+            state.mailbox = saved.get('mailbox')
+            state.uidvalidity = saved.get('uidvalidity')
+            state.last_uid = saved.get('last_uid', 0)
+        return state
+
+    def save(self):
+        if not self.path:
+            return
+        # Write to the side and rename, so a crash never leaves half a file.
+        temp = self.path + '.tmp'
+        with open(temp, 'w') as f:
+            json.dump({'mailbox': self.mailbox,
+                       'uidvalidity': self.uidvalidity,
+                       'last_uid': self.last_uid}, f)
+        os.rename(temp, self.path)
+
+    def reset(self, mailbox, uidvalidity):
+        self.mailbox = mailbox
+        self.uidvalidity = uidvalidity
+        self.last_uid = 0
+
+    def first_uid(self, mailbox, uidvalidity):
+        '''The first UID we haven't seen yet in this mailbox.'''
+        if (mailbox, uidvalidity) != (self.mailbox, self.uidvalidity):
+            self.reset(mailbox, uidvalidity)
+        return self.last_uid + 1
+
+
+def state_path():
+    '''Where the sync state lives, under the XDG data directory.'''
+    import xdg.BaseDirectory as bd
+    return os.path.join(bd.save_data_path('budget-keeper'), 'imap-state.json')
+
+
+class MailConfig(collections.namedtuple('MailConfig', 'email password server port use_ssl label')):
+    '''Which mailbox to read, and how to log in to it.
+
+    >>> config = MailConfig('me@example.com', 'secret', 'imap.example.com', 993, True, False)
+    >>> config.mailbox
+    'me@example.com@imap.example.com/inbox'
+    '''
+    __slots__ = ()
+
+    @classmethod
+    def from_settings(cls):
+        '''The mailbox from the settings file.'''
+        return cls(settings.AUTHENTICATION_EMAIL, settings.AUTHENTICATION_PASSWORD,
+                   settings.IMAP_SERVER, settings.IMAP_PORT, settings.IMAP_USE_SSL, settings.IMAP_LABEL)
+
+    @property
+    def mailbox(self):
+        return '%s@%s/%s' % (self.email, self.server, self.label or "inbox")
+
+
+def connect(config=None):
+    '''Log in to the IMAP account and select the mailbox to read.
+
+    Without a MailConfig, it's the one from the settings file.
+    '''
+    import imaplib
+    if config is None:
+        config = MailConfig.from_settings()
+    with instrument.timer('imap.connect'):
+        if config.use_ssl:
+            mail = imaplib.IMAP4_SSL(config.server, config.port)
         else:
-            mail = imaplib.IMAP4(settings.IMAP_SERVER, settings.IMAP_PORT)
+            mail = imaplib.IMAP4(config.server, config.port)
+
+        mail.login(config.email, config.password)
+        mail.select(config.label or "inbox")
+    return mail
+
+
+def parse_headers(raw):
+    '''Get (subject, timestamp) out of a block of message headers.
+
+    >>> parse_headers('Subject: Paid $3 for coffee\\r\\nDate: Tue, 14 Feb 2012 09:30:00 -0000\\r\\n\\r\\n')[0]
+    'Paid $3 for coffee'
+    >>> parse_headers('Subject: No date\\r\\n\\r\\n')
+    ('No date', None)
+    '''
+    import email.utils
+    message = email.message_from_string(raw)
+    timestamp = None
+    date = email.utils.parsedate_tz(message['Date'] or '')
+    if date:
+        timestamp = datetime.datetime.fromtimestamp(email.utils.mktime_tz(date))
+    return message['Subject'], timestamp
+
+
+def fetch_batches(mail, state, sender, batch_size=200, uidvalidity=None, mailbox=None):
+    '''Yield lists of (subject, timestamp) for messages from sender newer than state.
+
+    mail must already have a mailbox selected. state.last_uid moves past
+    each batch as it is handed out, but saving it is up to the caller.
+    The mailbox's UIDVALIDITY is read from the SELECT response unless
+    given, which it has to be on a connection that has been used since.
+    mailbox names it in the state, and defaults to the settings file's.
+    '''
+    if uidvalidity is None:
+        uidvalidity = mail.response('UIDVALIDITY')[1][-1]
+    if mailbox is None:
+        mailbox = MailConfig.from_settings().mailbox
+    first = state.first_uid(mailbox, uidvalidity)
+
+    with instrument.timer('imap.search'):
+        result, data = mail.uid('search', None, '(UID %d:* FROM "%s")' % (first, sender))
+    if result != "OK":
+        return
+    # "n:*" always matches the highest UID, even when it is below n.
+    uids = [uid for uid in (int(uid) for uid in data[0].split()) if uid >= first]
+
+    for start in range(0, len(uids), batch_size):
+        batch = uids[start:start + batch_size]
+        with instrument.timer('imap.fetch'):
+            result, data = mail.uid('fetch', ','.join(str(uid) for uid in batch), FETCH_HEADERS)
+        if result != "OK":
+            return
+
+        messages = {}
+        with instrument.timer('imap.headers'):
+            for part in data:
+                if isinstance(part, tuple):
+                    match = uid_pattern.search(part[0])
+                    if match:
+                        messages[int(match.group(1))] = parse_headers(part[1])
+        instrument.count('imap.messages', len(messages))
+        state.last_uid = max(state.last_uid, batch[-1])
+        yield [messages[uid] for uid in batch if uid in messages]
+
+
+def get_mail(state=None, batch_size=200):
+    '''Yield lists of (subject, timestamp) for the messages sent since the last run.
+
+    As with fetch_batches, state.last_uid moves past each batch as it is
+    handed out but isn't saved: that waits until the messages are in the
+    ledger, which sync takes care of.
+    '''
+    if settings.IMAP_ENABLED:
+        if state is None:
+            state = SyncState.load(state_path())
+        mail = connect()
+        try:
+            for batch in fetch_batches(mail, state, settings.AUTHENTICATION_EMAIL, batch_size):
+                yield batch
+        finally:
+            mail.logout()
 
-        mail.login(settings.AUTHENTICATION_EMAIL, settings.AUTHENTICATION_PASSWORD)
 
-        mail.select(settings.IMAP_LABEL or "inbox")
+def sync(account, state=None, batch_size=200, workers=1):
+    '''Add the messages sent since the last run to account, returning an IngestSummary.
 
-        # Get all mail from the user
-        result, data = mail.uid('search', None, '(FROM "%s")' % settings.AUTHENTICATION_EMAIL)
-        data = data[0].split()
-        if result == "OK":
-            for uid in data:
-                result, data = mail.uid('fetch', uid, '(RFC822)')
-                if result == "OK":
-                    raw_email = data[0][1]
-                    email_message = email.message_from_string(raw_email)
-                    yield email_message['Subject']
+    The state is saved after each batch has been added and flushed, so a
+    crash part way means fetching some messages again, never losing them.
+    '''
+    from budgetkeeper import IngestSummary
+    summary = IngestSummary()
+    if not settings.IMAP_ENABLED:
+        return summary
+    if state is None:
+        state = SyncState.load(state_path())
+    for batch in get_mail(state, batch_size):
+        summary.merge(account.parse_messages(batch, workers=workers))
+        state.save()
+    return summary
 
 if __name__ == "__main__":
-    for message in get_mail():
-        print message
+    for batch in get_mail():
+        for subject, timestamp in batch:
+            print timestamp, subject
@@ -0,0 +1,208 @@
+'''Where the time goes: counts and latency histograms for each stage.
+
+Code marks out its stages, and bumps counters as it goes:
+
+    with instrument.timer('imap.fetch'):
+        ...
+    instrument.count('messages', len(batch))
+
+All of it is off unless turned on with enable(), the [instrument]
+section of budget-keeper.conf, or --metrics on the command line. Off,
+timer() hands back a timer that does nothing and count() returns
+straight away, so the cost is a function call per stage. Stages are
+marked around whole batches and chunks, never single messages, to keep
+it that way; profile() is there for finer detail.
+
+>>> registry = Registry()
+>>> registry.enabled = True
+>>> with registry.timer('parse'):
+...     pass
+>>> registry.count('messages', 3)
+>>> snapshot = registry.snapshot()
+>>> snapshot['counters'], snapshot['stages']['parse']['count']
+({'messages': 3}, 1)
+'''
+import time
+import bisect
+import threading
+import contextlib
+
+# Upper bounds of the histogram buckets, in seconds: 10us doubling up to
+# about a minute and a half. Anything slower goes in one last bucket.
+BUCKETS = tuple(0.00001 * 2 ** i for i in range(24))
+
+
+class Histogram(object):
+    '''Latencies, counted into BUCKETS.
+
+    Percentiles come back as the upper bound of the bucket they fall in.
+    >>> histogram = Histogram()
+    >>> for seconds in (0.001, 0.002, 0.003, 0.5):
+    ...     histogram.add(seconds)
+    >>> histogram.count, histogram.max, histogram.percentile(50)
+    (4, 0.5, 0.00256)
+    '''
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, percent):
+        if not self.count:
+            return None
+        wanted = max(1, self.count * percent / 100.0)
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= wanted:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        return {'count': self.count,
+                'total': self.total,
+                'mean': self.total / self.count if self.count else None,
+                'p50': self.percentile(50),
+                'p99': self.percentile(99),
+                'max': self.max,
+                'buckets': dict((str(bound), count) for bound, count in zip(BUCKETS + ('inf',), self.counts)
+                                if count)}
+
+
+class _Timer(object):
+    __slots__ = ('registry', 'name', 'start')
+
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.registry.record(self.name, time.time() - self.start)
+
+
+class _NullTimer(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+_null_timer = _NullTimer()
+
+
+class Registry(object):
+    '''Counters and stage histograms, safe to share between threads.'''
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._stages = {}
+
+    def timer(self, name):
+        '''A context manager recording how long its block took under name.'''
+        if not self.enabled:
+            return _null_timer
+        return _Timer(self, name)
+
+    def record(self, name, seconds):
+        if not self.enabled:
+            return
+        with self._lock:
+            stage = self._stages.get(name)
+            if stage is None:
+                stage = self._stages[name] = Histogram()
+            stage.add(seconds)
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def snapshot(self):
+        '''Everything recorded so far, as plain data.'''
+        with self._lock:
+            return {'enabled': self.enabled,
+                    'counters': dict(self._counters),
+                    'stages': dict((name, stage.summary()) for name, stage in self._stages.items())}
+
+    def report(self):
+        '''The snapshot as a table, for a terminal.'''
+        snapshot = self.snapshot()
+        lines = ['%-24s %8s %10s %10s %10s %10s' % ('stage', 'count', 'total s', 'p50 ms', 'p99 ms', 'max ms')]
+        for name, stage in sorted(snapshot['stages'].items()):
+            lines.append('%-24s %8d %10.3f %10.3f %10.3f %10.3f' % (
+                name, stage['count'], stage['total'], stage['p50'] * 1000, stage['p99'] * 1000, stage['max'] * 1000))
+        for name, value in sorted(snapshot['counters'].items()):
+            lines.append('%-24s %8d' % (name, value))
+        return '\n'.join(lines)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._stages.clear()
+
+
+# The registry everything in budgetkeeper records to.
+metrics = Registry()
+
+
+def enable(enabled=True):
+    metrics.enabled = enabled
+
+
+def timer(name):
+    return metrics.timer(name)
+
+
+def record(name, seconds):
+    metrics.record(name, seconds)
+
+
+def count(name, n=1):
+    metrics.count(name, n)
+
+
+def snapshot():
+    return metrics.snapshot()
+
+
+def report():
+    return metrics.report()
+
+
+@contextlib.contextmanager
+def profile(path):
+    '''Run the block under cProfile, saving the stats to path for pstats.
+
+    The process's peak memory is recorded too, as the memory.peak_kb
+    counter; Python 2 has no tracemalloc to say which lines it went to.
+    '''
+    import cProfile
+    import resource
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        with metrics._lock:
+            metrics._counters['memory.peak_kb'] = peak
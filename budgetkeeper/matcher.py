@@ -0,0 +1,127 @@
+'''Find which budget a description is talking about.
+
+Budget names are kept in an Aho-Corasick automaton, so finding the
+budget named in a description takes one walk over the description no
+matter how many budgets there are.
+'''
+import re
+from collections import deque
+
+non_word_pattern = re.compile(r'[^\w]+')
+
+
+def normalize(text):
+    '''Lowercase text and strip everything but letters, digits and underscores.
+    >>> normalize('Some groceries because I hunger.')
+    'somegroceriesbecauseihunger'
+    '''
+    return non_word_pattern.sub('', text).lower()
+
+
+class BudgetMatcher(object):
+    '''Matches descriptions against a set of names.
+
+    When several names turn up in one description, the one added first
+    wins, same as checking each name in turn would.
+    >>> matcher = BudgetMatcher()
+    >>> matcher.add('Booze', 'booze budget')
+    >>> matcher.add('Groceries', 'grocery budget')
+    >>> matcher.find('Paid for groceries and booze.')
+    ('booze budget', False)
+
+    The second item says whether the name was the whole description.
+    >>> matcher.find('Groceries.')
+    ('grocery budget', True)
+    >>> matcher.find('Shoes')
+    (None, False)
+    '''
+    def __init__(self):
+        # One entry per trie node.
+        self._goto = [{}]
+        self._fail = [0]
+        self._rank = [None]     # rank of the name ending at this node
+        self._best = [None]     # lowest rank ending here or down the fail chain
+        # One entry per rank.
+        self._values = []
+        self._lengths = []
+        self._dirty = False
+
+    def __len__(self):
+        return len(self._values)
+
+    def add(self, name, value):
+        '''Add a name to match on. Later duplicates of a name never win.'''
+        key = normalize(name)
+        if not key:
+            return
+
+        node = 0
+        for char in key:
+            child = self._goto[node].get(char)
+            if child is None:
+                child = len(self._goto)
+                self._goto[node][char] = child
+                self._goto.append({})
+                self._fail.append(0)
+                self._rank.append(None)
+                self._best.append(None)
+            node = child
+
+        if self._rank[node] is None:
+            self._rank[node] = len(self._values)
+            self._values.append(value)
+            self._lengths.append(len(key))
+        # Adding to the trie is cheap, the fail links are redone lazily
+        # so adding a pile of budgets only pays for it once.
+        self._dirty = True
+
+    def _build(self):
+        '''Work out the fail links, breadth first from the root.'''
+        goto, fail, rank, best = self._goto, self._fail, self._rank, self._best
+        best[0] = None
+        queue = deque()
+        for child in goto[0].values():
+            fail[child] = 0
+            best[child] = rank[child]
+            queue.append(child)
+
+        while queue:
+            node = queue.popleft()
+            for char, child in goto[node].items():
+                state = fail[node]
+                while state and char not in goto[state]:
+                    state = fail[state]
+                fail[child] = goto[state].get(char, 0)
+
+                inherited = best[fail[child]]
+                if rank[child] is None or (inherited is not None and inherited < rank[child]):
+                    best[child] = inherited
+                else:
+                    best[child] = rank[child]
+                queue.append(child)
+
+        self._dirty = False
+
+    def find(self, text):
+        '''Get (value, whole) for the earliest added name found in text.'''
+        if self._dirty:
+            self._build()
+
+        key = normalize(text)
+        goto, fail, best = self._goto, self._fail, self._best
+        found = None
+        state = 0
+        for char in key:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+
+            rank = best[state]
+            if rank is not None and (found is None or rank < found):
+                found = rank
+                if found == 0:
+                    break
+
+        if found is None:
+            return None, False
+        return self._values[found], self._lengths[found] == len(key)
@@ -0,0 +1,60 @@
+'''Parse chunks of messages over a pool of worker processes.
+
+Only the regex work is done in the workers; matching budgets and adding
+purchases to the Account stays in the parent, which gets chunks back in
+the order they went in.
+'''
+import itertools
+from collections import deque
+
+import parsing
+
+
+def chunked(messages, chunk_size):
+    '''Split an iterable into lists of up to chunk_size items.
+    >>> list(chunked(range(5), 2))
+    [[0, 1], [2, 3], [4]]
+    '''
+    messages = iter(messages)
+    while True:
+        chunk = list(itertools.islice(messages, chunk_size))
+        if not chunk:
+            break
+        yield chunk
+
+
+def parse_chunks(chunks, workers=1, text=None):
+    '''Yield (chunk, clauses) for each chunk, clauses holding a list per message.
+
+    If the chunks hold more than bare messages, text picks the message
+    out of each item.
+
+    With more than one worker the chunks are parsed in a process pool.
+    Only a couple of chunks per worker are in flight at once, so a
+    generator of messages is never read far ahead.
+    >>> list(parse_chunks([['$3 coffee'], ['Lunch']]))
+    [(['$3 coffee'], [[Clause(text='$3 coffee', amount='3', description='$3 coffee')]]), (['Lunch'], [[]])]
+    '''
+    def texts(chunk):
+        return [text(item) for item in chunk] if text else chunk
+
+    if workers <= 1:
+        for chunk in chunks:
+            yield chunk, parsing.parse_all(texts(chunk))
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    pending = deque()
+    chunks = iter(chunks)
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        for chunk in itertools.islice(chunks, workers * 2):
+            pending.append((chunk, executor.submit(parsing.parse_all, texts(chunk))))
+        while pending:
+            chunk, future = pending.popleft()
+            for more in itertools.islice(chunks, 1):
+                pending.append((more, executor.submit(parsing.parse_all, texts(more))))
+            yield chunk, future.result()
+    finally:
+        executor.shutdown(wait=True)
@@ -0,0 +1,172 @@
+'''Remember how messages parsed, for the ones that keep coming back.
+
+Most subjects are a handful of templates with a different amount each
+time: "Paid $4.50 for coffee" every morning. A message's template is
+the message with each amount taken out:
+>>> template('Paid $4.50 for coffee and $2 for a donut')
+('Paid $\\x00 for coffee and $\\x00 for a donut', ['4.50', '2'])
+
+A template only has to be parsed once. It's parsed with a stand-in
+number in place of each amount, and every later message with the same
+template gets the real amounts put back in.
+
+A ParseCache holds those results in a bounded LRU, along with how many
+lookups hit and missed. It saves to JSON rather than a pickle, so a
+cache read back from disk can only ever be data, and it is tied to the
+parser's patterns and the account's budgets: if either has changed
+since it was saved, it loads empty.
+'''
+import json
+import hashlib
+from collections import OrderedDict
+
+import parsing
+
+PLACEHOLDER = '\x00'
+
+# Bumped whenever what's in an entry changes.
+FORMAT = 1
+
+# Stand-in amounts are this plus their position in the message: too
+# long to be mistaken for a price, and all the same length.
+STAND_IN = 918273600
+
+
+def template(message):
+    '''(message with each amount replaced by a placeholder, [the amounts]).
+
+    The template is None for the odd message with a placeholder already in it.
+    '''
+    if PLACEHOLDER in message:
+        return None, []
+    pieces, amounts = [], []
+    last = 0
+    for match in parsing.money_pattern.finditer(message):
+        start, end = match.span('amount')
+        pieces.append(message[last:start])
+        amounts.append(match.group('amount'))
+        last = end
+    pieces.append(message[last:])
+    return PLACEHOLDER.join(pieces), amounts
+
+
+def stand_ins(key, count):
+    '''Stand-in amounts to parse key with, or None if any of them appear in it already.'''
+    numbers = [str(STAND_IN + i) for i in range(count)]
+    if any(number in key for number in numbers):
+        return None
+    return numbers
+
+
+def fill(key, amounts):
+    '''Put amounts back into a template.
+    >>> fill(*template('Paid $4.50 for coffee'))
+    'Paid $4.50 for coffee'
+    '''
+    pieces = key.split(PLACEHOLDER)
+    return ''.join(piece + amount for piece, amount in zip(pieces, amounts)) + pieces[-1]
+
+
+def render(text, uses, amounts):
+    '''Swap the stand-ins at positions uses in text for the real amounts.'''
+    for i in uses:
+        text = text.replace(str(STAND_IN + i), amounts[i])
+    return text
+
+
+def fingerprint(budget_names):
+    '''What a saved cache has to match to be any use: the parser, and the budgets.'''
+    patterns = [parsing.money_pattern, parsing.token_pattern,
+                parsing.well_behaved_pattern, parsing.extended_pattern]
+    digest = hashlib.sha1()
+    for pattern in patterns:
+        digest.update(pattern.pattern)
+    return [FORMAT, digest.hexdigest(), list(budget_names)]
+
+
+class ParseCache(object):
+    '''A bounded LRU of parse results by template, counting hits and misses.
+
+    >>> cache = ParseCache(maxsize=2)
+    >>> cache.put('a', 1); cache.put('b', 2)
+    >>> cache.get('a'), cache.get('c')
+    (1, None)
+    >>> cache.put('c', 3)   # b is the least recently used, so it goes.
+    >>> cache.get('b'), (cache.hits, cache.misses), len(cache)
+    (None, (1, 2), 2)
+
+    An entry of False marks a template that can't stand in for its
+    messages. Those still have to be parsed in full, so finding one
+    counts as a miss:
+    >>> cache.put('d', False)
+    >>> cache.get('d'), (cache.hits, cache.misses)
+    (False, (1, 3))
+    '''
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries[key] = entry
+        if entry is False:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        if self.maxsize <= 0:
+            return
+        self._entries.pop(key, None)
+        self._entries[key] = entry
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def dump(self, fingerprint):
+        '''The cache as JSON, least recently used first.'''
+        # Latin-1 turns any bytes into text and back again unchanged.
+        return json.dumps({'fingerprint': fingerprint, 'entries': self._entries.items()}, encoding='latin-1')
+
+    @classmethod
+    def load(cls, text, fingerprint, maxsize=10000):
+        '''A cache from dump(), or an empty one if it's for a different fingerprint.
+
+        >>> cache = ParseCache()
+        >>> cache.put('Paid $\\x00 for coffee', [[0, 'Coffee', [], 0, True]])
+        >>> len(ParseCache.load(cache.dump([1, 'abc', ['Coffee']]), [1, 'abc', ['Coffee']]))
+        1
+        >>> len(ParseCache.load(cache.dump([1, 'abc', ['Coffee']]), [1, 'abc', ['Coffee', 'Tea']]))
+        0
+        '''
+        cache = cls(maxsize)
+        try:
+            saved = json.loads(text)
+            if _decode(saved.get('fingerprint')) != fingerprint:
+                return cache
+            for key, entry in saved['entries']:
+                cache.put(_decode(key), _decode(entry))
+        except (ValueError, TypeError, KeyError, AttributeError, UnicodeError):
+            # Not something we wrote: start afresh.
+            cache.clear()
+        return cache
+
+
+def _decode(value):
+    '''JSON hands strings back as unicode; the parser deals in str.'''
+    if isinstance(value, unicode):
+        return value.encode('latin-1')
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    return value
@@ -0,0 +1,137 @@
+'''Single pass parser for purchase messages.
+
+A message is scanned once for money and for the word "and", which is
+what splits "Paid $14.57 for groceries and paid $50 for booze." into
+two purchases. Every pattern is compiled when the module is imported.
+'''
+import re
+from collections import namedtuple
+
+# Something that looks like money at the start of a word: $4.12, 4, .12
+MONEY = r'\$?(?P<amount>\d+(?:\.\d\d?)?|\.\d\d?)'
+
+money_pattern = re.compile(r'(?:^|(?<= ))%s' % MONEY)
+token_pattern = re.compile(r'(?:^|(?<= ))%s|(?P<conjunction>\band\b)' % MONEY, flags=re.IGNORECASE)
+
+# "Paid ${money} for ${description}", run against the lowercased message.
+well_behaved_pattern = re.compile(r'(?:paid )?(?:bought )?(?P<first_desc>.*) for (?P<description>.*)', flags=re.IGNORECASE)
+
+# "Bought ${description} for ${money} ${more_description}", with the money taken out.
+extended_pattern = re.compile(r'bought (?P<description>.*) for[ ]?(?P<more_description>.*)', flags=re.IGNORECASE)
+
+Clause = namedtuple('Clause', 'text amount description')
+
+
+def get_money(message):
+    '''Gets the first thing that looks like money from a message.
+    >>> get_money('Paid 45 bux for some turnips.')
+    '45'
+    >>> get_money('No money here') is None
+    True
+    '''
+    match = money_pattern.search(message)
+    if match:
+        return match.group('amount')
+
+
+def get_description(message):
+    '''Gets the description of a single purchase from a message.
+    >>> get_description('Paid $14.57 for a book from the used bookstore.')
+    'A book from the used bookstore.'
+    '''
+    money = [(match.start(), match.end(), match.group('amount'))
+             for match in money_pattern.finditer(message)]
+    return _describe(message, money)
+
+
+def _describe(message, money):
+    '''Describe message, given the (start, end, amount) of the money in it.'''
+    # Try to match the well behaved version first:
+    description = well_behaved_pattern.match(message.lower())
+    if description and description.group('description'):
+        # If the first part of the description is actually money,
+        # Then use this well behaved version, if it's actually more
+        # description, move on to the extended description version.
+        first_start, first_end = description.span('first_desc')
+        for start, end, amount in money:
+            if first_start <= start < first_end:
+                return description.group('description').capitalize()
+
+    if not money:
+        # Couldn't get a money from the message
+        return
+
+    # Try getting the extended description version:
+    # Remove the money (and a space either side of it) from the message.
+    start, end, amount = money[0]
+    if message[start-1:start] == ' ':
+        start -= 1
+    if message[end:end+1] == ' ':
+        end += 1
+    msg = message[:start] + message[end:]
+
+    # Now grab all the parts of our description.
+    extended_desc = extended_pattern.match(msg)
+    if extended_desc:
+        if extended_desc.group('description') or extended_desc.group('more_description'):
+            return (extended_desc.group('description').capitalize() + extended_desc.group('more_description'))
+
+    # Nothing matched, just return the whole thing.
+    return message
+
+
+def parse(message):
+    '''Split a message into one Clause per purchase.
+
+    >>> parse('Paid $14.57 for groceries and paid $50 for booze.')
+    [Clause(text='Paid $14.57 for groceries', amount='14.57', description='Groceries'), Clause(text='paid $50 for booze.', amount='50', description='Booze.')]
+
+    It only splits on "and" when there's money on both sides of it:
+    >>> parse('Paid $3 for candy and bread and butter.')
+    [Clause(text='Paid $3 for candy and bread and butter.', amount='3', description='Candy and bread and butter.')]
+
+    Messages without any money have nothing to parse:
+    >>> parse('Lunch with Bob')
+    []
+    '''
+    # Chop the message up at every "and", noting the money in each piece.
+    segments = []
+    start, money = 0, []
+    for match in token_pattern.finditer(message):
+        if match.group('conjunction'):
+            segments.append([start, match.start(), money])
+            start, money = match.end(), []
+        else:
+            money.append((match.start(), match.end(), match.group('amount')))
+    segments.append([start, len(message), money])
+
+    # Glue pieces back together unless both sides of the "and" have money.
+    clauses = segments[:1]
+    for segment in segments[1:]:
+        if segment[2] and clauses[-1][2]:
+            clauses.append(segment)
+        else:
+            clauses[-1][1] = segment[1]
+            clauses[-1][2].extend(segment[2])
+
+    parsed = []
+    for start, end, money in clauses:
+        if not money:
+            continue
+        text = message[start:end]
+        offset = start + len(text) - len(text.lstrip())
+        text = text.strip()
+        money = [(s - offset, e - offset, amount) for s, e, amount in money]
+        parsed.append(Clause(text, money[0][2], _describe(text, money)))
+    return parsed
+
+
+def parse_all(messages):
+    '''parse() each of a list of messages.
+
+    This is the part of ingestion that needs nothing from the Account,
+    so it is what gets shipped off to worker processes.
+    >>> parse_all(['$3 coffee', 'Lunch with Bob'])
+    [[Clause(text='$3 coffee', amount='3', description='$3 coffee')], []]
+    '''
+    return [parse(message) for message in messages]
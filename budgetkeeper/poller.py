@@ -0,0 +1,266 @@
+'''Keep watching the mailbox, and feed new messages into an Account.
+
+Run from cron, main() logs in, syncs and logs out every time. A
+MailDaemon stays logged in instead. Its MailPoller thread holds the
+IMAP connection open: if the server supports IDLE it is told about new
+mail as it lands, and otherwise it checks every poll_interval seconds.
+Lost connections are retried with exponential backoff.
+
+New messages go from the poller to the daemon through a bounded queue,
+so a slow ledger holds the poller back rather than piling up memory.
+The sync state on disk only moves forward once the messages are in the
+ledger, so a crash in between means fetching them again, not losing
+them.
+'''
+import time
+import Queue
+import random
+import socket
+import imaplib
+import logging
+import itertools
+import threading
+import collections
+
+import settings
+from get_mail import SyncState, connect, fetch_batches, state_path
+
+log = logging.getLogger(__name__)
+
+# Servers may drop a client that has idled for 30 minutes (RFC 2177).
+IDLE_TIMEOUT = 25 * 60
+
+# New messages from the poller, with where the sync got up to and when
+# the poller noticed them.
+Batch = collections.namedtuple('Batch', 'messages mailbox uidvalidity last_uid noticed')
+
+_idle_tags = itertools.count(1)
+
+
+def idle(mail, timeout):
+    '''Wait in IDLE until the server reports new mail, or timeout seconds pass.
+
+    Returns True if new mail came in. mail must have a mailbox selected.
+    '''
+    tag = 'IDLE%d' % next(_idle_tags)
+    mail.send('%s IDLE\r\n' % tag)
+    line = _readline(mail)
+    if not line.startswith('+'):
+        raise mail.error('IDLE refused: %r' % line)
+
+    sock = mail.socket()
+    deadline = time.time() + timeout
+    arrived = False
+    try:
+        while not arrived:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            sock.settimeout(remaining)
+            try:
+                line = _readline(mail)
+            except socket.timeout:
+                break
+            arrived = line.rstrip().upper().endswith('EXISTS')
+    finally:
+        sock.settimeout(None)
+
+    mail.send('DONE\r\n')
+    while not line.startswith(tag):
+        line = _readline(mail)
+    if line.split()[1] != 'OK':
+        raise mail.error('IDLE failed: %r' % line)
+    return arrived
+
+
+def _readline(mail):
+    # imaplib only notices a closed connection inside its own commands.
+    line = mail.readline()
+    if not line:
+        raise mail.abort('socket error: EOF')
+    return line
+
+
+class IngestMetrics(object):
+    '''Seconds from the poller noticing a message to it being in the ledger.
+
+    Only the latest `keep` are held on to for the percentiles.
+    >>> metrics = IngestMetrics()
+    >>> metrics.record([0.5, 0.1, 0.2, 0.3])
+    >>> metrics.messages, metrics.percentile(50), metrics.percentile(100)
+    (4, 0.3, 0.5)
+    '''
+    def __init__(self, keep=10000):
+        self.messages = 0
+        self.batches = 0
+        self._latencies = collections.deque(maxlen=keep)
+
+    def record(self, latencies):
+        self.batches += 1
+        self.messages += len(latencies)
+        self._latencies.extend(latencies)
+
+    def percentile(self, percent):
+        if not self._latencies:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[int(round((len(ordered) - 1) * percent / 100.0))]
+
+    def summary(self):
+        return {'messages': self.messages,
+                'batches': self.batches,
+                'p50': self.percentile(50),
+                'p99': self.percentile(99),
+                'max': self.percentile(100)}
+
+
+class MailPoller(threading.Thread):
+    '''Watches the mailbox on its own thread, putting Batches of new mail on queue.'''
+    def __init__(self, queue, state, idle=True, idle_timeout=IDLE_TIMEOUT, poll_interval=60,
+                 backoff=1, max_backoff=300, batch_size=200, connect=connect):
+        threading.Thread.__init__(self, name='MailPoller')
+        self.daemon = True
+        self.queue = queue
+        self.idle = idle
+        self.idle_timeout = idle_timeout
+        self.poll_interval = poll_interval
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.batch_size = batch_size
+        self.connect = connect
+
+        # Our own copy of how far we've got. It runs ahead of the saved
+        # state, which waits until the account has the messages.
+        self.state = SyncState()
+        self.state.mailbox, self.state.uidvalidity, self.state.last_uid = \
+            state.mailbox, state.uidvalidity, state.last_uid
+
+        self.reconnects = 0
+        self._failures = 0
+        self._mail = None
+        self._stopping = threading.Event()
+
+    def stop(self):
+        '''Ask the poller to finish, interrupting any wait on the server.'''
+        self._stopping.set()
+        mail = self._mail
+        if mail is not None:
+            try:
+                mail.socket().shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+    def run(self):
+        while not self._stopping.is_set():
+            try:
+                self._mail = self.connect()
+                self._watch(self._mail)
+            except (imaplib.IMAP4.error, socket.error), error:
+                if self._stopping.is_set():
+                    break
+                self._failures += 1
+                self.reconnects += 1
+                delay = min(self.max_backoff, self.backoff * 2 ** (self._failures - 1))
+                # Spread out the retries of many clients losing one server.
+                delay *= random.uniform(0.5, 1)
+                log.warning('Lost the mail server (%s), reconnecting in %.1fs', error, delay)
+                self._stopping.wait(delay)
+            finally:
+                self._close()
+
+    def _close(self):
+        mail, self._mail = self._mail, None
+        if mail is not None:
+            try:
+                mail.logout()
+            except (imaplib.IMAP4.error, socket.error):
+                pass
+
+    def _watch(self, mail):
+        uidvalidity = mail.response('UIDVALIDITY')[1][-1]
+        use_idle = self.idle and 'IDLE' in mail.capabilities
+        while not self._stopping.is_set():
+            noticed = time.time()
+            # Anything the server mentioned before now, this round picks up.
+            mail.response('EXISTS')
+            for messages in fetch_batches(mail, self.state, settings.AUTHENTICATION_EMAIL,
+                                          self.batch_size, uidvalidity):
+                self._put(Batch(messages, self.state.mailbox, uidvalidity, self.state.last_uid, noticed))
+            # We're connected and in sync, so the next failure starts the backoff over.
+            self._failures = 0
+            if mail.response('EXISTS')[1][-1] is not None:
+                # More mail landed while we were fetching.
+                continue
+            if use_idle:
+                idle(mail, self.idle_timeout)
+            else:
+                self._stopping.wait(self.poll_interval)
+
+    def _put(self, batch):
+        '''Queue batch, waiting for room, unless told to stop meanwhile.'''
+        while not self._stopping.is_set():
+            try:
+                self.queue.put(batch, timeout=0.5)
+                return
+            except Queue.Full:
+                pass
+
+
+class MailDaemon(object):
+    '''Adds new mail to account as it arrives.
+
+    The poller runs on its own thread; the account is only ever touched
+    from the thread calling ingest() or run().
+    '''
+    def __init__(self, account, state=None, queue_size=100, **options):
+        self.account = account
+        self.state = state if state is not None else SyncState.load(state_path())
+        self.queue = Queue.Queue(queue_size)
+        self.metrics = IngestMetrics()
+        self.poller = MailPoller(self.queue, self.state, **options)
+
+    def start(self):
+        self.poller.start()
+
+    def ingest(self, timeout=None):
+        '''Add everything queued up to the account, waiting up to timeout for any.
+
+        Returns the IngestSummary, or None if nothing came.
+        '''
+        try:
+            batches = [self.queue.get(timeout=timeout)]
+        except Queue.Empty:
+            return None
+        while True:
+            try:
+                batches.append(self.queue.get_nowait())
+            except Queue.Empty:
+                break
+
+        summary = self.account.parse_messages([message for batch in batches for message in batch.messages])
+        last = batches[-1]
+        self.state.mailbox, self.state.uidvalidity, self.state.last_uid = \
+            last.mailbox, last.uidvalidity, last.last_uid
+        self.state.save()
+
+        done = time.time()
+        self.metrics.record([done - batch.noticed for batch in batches for message in batch.messages])
+        return summary
+
+    def stop(self):
+        '''Stop the poller and take in anything it had already queued.'''
+        self.poller.stop()
+        self.poller.join()
+        while self.ingest(timeout=0) is not None:
+            pass
+
+    def run(self):
+        '''Ingest mail until interrupted.'''
+        self.start()
+        try:
+            while True:
+                self.ingest(timeout=1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
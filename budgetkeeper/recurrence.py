@@ -0,0 +1,184 @@
+'''When recurring bills and paychecks come due.
+
+Occurrence n of an item falls on its timestamp plus n times its
+interval, always counted from the start so month ends don't drift:
+>>> start = datetime.datetime(2012, 1, 31)
+>>> [occurrence(start, relativedelta(months=1), n).date() for n in (1, 2)]
+[datetime.date(2012, 2, 29), datetime.date(2012, 3, 31)]
+
+A Schedule keeps every recurring item in a min-heap keyed by its next
+due date, so pulling out the k occurrences due by some time costs
+O(k log r) for r items, however many transactions the account holds.
+
+For forecasting, count_between says how many occurrences fall in a
+stretch of time without generating any of them.
+'''
+import heapq
+import datetime
+import itertools
+from dateutil.relativedelta import relativedelta
+
+
+def occurrence(start, interval, n):
+    '''When the nth repeat of something starting at start comes due.'''
+    return start + interval * n
+
+
+def check_interval(start, interval):
+    '''Raise ValueError unless repeating every interval from start moves forward.
+
+    Anything that doesn't would come due over and over for ever.
+    >>> check_interval(datetime.datetime(2012, 1, 1), relativedelta(hours=12))
+    >>> check_interval(datetime.datetime(2012, 1, 1), relativedelta(months=1, days=-31))
+    Traceback (most recent call last):
+    ...
+    ValueError: Can't repeat every relativedelta(months=+1, days=-31) from 2012-01-01 00:00:00
+    '''
+    if occurrence(start, interval, 1) <= start:
+        raise ValueError("Can't repeat every %r from %s" % (interval, start))
+
+
+class Schedule(object):
+    '''Recurring items, ordered by when they next come due.
+
+    Items need a timestamp and an interval. Occurrence 0 is the item
+    itself, so new items are first due one interval after they start.
+    >>> class Bill(object):
+    ...     def __init__(self, name, timestamp, interval):
+    ...         self.name, self.timestamp, self.interval = name, timestamp, interval
+    >>> rent = Bill('rent', datetime.datetime(2012, 1, 1), relativedelta(months=1))
+    >>> pay = Bill('pay', datetime.datetime(2012, 1, 6), relativedelta(weeks=2))
+    >>> schedule = Schedule()
+    >>> schedule.add(rent)
+    >>> schedule.add(pay)
+    >>> [(when.date(), bill.name) for when, bill in schedule.due(datetime.datetime(2012, 2, 10))]
+    [(datetime.date(2012, 1, 20), 'pay'), (datetime.date(2012, 2, 1), 'rent'), (datetime.date(2012, 2, 3), 'pay')]
+
+    Asking again only gives what has come due since:
+    >>> list(schedule.due(datetime.datetime(2012, 2, 10)))
+    []
+    '''
+    def __init__(self):
+        self._heap = []         # (due, tiebreak, item, n)
+        self._next = {}         # item -> n of its next occurrence
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._next)
+
+    def __contains__(self, item):
+        return item in self._next
+
+    def add(self, item, n=1):
+        '''Schedule item, starting from its nth occurrence.
+
+        Adding an item again reschedules it, e.g. after its timestamp
+        or interval changed. Intervals that don't move forward are refused.
+        '''
+        check_interval(item.timestamp, item.interval)
+        self._next[item] = n
+        due = occurrence(item.timestamp, item.interval, n)
+        heapq.heappush(self._heap, (due, next(self._counter), item, n))
+
+    def remove(self, item):
+        '''Stop scheduling item. Its old heap entries are skipped when they surface.'''
+        self._next.pop(item, None)
+
+    def next(self, item):
+        '''The number of the next occurrence of item.'''
+        return self._next[item]
+
+    def items(self):
+        '''(item, number of its next occurrence) for everything scheduled.'''
+        return self._next.iteritems()
+
+    def peek(self):
+        '''When the next occurrence of anything is due, or None.'''
+        self._discard_stale()
+        if self._heap:
+            return self._heap[0][0]
+
+    def _discard_stale(self):
+        heap = self._heap
+        while heap and self._next.get(heap[0][2]) != heap[0][3]:
+            heapq.heappop(heap)
+
+    def due(self, until):
+        '''Yield (timestamp, item) for every occurrence up to and including until.
+
+        Occurrences come out in time order. Each one is counted as done
+        as it is handed out.
+        '''
+        heap = self._heap
+        while True:
+            self._discard_stale()
+            if not heap or heap[0][0] > until:
+                return
+            due, _, item, n = heap[0]
+            self._next[item] = n + 1
+            heapq.heapreplace(heap, (occurrence(item.timestamp, item.interval, n + 1),
+                                     next(self._counter), item, n + 1))
+            yield due, item
+
+
+def _microseconds(delta):
+    return (delta.days * 86400 + delta.seconds) * 10**6 + delta.microseconds
+
+
+def last_before(start, interval, until):
+    '''The largest n with occurrence n at or before until, or -1 if none.
+
+    Plain day and month intervals are worked out directly; anything
+    else, hours and smaller included, is found by a galloping binary
+    search, since occurrences only ever move forward as n grows.
+    >>> start = datetime.datetime(2012, 1, 31, 9)
+    >>> last_before(start, relativedelta(months=1), datetime.datetime(2012, 4, 30, 9))
+    3
+    >>> last_before(start, relativedelta(months=1), datetime.datetime(2012, 4, 30, 8))
+    2
+    >>> last_before(start, relativedelta(weeks=2), datetime.datetime(2012, 3, 1))
+    2
+    >>> last_before(start, relativedelta(months=1, days=1), datetime.datetime(2012, 4, 3, 9))
+    2
+    >>> last_before(start, relativedelta(days=1), datetime.datetime(2012, 1, 1))
+    -1
+    >>> last_before(start, relativedelta(days=1, hours=12), datetime.datetime(2012, 2, 3, 21))
+    2
+    '''
+    if not interval:
+        raise ValueError("Can't repeat every %r" % (interval,))
+    if until < start:
+        return -1
+
+    months = interval.years * 12 + interval.months
+    plain = not (interval.hours or interval.minutes or interval.seconds or interval.microseconds
+                 or interval.leapdays)
+    if plain and interval.days and not months:
+        return _microseconds(until - start) // _microseconds(datetime.timedelta(days=interval.days))
+    if plain and months and not interval.days:
+        n = ((until.year - start.year) * 12 + until.month - start.month) // months
+        return n if occurrence(start, interval, n) <= until else n - 1
+
+    low, high = 0, 1
+    while occurrence(start, interval, high) <= until:
+        low, high = high, high * 2
+    while high - low > 1:
+        middle = (low + high) // 2
+        if occurrence(start, interval, middle) <= until:
+            low = middle
+        else:
+            high = middle
+    return low
+
+
+def count_between(start, interval, after, until, first=1):
+    '''How many occurrences numbered first or later fall after after, up to until.
+
+    >>> rent = datetime.datetime(2012, 1, 1)
+    >>> count_between(rent, relativedelta(months=1), datetime.datetime(2012, 1, 1), datetime.datetime(2042, 1, 1))
+    360
+    >>> count_between(rent, relativedelta(months=1), datetime.datetime(2011, 1, 1), datetime.datetime(2012, 6, 30), first=3)
+    3
+    '''
+    lowest = max(first, last_before(start, interval, after) + 1)
+    return max(0, last_before(start, interval, until) - lowest + 1)
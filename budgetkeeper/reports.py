@@ -0,0 +1,239 @@
+'''Reports over a whole ledger, worked out with NumPy.
+
+The transactions are copied once into parallel arrays: amounts in whole
+cents (int64), timestamps (datetime64), category and description codes,
+and direction. Every report is then grouped sums and running totals on
+those arrays. Sums of cents are exact, so the Decimals handed back are
+the same ones adding up the transactions one by one would give.
+
+Amounts finer than a cent, as a float like 49.99 turns into, aren't
+rounded: every amount is counted in units of the finest one instead,
+as Python integers if int64 could overflow. That's slower, but still
+exact.
+
+    >>> from budgetkeeper import Account
+    >>> account = Account()
+    >>> _ = account.add_budget('Coffee')
+    >>> _ = account.add_income(100, timestamp=datetime.datetime(2012, 1, 1))
+    >>> _ = account.parse_messages([('$3.50 coffee', datetime.datetime(2012, 1, 2)),
+    ...                             ('$4 coffee', datetime.datetime(2012, 2, 2)),
+    ...                             ('Paid $20 for a book', datetime.datetime(2012, 2, 3))])
+    >>> report = Report(account.transactions)
+    >>> report.spending_by_month()
+    {'Coffee': {datetime.date(2012, 1, 1): Decimal('3.50'), datetime.date(2012, 2, 1): Decimal('4.00')}}
+    >>> report.top_descriptions(1)
+    [('A book', Decimal('20.00'))]
+    >>> report.running_balance()[1]
+    [Decimal('100.00'), Decimal('96.50'), Decimal('92.50'), Decimal('72.50')]
+'''
+import datetime
+
+import numpy
+
+try:
+    from cDecimal import Decimal
+except ImportError:
+    from decimal import Decimal
+
+BUCKETS = {'D': 'datetime64[D]', 'M': 'datetime64[M]', 'Y': 'datetime64[Y]'}
+
+
+# Sums of int64 units up to this big can't overflow.
+INT64_LIMIT = 2 ** 62
+
+
+def to_cents(amount):
+    '''A Decimal amount as a whole number of cents.
+
+    >>> to_cents(Decimal('4.12')), to_cents(Decimal('100'))
+    (412, 10000)
+
+    Anything finer than a cent can't be counted in cents:
+    >>> to_cents(Decimal('0.005'))
+    Traceback (most recent call last):
+    ...
+    ValueError: 0.005 is not a whole number of cents
+    '''
+    cents = amount * 100
+    whole = int(cents)
+    if whole != cents:
+        raise ValueError('%s is not a whole number of cents' % amount)
+    return whole
+
+
+def to_units(amounts):
+    '''(array of integers, exponent) with each amount exactly integer * 10**exponent.
+
+    Whole cents are the usual case, and the fast one:
+    >>> to_units([Decimal('4.12'), Decimal('100')])
+    (array([  412, 10000]), -2)
+
+    Otherwise the unit is the finest amount's:
+    >>> to_units([Decimal('4.12'), Decimal('0.005')])
+    (array([4120,    5]), -3)
+    '''
+    try:
+        return numpy.fromiter((to_cents(amount) for amount in amounts), numpy.int64, len(amounts)), -2
+    except (ValueError, OverflowError):
+        pass
+    parts = [amount.as_tuple() for amount in amounts]
+    exponent = min([-2] + [part.exponent for part in parts])
+    units = []
+    for sign, digits, part_exponent in parts:
+        whole = int(''.join(map(str, digits))) * 10 ** (part_exponent - exponent)
+        units.append(-whole if sign else whole)
+    if max(abs(whole) for whole in units) * len(units) < INT64_LIMIT:
+        return numpy.array(units, numpy.int64), exponent
+    return numpy.array(units, object), exponent
+
+
+def from_units(units, exponent=-2):
+    '''A count of 10**exponent units back as a Decimal, exactly.
+
+    >>> from_units(350), from_units(15, -3)
+    (Decimal('3.50'), Decimal('0.015'))
+    '''
+    return Decimal('%dE%d' % (units, exponent))
+
+
+def _to_date(value):
+    return value.astype('datetime64[D]').astype(datetime.date)
+
+
+class Report(object):
+    '''Reports over a list of transactions, see the module docstring.'''
+    def __init__(self, transactions):
+        count = len(transactions)
+        # Amounts as whole numbers of 10**exponent, usually cents.
+        self.units, self.exponent = to_units([trans.amount for trans in transactions])
+        self.direction = numpy.fromiter((trans.direction for trans in transactions), numpy.int8, count)
+        self.timestamps = numpy.array([trans.timestamp for trans in transactions], dtype='datetime64[us]')
+
+        self.categories, self.category_codes = self._encode([trans.category for trans in transactions])
+        self.descriptions, self.description_codes = self._encode([trans.description for trans in transactions])
+
+    def _decimal(self, units):
+        return from_units(units, self.exponent)
+
+    @staticmethod
+    def _encode(values):
+        '''Turn a list of values into (distinct values, int32 code per item).'''
+        names, codes = [], {}
+        out = numpy.empty(len(values), numpy.int32)
+        for i, value in enumerate(values):
+            code = codes.get(value)
+            if code is None:
+                code = codes[value] = len(names)
+                names.append(value)
+            out[i] = code
+        return names, out
+
+    def _spent(self, category=None):
+        '''Mask of purchases, optionally only under one category.'''
+        mask = self.direction < 0
+        if category is not None:
+            if category not in self.categories:
+                return numpy.zeros_like(mask)
+            mask &= self.category_codes == self.categories.index(category)
+        return mask
+
+    def _buckets(self, freq, timestamps):
+        '''Start of the freq bucket holding each timestamp, as datetime64[D].
+
+        Weeks start on Mondays, like weekly budgets do.
+        '''
+        if freq == 'W':
+            days = timestamps.astype('datetime64[D]').astype(numpy.int64)
+            # 1970-01-01 was a Thursday.
+            return (days - (days + 3) % 7).astype('datetime64[D]')
+        return timestamps.astype(BUCKETS[freq]).astype('datetime64[D]')
+
+    @staticmethod
+    def _group_sum(keys, values):
+        '''Sum values by key, returning (sorted distinct keys, sums).'''
+        if not len(keys):
+            return keys, values
+        order = numpy.argsort(keys, kind='mergesort')
+        keys, values = keys[order], values[order]
+        starts = numpy.concatenate(([0], numpy.flatnonzero(keys[1:] != keys[:-1]) + 1))
+        return keys[starts], numpy.add.reduceat(values, starts)
+
+    def spending_by_category(self):
+        '''{category: total spent} for every category purchases went under.'''
+        mask = self._spent()
+        codes, sums = self._group_sum(self.category_codes[mask], self.units[mask])
+        return dict((self.categories[code], self._decimal(total)) for code, total in zip(codes, sums)
+                    if self.categories[code] is not None)
+
+    def spending_by_month(self, freq='M'):
+        '''{category: {bucket start date: total spent}}, monthly by default.
+
+        freq can also be 'D', 'W' or 'Y' for days, weeks and years.
+        '''
+        mask = self._spent()
+        buckets = self._buckets(freq, self.timestamps[mask]).astype(numpy.int64)
+        codes = self.category_codes[mask].astype(numpy.int64)
+        # One integer key per (category, bucket) pair.
+        offset = buckets.min() if len(buckets) else 0
+        width = buckets.max() - offset + 1 if len(buckets) else 1
+        keys, sums = self._group_sum(codes * width + (buckets - offset), self.units[mask])
+
+        totals = {}
+        for key, total in zip(keys, sums):
+            category = self.categories[key // width]
+            if category is None:
+                continue
+            day = numpy.datetime64(int(key % width + offset), 'D')
+            totals.setdefault(category, {})[_to_date(day)] = self._decimal(total)
+        return totals
+
+    def series(self, freq='D', category=None):
+        '''Spending per freq bucket as (dates, totals), empty buckets included.'''
+        every, totals = self._series(freq, category)
+        return ([_to_date(numpy.datetime64(int(day), 'D')) for day in every],
+                [self._decimal(total) for total in totals])
+
+    def _series(self, freq, category):
+        '''series as (days since the epoch, totals in units).'''
+        mask = self._spent(category)
+        if not mask.any():
+            return [], numpy.zeros(0, self.units.dtype)
+        buckets = self._buckets(freq, self.timestamps[mask])
+        keys, sums = self._group_sum(buckets.astype(numpy.int64), self.units[mask])
+        if freq in ('D', 'W'):
+            step = 7 if freq == 'W' else 1
+            every = numpy.arange(keys[0], keys[-1] + 1, step)
+        else:
+            first, last = keys.astype('datetime64[D]').astype(BUCKETS[freq])[[0, -1]]
+            every = numpy.arange(first, last + 1).astype('datetime64[D]').astype(numpy.int64)
+        totals = numpy.zeros(len(every), self.units.dtype)
+        totals[numpy.searchsorted(every, keys)] = sums
+        return every, totals
+
+    def rolling_average(self, days=7, category=None):
+        '''Average daily spending over the trailing window, as (dates, averages).
+
+        Days before a full window has passed average over what there is.
+        '''
+        every, totals = self._series('D', category)
+        dates = [_to_date(numpy.datetime64(int(day), 'D')) for day in every]
+        running = numpy.concatenate((numpy.zeros(1, totals.dtype), numpy.cumsum(totals)))
+        ends = numpy.arange(1, len(totals) + 1)
+        starts = numpy.maximum(ends - days, 0)
+        window = running[ends] - running[starts]
+        return dates, [self._decimal(total) / (end - start) for total, start, end in zip(window, starts, ends)]
+
+    def top_descriptions(self, n=10):
+        '''The n descriptions with the most spent on them, as (description, total).'''
+        mask = self._spent()
+        codes, sums = self._group_sum(self.description_codes[mask], self.units[mask])
+        # Biggest first; ties go to the description seen first.
+        order = numpy.lexsort((codes, -sums))[:n]
+        return [(self.descriptions[codes[i]], self._decimal(sums[i])) for i in order]
+
+    def running_balance(self):
+        '''The balance after each transaction in time order, as (timestamps, balances).'''
+        order = numpy.argsort(self.timestamps, kind='mergesort')
+        balances = numpy.cumsum(self.units[order] * self.direction[order])
+        return ([stamp.astype(datetime.datetime) for stamp in self.timestamps[order]],
+                [self._decimal(total) for total in balances])
@@ -1,49 +1,153 @@
-def load_settings():
-    '''Get the settings files from across the filesystem.'''
-    import os
+'''budget-keeper.conf, read the first time a setting is asked for.
+
+Settings are named section_key in capitals, so "port" under [imap] is
+settings.IMAP_PORT. The budget-keeper.conf next to this file holds the
+defaults; any budget-keeper.conf in the XDG config directories is read
+over the top of it. Nothing is read until a setting is first used, and
+after that the values are plain attributes.
+
+Each known setting is read as its proper type, and a value that isn't
+one is an error rather than quietly becoming a string:
+>>> settings = Settings(paths=[])
+>>> settings.IMAP_PORT, settings.IMAP_LABEL, settings.PARSE_WORKERS
+(993, False, 1)
+
+Settings can be set too, which tests make use of. A setting set before
+the files are read keeps its value when they are.
+
+Importing this module gets you the Settings for this process.
+'''
+import os
+import sys
+import ConfigParser
+
+# The defaults, shipped alongside.
+DEFAULTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'budget-keeper.conf')
+
+
+def _label(config, section, key):
+    # "no" for the inbox, or a mailbox name.
+    try:
+        return config.getboolean(section, key)
+    except ValueError:
+        return config.get(section, key)
+
+
+def _guess(config, section, key):
+    for get in (config.getint, config.getboolean):
+        try:
+            return get(section, key)
+        except ValueError:
+            pass
+    return config.get(section, key)
+
+
+# Ways of reading a setting, and what to call it when it can't be read that way.
+KINDS = {
+    'str': (ConfigParser.RawConfigParser.get, 'string'),
+    'int': (ConfigParser.RawConfigParser.getint, 'whole number'),
+    'bool': (ConfigParser.RawConfigParser.getboolean, 'yes or no'),
+    'label': (_label, 'mailbox name or no'),
+}
+
+# The kind of each setting. Others are taken as a number, a yes/no or a
+# string, whichever they look like.
+TYPES = {
+    'AUTHENTICATION_EMAIL': 'str',
+    'AUTHENTICATION_PASSWORD': 'str',
+    'IMAP_SERVER': 'str',
+    'IMAP_USE_SSL': 'bool',
+    'IMAP_PORT': 'int',
+    'IMAP_ENABLED': 'bool',
+    'IMAP_LABEL': 'label',
+    'IMAP_IDLE': 'bool',
+    'IMAP_POLL_INTERVAL': 'int',
+    'PARSE_WORKERS': 'int',
+    'TENANTS_WORKERS': 'int',
+    'TENANTS_CONNECTIONS_PER_SERVER': 'int',
+    'INSTRUMENT_ENABLED': 'bool',
+    'INSTRUMENT_PROFILE': 'str',
+}
+
+
+def config_paths():
+    '''Every budget-keeper.conf that might be read, least important first.'''
     import xdg.BaseDirectory as bd
-    import ConfigParser
-    import sys
-    thismodule = sys.modules[__name__]
-
-    config = ConfigParser.SafeConfigParser()
-    paths = []
-    for directory in reversed(bd.xdg_config_dirs):
-        path = os.path.join(directory, 'budget-keeper', 'budget-keeper.conf')
-        paths.append(path)
-
-        if not os.path.exists(path):
-            # If the directory does not exist, make it
-            if not os.path.exists(os.path.dirname(path)):
-                try:
-                    os.makedirs(os.path.dirname(path))
-                except OSError:
-                    # Don't have permissions.
-                    pass
+    return [os.path.join(directory, 'budget-keeper', 'budget-keeper.conf')
+            for directory in reversed(bd.xdg_config_dirs)]
+
+
+def user_config_path():
+    '''The budget-keeper.conf in the user's own config directory.'''
+    import xdg.BaseDirectory as bd
+    return os.path.join(bd.xdg_config_home, 'budget-keeper', 'budget-keeper.conf')
+
+
+def install_config():
+    '''Copy the default budget-keeper.conf to the user's config directory
+    for them to fill in, unless there's one there already.'''
+    import shutil
+    path = user_config_path()
+    if os.path.exists(path):
+        return
+    try:
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        shutil.copy(DEFAULTS, path)
+    except (IOError, OSError):
+        # Don't have permissions.
+        pass
+
 
-            # If there is no config there, copy the default to it.
-            if not os.path.exists(path):
-                import shutil
-                source = os.path.join(os.path.dirname(thismodule.__file__), 'budget-keeper.conf')
+class Settings(object):
+    '''Every setting, as an attribute, read from paths when first wanted.
 
+    Without paths, the XDG config directories are searched.
+    '''
+    def __init__(self, paths=None):
+        self._paths = paths
+        self._loaded = False
+
+    def __getattr__(self, name):
+        # Only called for attributes that aren't there yet.
+        if name.startswith('_') or self._loaded:
+            raise AttributeError(name)
+        self.load()
+        return getattr(self, name)
+
+    def load(self):
+        '''Read the settings files, keeping any settings already set by hand.'''
+        paths = config_paths() if self._paths is None else self._paths
+        config = ConfigParser.SafeConfigParser()
+        config.read([DEFAULTS] + list(paths))
+
+        for section in config.sections():
+            for key in config.options(section):
+                setting = '_'.join((section, key)).upper()
+                if setting in self.__dict__:
+                    continue
+                if setting not in TYPES:
+                    setattr(self, setting, _guess(config, section, key))
+                    continue
+                get, kind = KINDS[TYPES[setting]]
                 try:
-                    shutil.copy(source, path)
-                except IOError:
-                    # No permissions again.
-                    pass
-
-    config.read(paths)
-
-    for section in config.sections():
-        for key, value in config.items(section):
-            try:
-                value = config.getboolean(section, key)
-                value = config.getint(section, key)
-            except ValueError:
-                # Just use whatever it was last.
-                pass
-
-            setting = '_'.join((section, key)).upper()
-            setattr(thismodule, setting, value)
-
-load_settings()
+                    setattr(self, setting, get(config, section, key))
+                except ValueError:
+                    raise ValueError('%s=%s under [%s] in budget-keeper.conf should be a %s'
+                                     % (key, config.get(section, key), section, kind))
+        self._loaded = True
+
+    def __repr__(self):
+        return '<Settings from %s>' % ('the XDG config directories' if self._paths is None else self._paths)
+
+
+# Swap this module for its Settings, so that settings.IMAP_PORT and the
+# like can wait for the first time they're used. Keep hold of the module,
+# or Python 2 would clear out its globals when it's dropped.
+_settings = Settings()
+_settings._module = sys.modules[__name__]
+_settings.__name__, _settings.__file__, _settings.__doc__ = __name__, __file__, __doc__
+_settings.Settings = Settings
+_settings.install_config = install_config
+_settings.user_config_path = user_config_path
+sys.modules[__name__] = _settings
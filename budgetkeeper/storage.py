@@ -0,0 +1,224 @@
+'''Keep an Account's ledger on disk in SQLite.
+
+Next to the transactions themselves the database holds the running
+balance and the per-category daily spending totals, kept up to date on
+every commit. Opening an account only reads those and the budgets; the
+transactions are read the first time someone asks for them.
+
+Writes are queued and committed together, a batch at a time.
+'''
+import os
+import sqlite3
+import datetime
+
+from formats import dump_interval, load_interval, dump_timestamp, load_timestamp
+
+try:
+    from cDecimal import Decimal
+except ImportError:
+    from decimal import Decimal
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    amount TEXT NOT NULL,
+    description TEXT,
+    timestamp TEXT NOT NULL,
+    category TEXT,
+    interval TEXT
+);
+CREATE INDEX IF NOT EXISTS transactions_timestamp ON transactions (timestamp);
+CREATE INDEX IF NOT EXISTS transactions_category ON transactions (category, timestamp);
+
+CREATE TABLE IF NOT EXISTS budgets (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    interval TEXT,
+    "limit" TEXT NOT NULL,
+    description TEXT
+);
+
+CREATE TABLE IF NOT EXISTS spending (
+    category TEXT NOT NULL,
+    day TEXT NOT NULL,
+    amount TEXT NOT NULL,
+    PRIMARY KEY (category, day)
+);
+
+CREATE TABLE IF NOT EXISTS recurring (
+    id INTEGER PRIMARY KEY,
+    next INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+'''
+
+
+def default_path():
+    '''Where the ledger lives, under the XDG data directory.'''
+    import xdg.BaseDirectory as bd
+    return os.path.join(bd.save_data_path('budget-keeper'), 'ledger.db')
+
+
+class Ledger(object):
+    '''Transactions, budgets and running totals in an SQLite database.
+
+    Changes are held back until commit(), or until commit_every of them
+    have queued up, so a batch of writes costs one disk sync.
+    '''
+    def __init__(self, path, commit_every=1000):
+        self.path = path
+        self.commit_every = commit_every
+        # The web UI reads and writes the ledger from a worker thread
+        # rather than the one that opened it, one thread at a time.
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        # Hand back the same plain strings the rest of the account uses.
+        self.db.text_factory = str
+        self.db.executescript(SCHEMA)
+
+        self._ids = {}          # transaction -> row id
+        self._next_id = (self.db.execute('SELECT max(id) FROM transactions').fetchone()[0] or 0) + 1
+        self._pending = []      # (sql, params) waiting for the next commit
+        self._days = set()      # (category, day) buckets to write out
+
+    def close(self):
+        self.db.close()
+
+    INSERT = 'INSERT INTO transactions (id, kind, amount, description, timestamp, category, interval) VALUES (?, ?, ?, ?, ?, ?, ?)'
+    UPDATE = 'UPDATE transactions SET kind=?, amount=?, description=?, timestamp=?, category=?, interval=? WHERE id=?'
+    DELETE = 'DELETE FROM transactions WHERE id=?'
+
+    def _row(self, trans):
+        return (trans.__class__.__name__, str(trans.amount), trans.description,
+                dump_timestamp(trans.timestamp), trans.category,
+                dump_interval(getattr(trans, 'interval', None)))
+
+    def _touch(self, trans):
+        if trans.direction < 0 and trans.category is not None:
+            self._days.add((trans.category, trans.timestamp.date()))
+
+    def _queue(self, sql, params):
+        self._pending.append((sql, params))
+
+    def add(self, transactions, track=True):
+        '''Queue transactions to be inserted.
+
+        Without track, only recurring ones are remembered for later
+        updates and removals, so a bulk import needn't hold on to them.
+        '''
+        for trans in transactions:
+            if track or getattr(trans, 'interval', None) is not None:
+                self._ids[trans] = self._next_id
+            self._queue(self.INSERT, (self._next_id,) + self._row(trans))
+            self._next_id += 1
+            self._touch(trans)
+
+    def remove(self, trans):
+        id = self._ids.pop(trans)
+        self._queue(self.DELETE, (id,))
+        if getattr(trans, 'interval', None) is not None:
+            self._queue('DELETE FROM recurring WHERE id=?', (id,))
+        self._touch(trans)
+
+    def before_update(self, trans):
+        '''Note where trans was, so its old bucket gets written out too.'''
+        self._touch(trans)
+
+    def update(self, trans):
+        self._queue(self.UPDATE, self._row(trans) + (self._ids[trans],))
+        self._touch(trans)
+
+    def save_progress(self, progress):
+        '''Note the next occurrence due for each (recurring transaction, n).'''
+        for trans, n in progress:
+            self._queue('INSERT OR REPLACE INTO recurring (id, next) VALUES (?, ?)', (self._ids[trans], n))
+
+    def progress(self):
+        '''{row id: next occurrence} for recurring transactions that have recurred.'''
+        return dict(self.db.execute('SELECT id, next FROM recurring'))
+
+    def id(self, trans):
+        return self._ids[trans]
+
+    def add_budget(self, budget):
+        self._queue('INSERT INTO budgets (name, interval, "limit", description) VALUES (?, ?, ?, ?)',
+                    (budget.name, dump_interval(budget.interval), str(budget.limit), budget.description))
+
+    def due(self):
+        '''Whether enough has queued up to be worth committing.'''
+        return len(self._pending) >= self.commit_every
+
+    def commit(self, balance, spending):
+        '''Write out everything queued, along with the account's totals.'''
+        if not self._pending and not self._days:
+            return
+        days = [(category, day.isoformat(), str(spending.day(category, day)))
+                for category, day in self._days]
+        with self.db:
+            for sql, params in self._pending:
+                self.db.execute(sql, params)
+            self.db.executemany('INSERT OR REPLACE INTO spending (category, day, amount) VALUES (?, ?, ?)', days)
+            self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('balance', ?)", (str(balance),))
+        self._pending = []
+        self._days = set()
+
+    def meta(self, key):
+        row = self.db.execute("SELECT value FROM meta WHERE key=?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        '''Save a value with the next commit.'''
+        self._queue("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def balance(self):
+        row = self.db.execute("SELECT value FROM meta WHERE key='balance'").fetchone()
+        return Decimal(row[0]) if row else Decimal(0)
+
+    def budgets(self):
+        '''Yield (name, interval, limit, description) in the order they were added.'''
+        for name, interval, limit, description in self.db.execute(
+                'SELECT name, interval, "limit", description FROM budgets ORDER BY id'):
+            yield name, load_interval(interval), Decimal(limit), description
+
+    def spending(self):
+        '''Yield (category, day, amount) for every non-empty day bucket.'''
+        for category, day, amount in self.db.execute('SELECT category, day, amount FROM spending'):
+            amount = Decimal(amount)
+            if amount:
+                yield category, datetime.datetime.strptime(day, '%Y-%m-%d').date(), amount
+
+    def transactions(self, kinds):
+        '''Read every transaction back, in the order they were added.
+
+        kinds maps the class names stored in the database to classes.
+        Transactions already handed out since the ledger was opened come
+        back as the very same objects, so they can still be updated and
+        removed.
+        '''
+        known = dict((id, trans) for trans, id in self._ids.iteritems())
+        transactions = []
+        for id, trans in self._rows(kinds):
+            trans = known.get(id, trans)
+            self._ids[trans] = id
+            transactions.append(trans)
+        return transactions
+
+    def iter_transactions(self, kinds):
+        '''Yield every transaction in the order they were added, without
+        keeping hold of them, so they can't be updated or removed.'''
+        for id, trans in self._rows(kinds):
+            yield trans
+
+    def _rows(self, kinds):
+        for id, kind, amount, description, timestamp, category, interval in self.db.execute(
+                'SELECT id, kind, amount, description, timestamp, category, interval FROM transactions ORDER BY id'):
+            cls = kinds[kind]
+            if interval is not None:
+                trans = cls(Decimal(amount), description, load_timestamp(timestamp), category, load_interval(interval))
+            else:
+                trans = cls(Decimal(amount), description, load_timestamp(timestamp), category)
+            yield id, trans
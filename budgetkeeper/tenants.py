@@ -0,0 +1,310 @@
+'''Run budget-keeper for many people from one process.
+
+Each tenant has a mailbox and a ledger of their own. They're listed in
+tenants.conf, next to budget-keeper.conf, a section each:
+
+    [alice]
+    email=alice@example.com
+    password=hunter2
+    ; Anything left out comes from the [imap] section of budget-keeper.conf.
+    server=imap.example.com
+
+Each tenant's ledger and sync state live in a directory of their own,
+under the data directory.
+
+sync_tenants() syncs them all at once on a thread pool. Connections
+come from a ConnectionPool, which keeps them logged in between syncs
+and caps how many are open to any one server. Tenants are worked
+through a server at a time, in as many lanes as that server allows, so
+a slow server only ties up its own lanes.
+'''
+import os
+import socket
+import imaplib
+import threading
+import contextlib
+import collections
+import ConfigParser
+
+from concurrent.futures import ThreadPoolExecutor
+
+import settings
+from budgetkeeper import Account, IngestSummary
+from get_mail import MailConfig, SyncState, connect, fetch_batches
+
+
+class Tenant(object):
+    '''One person's mailbox, and where their ledger is kept.'''
+    def __init__(self, name, mail, directory):
+        self.name = name
+        self.mail = mail
+        self.directory = directory
+
+    @property
+    def ledger_path(self):
+        return os.path.join(self.directory, 'ledger.db')
+
+    @property
+    def state_path(self):
+        return os.path.join(self.directory, 'imap-state.json')
+
+    def __repr__(self):
+        return 'Tenant(%r, %r)' % (self.name, self.mail.mailbox)
+
+
+def tenants_path():
+    '''Where tenants.conf lives, under the XDG config directory.'''
+    import xdg.BaseDirectory as bd
+    return os.path.join(bd.xdg_config_home, 'budget-keeper', 'tenants.conf')
+
+
+def data_directory():
+    '''Where tenants' ledgers go, under the XDG data directory.'''
+    import xdg.BaseDirectory as bd
+    return bd.save_data_path('budget-keeper', 'tenants')
+
+
+def load_tenants(path=None, directory=None):
+    '''Read the tenants listed in tenants.conf.
+
+    Settings a tenant leaves out are taken from budget-keeper.conf.
+    '''
+    config = ConfigParser.SafeConfigParser()
+    config.read(path or tenants_path())
+    if directory is None:
+        directory = data_directory()
+
+    tenants = []
+    for name in config.sections():
+        if name in (os.curdir, os.pardir) or os.sep in name:
+            raise ValueError('Tenant name %r is not usable as a directory name' % name)
+
+        def get(key, default, parse=config.get):
+            return parse(name, key) if config.has_option(name, key) else default
+
+        def get_label(section, key):
+            # "no" for the inbox, like budget-keeper.conf.
+            try:
+                return config.getboolean(section, key)
+            except ValueError:
+                return config.get(section, key)
+
+        mail = MailConfig(email=config.get(name, 'email'),
+                          password=config.get(name, 'password'),
+                          server=get('server', settings.IMAP_SERVER),
+                          port=get('port', settings.IMAP_PORT, config.getint),
+                          use_ssl=get('use_ssl', settings.IMAP_USE_SSL, config.getboolean),
+                          label=get('label', settings.IMAP_LABEL, get_label))
+        tenants.append(Tenant(name, mail, os.path.join(directory, name)))
+    return tenants
+
+
+class PooledConnection(object):
+    '''A logged in IMAP connection, and which mailbox it has selected.'''
+    def __init__(self, mail, label, uidvalidity):
+        self.mail = mail
+        self.label = label
+        self.uidvalidity = uidvalidity
+        self.reused = False
+
+    def select(self, label):
+        result, data = self.mail.select(label or "inbox")
+        if result != 'OK':
+            raise self.mail.error('Could not select %r: %r' % (label, data))
+        self.label = label
+        self.uidvalidity = self.mail.response('UIDVALIDITY')[1][-1]
+
+    def close(self):
+        try:
+            self.mail.logout()
+        except (imaplib.IMAP4.error, socket.error):
+            pass
+
+
+class ConnectionPool(object):
+    '''Logged in IMAP connections, kept for reuse.
+
+    Connections are shared by everyone with the same server and
+    credentials, reselecting the mailbox if need be. No more than
+    per_server connections to a server are ever open at once; asking
+    for another waits for one to come back, and an idle connection to
+    that server is logged out to make room for a new login.
+    '''
+    def __init__(self, per_server=4, connect=connect):
+        self.per_server = per_server
+        self.connect = connect
+        self.opened = 0
+        self.reused = 0
+        self._lock = threading.Lock()
+        self._limits = {}
+        self._open = collections.Counter()
+        # (server, port) -> {login: [idle connections]}, least recently used first.
+        self._idle = collections.defaultdict(collections.OrderedDict)
+
+    @staticmethod
+    def _login(config):
+        return config._replace(label=None)
+
+    def _limit(self, server):
+        with self._lock:
+            limit = self._limits.get(server)
+            if limit is None:
+                limit = self._limits[server] = threading.BoundedSemaphore(self.per_server)
+            return limit
+
+    def _checkout(self, server, login):
+        '''An idle connection for login, or None, plus any idle one to close for room.'''
+        with self._lock:
+            idle = self._idle[server]
+            connections = idle.get(login)
+            if connections:
+                connection = connections.pop()
+                if not connections:
+                    del idle[login]
+                self.reused += 1
+                return connection, None
+            self.opened += 1
+            if self._open[server] < self.per_server:
+                self._open[server] += 1
+                return None, None
+            # We hold one of the per_server turns, so at least one of the
+            # open connections is sitting idle: log it out to make room.
+            oldest = next(iter(idle))
+            victim = idle[oldest].pop(0)
+            if not idle[oldest]:
+                del idle[oldest]
+            return None, victim
+
+    def _checkin(self, server, login, connection):
+        with self._lock:
+            idle = self._idle[server]
+            connections = idle.pop(login, [])
+            connections.append(connection)
+            # Most recently used goes to the back.
+            idle[login] = connections
+
+    def _closed(self, server):
+        with self._lock:
+            self._open[server] -= 1
+
+    @contextlib.contextmanager
+    def connection(self, config):
+        '''A PooledConnection with config's mailbox selected.'''
+        server, login = (config.server, config.port), self._login(config)
+        limit = self._limit(server)
+        limit.acquire()
+        try:
+            connection, victim = self._checkout(server, login)
+            try:
+                if victim is not None:
+                    victim.close()
+                if connection is None:
+                    mail = self.connect(config)
+                    connection = PooledConnection(mail, config.label, mail.response('UIDVALIDITY')[1][-1])
+                else:
+                    connection.reused = True
+                    if connection.label != config.label:
+                        connection.select(config.label)
+                yield connection
+            except BaseException:
+                # Whatever went wrong, it may have left the connection
+                # part way through a command, so it isn't reused.
+                if connection is not None:
+                    connection.close()
+                self._closed(server)
+                raise
+            self._checkin(server, login, connection)
+        finally:
+            limit.release()
+
+    def close(self):
+        '''Log out of every idle connection.'''
+        with self._lock:
+            connections = [connection for idle in self._idle.values()
+                           for pooled in idle.values() for connection in pooled]
+            self._idle.clear()
+            self._open.clear()
+        for connection in connections:
+            connection.close()
+
+
+def sync_tenant(tenant, pool, batch_size=200):
+    '''Add a tenant's new mail to their ledger, returning an IngestSummary.'''
+    if not os.path.isdir(tenant.directory):
+        os.makedirs(tenant.directory)
+    account = Account(tenant.ledger_path)
+    state = SyncState.load(tenant.state_path)
+    summary = IngestSummary()
+    try:
+        while True:
+            reused = False
+            try:
+                with pool.connection(tenant.mail) as connection:
+                    reused = connection.reused
+                    for batch in fetch_batches(connection.mail, state, tenant.mail.email, batch_size,
+                                               connection.uidvalidity, tenant.mail.mailbox):
+                        summary.merge(account.parse_messages(batch))
+                        state.save()
+                return summary
+            except (imaplib.IMAP4.abort, socket.error):
+                # A pooled connection can have been dropped by the server
+                # while it sat idle. Only a fresh one failing is an error.
+                if not reused:
+                    raise
+    finally:
+        account.close()
+
+
+def sync_tenants(tenants, pool=None, workers=32, batch_size=200):
+    '''Sync every tenant at once. Returns {name: IngestSummary or the error}.
+
+    Each server gets at most pool.per_server lanes, each lane syncing
+    that server's tenants one after another.
+    '''
+    own_pool = pool is None
+    if own_pool:
+        pool = ConnectionPool()
+
+    by_server = collections.OrderedDict()
+    for tenant in tenants:
+        by_server.setdefault((tenant.mail.server, tenant.mail.port), collections.deque()).append(tenant)
+
+    results = {}
+
+    def lane(queue):
+        while True:
+            try:
+                tenant = queue.popleft()
+            except IndexError:
+                return
+            try:
+                results[tenant.name] = sync_tenant(tenant, pool, batch_size)
+            except Exception, error:
+                # One tenant's broken ledger or mailbox is theirs alone.
+                results[tenant.name] = error
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        # Round robin the servers' lanes, so none waits on all of another's.
+        lanes = []
+        for i in range(pool.per_server):
+            lanes.extend(queue for queue in by_server.values() if len(queue) > i)
+        for future in [executor.submit(lane, queue) for queue in lanes]:
+            future.result()
+    finally:
+        executor.shutdown()
+        if own_pool:
+            pool.close()
+    return results
+
+
+def main():
+    '''Sync every tenant in tenants.conf once.'''
+    tenants = load_tenants()
+    results = sync_tenants(tenants, workers=settings.TENANTS_WORKERS,
+                           pool=ConnectionPool(settings.TENANTS_CONNECTIONS_PER_SERVER))
+    for tenant in tenants:
+        print tenant.name, results[tenant.name]
+
+if __name__ == "__main__":
+    main()
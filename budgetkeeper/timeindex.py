@@ -0,0 +1,188 @@
+'''Transactions in timestamp order, for range queries and paging.
+
+The ledger itself is in the order transactions were added, which isn't
+time order when an email turns up late. A TimeIndex keeps them sorted
+in a list of short sorted lists, each no longer than a couple of
+thousand entries, with the largest key of each list alongside. Finding
+a spot is a bisect over those maxima and then within one short list,
+so a range query costs O(log n + k). An out of order insert only
+shifts the rest of one short list, never re-sorts the whole lot.
+
+Entries are keyed on (timestamp, sequence number), so two transactions
+at the same moment still have an order, and a (timestamp, sequence)
+pair makes a stable cursor for paging.
+'''
+import bisect
+import datetime
+import itertools
+
+from formats import dump_timestamp
+
+CURSOR_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+def dump_cursor(key):
+    '''Turn an index key into a cursor string, and back with load_cursor.
+    >>> dump_cursor((datetime.datetime(2012, 1, 1, 9, 30), 17))
+    '2012-01-01T09:30:00.000000~17'
+    >>> load_cursor(dump_cursor((datetime.datetime(2012, 1, 1, 9, 30), 17)))
+    (datetime.datetime(2012, 1, 1, 9, 30), 17)
+    >>> load_cursor(dump_cursor((datetime.datetime(1899, 12, 31), 3)))
+    (datetime.datetime(1899, 12, 31, 0, 0), 3)
+    '''
+    return '%s~%d' % (dump_timestamp(key[0]), key[1])
+
+
+def load_cursor(cursor):
+    '''Parse a cursor, raising ValueError if it's not one of ours.'''
+    timestamp, _, sequence = cursor.partition('~')
+    return datetime.datetime.strptime(timestamp, CURSOR_FORMAT), int(sequence)
+
+
+class TimeIndex(object):
+    '''Transactions sorted by timestamp.
+
+    >>> class Trans(object):
+    ...     def __init__(self, day): self.timestamp = datetime.datetime(2012, 1, day)
+    ...     def __repr__(self): return 'Trans(%d)' % self.timestamp.day
+    >>> index = TimeIndex([Trans(1), Trans(5), Trans(3)])
+    >>> late = Trans(2)
+    >>> index.add(late)
+    >>> list(index.range())
+    [Trans(1), Trans(2), Trans(3), Trans(5)]
+    >>> list(index.range(datetime.datetime(2012, 1, 2), datetime.datetime(2012, 1, 5)))
+    [Trans(2), Trans(3)]
+    >>> list(index.range(reverse=True))
+    [Trans(5), Trans(3), Trans(2), Trans(1)]
+
+    Paging hands back a cursor for where to carry on from:
+    >>> page, cursor = index.page(limit=3)
+    >>> page, index.page(cursor=cursor, limit=3)
+    ([Trans(1), Trans(2), Trans(3)], ([Trans(5)], None))
+    '''
+    # Lists are split once they grow past twice this.
+    LOAD = 1000
+
+    def __init__(self, transactions=()):
+        self._counter = itertools.count()
+        self._keys = {}
+        entries = []
+        for trans in transactions:
+            key = self._keys[trans] = (trans.timestamp, next(self._counter))
+            entries.append(key + (trans,))
+        entries.sort(key=lambda entry: entry[:2])
+        self._lists = [entries[i:i + self.LOAD] for i in range(0, len(entries), self.LOAD)]
+        self._maxes = [entries[-1][:2] for entries in self._lists]
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, trans):
+        return trans in self._keys
+
+    def add(self, trans):
+        key = self._keys[trans] = (trans.timestamp, next(self._counter))
+        entry = key + (trans,)
+        lists, maxes = self._lists, self._maxes
+        if not lists:
+            lists.append([entry])
+            maxes.append(key)
+            return
+
+        i = bisect.bisect_left(maxes, key)
+        if i == len(maxes):
+            # The usual case, newest yet: goes on the end.
+            i -= 1
+            lists[i].append(entry)
+            maxes[i] = key
+        else:
+            bisect.insort(lists[i], entry)
+
+        if len(lists[i]) > 2 * self.LOAD:
+            half = lists[i][self.LOAD:]
+            del lists[i][self.LOAD:]
+            lists.insert(i + 1, half)
+            maxes[i] = lists[i][-1][:2]
+            maxes.insert(i + 1, half[-1][:2])
+
+    def remove(self, trans):
+        key = self._keys.pop(trans)
+        i = bisect.bisect_left(self._maxes, key)
+        entries = self._lists[i]
+        del entries[bisect.bisect_left(entries, key)]
+        if entries:
+            self._maxes[i] = entries[-1][:2]
+        else:
+            del self._lists[i]
+            del self._maxes[i]
+
+    def move(self, trans):
+        '''Re-file trans after its timestamp changed.'''
+        self.remove(trans)
+        self.add(trans)
+
+    def key(self, trans):
+        return self._keys[trans]
+
+    def _position(self, key):
+        '''(list, offset) of the first entry not before key.'''
+        i = bisect.bisect_left(self._maxes, key)
+        if i == len(self._maxes):
+            return i, 0
+        return i, bisect.bisect_left(self._lists[i], key)
+
+    def _entries(self, start=None, end=None, after=None, reverse=False):
+        '''Yield entries from start up to (not including) end, past the after key.'''
+        low = (start,) if start is not None else None
+        high = (end,) if end is not None else None
+        if after is not None:
+            if reverse:
+                high = min(high, after) if high is not None else after
+            else:
+                bound = (after[0], after[1] + 1)
+                low = max(low, bound) if low is not None else bound
+
+        lists = self._lists
+        if not reverse:
+            i, j = self._position(low) if low is not None else (0, 0)
+            while i < len(lists):
+                entries = lists[i]
+                for entry in itertools.islice(entries, j, None):
+                    if high is not None and entry >= high:
+                        return
+                    yield entry
+                i, j = i + 1, 0
+        else:
+            # Walk back from just before the first entry at or past high.
+            i, j = self._position(high) if high is not None else (len(lists), 0)
+            while True:
+                if j == 0:
+                    i -= 1
+                    if i < 0:
+                        return
+                    j = len(lists[i])
+                entries = lists[i]
+                for k in xrange(j - 1, -1, -1):
+                    entry = entries[k]
+                    if low is not None and entry < low:
+                        return
+                    yield entry
+                j = 0
+
+    def range(self, start=None, end=None, reverse=False):
+        '''Transactions from start up to, but not including, end.'''
+        for entry in self._entries(start, end, reverse=reverse):
+            yield entry[2]
+
+    def page(self, cursor=None, limit=50, start=None, end=None, reverse=False):
+        '''Up to limit transactions past cursor, and the cursor for the next page.
+
+        The next cursor is None once there's nothing more. Pages always
+        hold at least one transaction, if there are any left.
+        '''
+        limit = max(limit, 1)
+        after = load_cursor(cursor) if cursor else None
+        entries = list(itertools.islice(self._entries(start, end, after, reverse), limit + 1))
+        more = len(entries) > limit
+        entries = entries[:limit]
+        return [entry[2] for entry in entries], dump_cursor(entries[-1][:2]) if more else None
@@ -1,25 +1,189 @@
 #!/bin/env python
-'''This script runs a web process to interact with your Account.'''
+'''This script runs a web process to interact with your Account.
+
+One Account is opened when the server starts and shared by every
+request. Balance and budget totals come straight from its running
+totals, read from one snapshot of the account so they agree with each
+other even while a sync is writing to it, and the JSON for them is
+cached until the account changes. Anything that might touch the disk
+or the mail server runs on a worker thread, so the IOLoop is never
+stuck waiting on it.
+
+/metrics has the counters and stage timings from budgetkeeper.instrument,
+including how long each kind of request took, once it is enabled.
+'''
+import json
+import datetime
+
+from concurrent.futures import ThreadPoolExecutor
 
 from budgetkeeper import Account
+from budgetkeeper import instrument, settings
+from budgetkeeper.storage import default_path
+from budgetkeeper.formats import INTERVAL_FIELDS, interval_fields
+from budgetkeeper.timeindex import load_cursor
 
+import tornado.gen
 import tornado.ioloop
 import tornado.web
 
+PAGE_SIZE = 50
+
+
+def transaction_json(trans):
+    data = {'kind': trans.__class__.__name__,
+            'amount': str(trans.amount),
+            'description': trans.description,
+            'category': trans.category,
+            'timestamp': trans.timestamp.isoformat()}
+    interval = getattr(trans, 'interval', None)
+    if interval is not None:
+        data['interval'] = dict.fromkeys(INTERVAL_FIELDS, 0)
+        data['interval'].update(interval_fields(interval))
+    return data
+
+
 class AccountHandler(tornado.web.RequestHandler):
+    def initialize(self, account, executor, cache):
+        self.account = account
+        self.executor = executor
+        self.cache = cache
+
+    def write_json(self, data):
+        self.set_header('Content-Type', 'application/json')
+        self.write(data if isinstance(data, str) else json.dumps(data))
+
+    def cached(self, key, build, daily=False):
+        '''JSON from build(snapshot of the account), reused until the account next changes.
+
+        With daily, only until the date changes too, for anything that
+        rolls over with it. One entry per key, so the cache stays small.
+        '''
+        snapshot = self.account.snapshot()
+        today = datetime.date.today() if daily else None
+        hit = self.cache.get(key)
+        if hit is None or hit[:2] != (snapshot.version, today):
+            hit = self.cache[key] = (snapshot.version, today, json.dumps(build(snapshot)))
+        return hit[2]
+
+    def get(self):
+        self.write_json(self.cached('/', lambda snapshot: {
+            'balance': str(snapshot.balance),
+            'budgets': self.budget_totals(snapshot),
+        }, daily=True))
+
+    def budget_totals(self, snapshot):
+        '''Spending in each budget's current interval, against its limit.'''
+        totals = snapshot.get_budget_totals(timestamp=datetime.datetime.now())
+        return dict((budget.name, {'spent': str(totals[budget.name]), 'limit': str(budget.limit)})
+                    for budget in snapshot.budgets)
+
+
+class BalanceView(AccountHandler):
     def get(self):
-        account = Account()
-        # TODO: Render the template with this account object.
+        self.write_json(self.cached('/balance', lambda snapshot: {'balance': str(snapshot.balance)}))
 
-class BalanceView(tornado.web.RequestHandler):
+
+class BudgetsView(AccountHandler):
     def get(self):
-        self.write(Account().balance)
+        # Budget intervals roll over with the date.
+        self.write_json(self.cached('/budgets', self.budget_totals, daily=True))
+
+
+class TransactionsView(AccountHandler):
+    @tornado.gen.coroutine
+    def get(self):
+        cursor = self.get_argument('cursor', None)
+        limit = self.get_argument('limit', None)
+        try:
+            limit = max(1, min(int(limit), 500)) if limit is not None else PAGE_SIZE
+        except ValueError:
+            raise tornado.web.HTTPError(400, 'Bad limit %r' % limit)
+        if cursor is not None:
+            try:
+                load_cursor(cursor)
+            except ValueError:
+                raise tornado.web.HTTPError(400, 'Bad cursor %r' % cursor)
+        start, end = self.get_time('start'), self.get_time('end')
+        # The first read of an account on disk loads every transaction.
+        page = yield self.executor.submit(self.page, cursor, limit, start, end)
+        self.write_json(page)
+
+    def get_time(self, name):
+        value = self.get_argument(name, None)
+        if value is None:
+            return None
+        try:
+            return datetime.datetime.strptime(value, '%Y-%m-%d')
+        except ValueError:
+            raise tornado.web.HTTPError(400, 'Bad %s date %r, expected YYYY-MM-DD' % (name, value))
+
+    def page(self, cursor, limit, start, end):
+        transactions, cursor = self.account.page_transactions(cursor, limit, start, end)
+        return {'next': cursor,
+                'transactions': [transaction_json(trans) for trans in transactions]}
+
+
+class SyncView(AccountHandler):
+    @tornado.gen.coroutine
+    def post(self):
+        summary = yield self.executor.submit(self.sync)
+        self.write_json({'messages': summary.messages,
+                         'transactions': summary.transactions,
+                         'failures': summary.failures,
+                         'total': str(summary.total)})
+
+    def sync(self):
+        from budgetkeeper.get_mail import sync
+        return sync(self.account)
+
+
+class MetricsView(AccountHandler):
+    def get(self):
+        metrics = instrument.snapshot()
+        cache = self.account.parse_cache
+        if cache is not None:
+            metrics['parse_cache'] = {'hits': cache.hits, 'misses': cache.misses, 'size': len(cache)}
+        self.write_json(metrics)
+
+
+class Application(tornado.web.Application):
+    def log_request(self, handler):
+        '''Time each request, by the handler that served it, then log it as usual.'''
+        instrument.record('webui.' + handler.__class__.__name__, handler.request.request_time())
+        tornado.web.Application.log_request(self, handler)
+
+
+def make_app(account, executor=None, cache=None):
+    '''The web app, serving account. Blocking work goes to executor.
+
+    cache is where JSON is kept between requests, by route.
+    '''
+    if executor is None:
+        # One thread, so writes to the account never run side by side.
+        executor = ThreadPoolExecutor(max_workers=1)
+    if cache is None:
+        cache = {}
+    options = {'account': account, 'executor': executor, 'cache': cache}
+    return Application([
+        (r"/", AccountHandler, options),
+        (r"/balance", BalanceView, options),
+        (r"/budgets", BudgetsView, options),
+        (r"/transactions", TransactionsView, options),
+        (r"/sync", SyncView, options),
+        (r"/metrics", MetricsView, options),
+    ])
+
 
-application = tornado.web.Application([
-    (r"/", AccountHandler),
-    (r"/balance", BalanceView),
-])
+def main(port=8888):
+    instrument.enable(settings.INSTRUMENT_ENABLED)
+    account = Account(default_path())
+    executor = ThreadPoolExecutor(max_workers=1)
+    # Get the transactions off the disk before anyone asks for a page.
+    executor.submit(lambda: account.transactions)
+    application = make_app(account, executor)
+    application.listen(port)
+    tornado.ioloop.IOLoop.current().start()
 
 if __name__ == "__main__":
-    application.listen(8888)
-    tornado.ioloop.IOLoop.instance().start()
+    main()
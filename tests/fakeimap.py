@@ -0,0 +1,261 @@
+'''A tiny IMAP server for testing get_mail against, without the network.
+
+It knows just enough IMAP4rev1 for imaplib: LOGIN, SELECT, UID SEARCH
+(ALL, UID ranges and FROM), UID FETCH of RFC822 or header fields,
+IDLE, NOOP and LOGOUT. It counts the commands it answers and the bytes it
+sends, so benchmarks can see what a sync costs.
+
+Each user can have a mailbox of their own, and a delay makes every
+command that much slower, like a far away server.
+
+    >>> server = FakeIMAPServer()
+    >>> server.add_message('me@example.com', 'Paid $3 for coffee')
+    1
+    >>> server.start()
+    >>> import imaplib
+    >>> mail = imaplib.IMAP4('127.0.0.1', server.port)
+    >>> mail.login('me@example.com', 'secret')[0]
+    'OK'
+    >>> mail.select('inbox')
+    ('OK', ['1'])
+    >>> mail.uid('search', None, '(FROM "me@example.com")')
+    ('OK', ['1'])
+    >>> mail.logout()[0]
+    'BYE'
+    >>> server.stop()
+'''
+import re
+import time
+import select
+import socket
+import threading
+import SocketServer
+from email.utils import formatdate
+
+literal_pattern = re.compile(r'\{(\d+)\}$')
+token_pattern = re.compile(r'"((?:[^"\\]|\\.)*)"|(\()|(\))|([^\s()]+)')
+
+
+def make_message(sender, subject, date=None, body='Sent from my phone.'):
+    '''An RFC822 message as a string.'''
+    return ('From: %s\r\nTo: %s\r\nSubject: %s\r\nDate: %s\r\n\r\n%s\r\n'
+            % (sender, sender, subject, date or formatdate(localtime=True), body))
+
+
+def parse_set(text, highest):
+    '''Turn an IMAP sequence set like "1,4:6,9:*" into a set of numbers.'''
+    numbers = set()
+    for part in text.split(','):
+        if ':' in part:
+            low, high = part.split(':')
+            low = highest if low == '*' else int(low)
+            high = highest if high == '*' else int(high)
+            numbers.update(range(min(low, high), max(low, high) + 1))
+        else:
+            numbers.add(highest if part == '*' else int(part))
+    return numbers
+
+
+def tokenize(text):
+    '''Split IMAP arguments into atoms and quoted strings, dropping parens.'''
+    tokens = []
+    for quoted, _, _, atom in token_pattern.findall(text):
+        tokens.append(quoted if atom == '' else atom)
+    return tokens
+
+
+class Mailbox(object):
+    def __init__(self, uidvalidity=1):
+        self.uidvalidity = uidvalidity
+        self.messages = []  # (uid, sender, raw message), in uid order
+        self.next_uid = 1
+
+    def add(self, sender, raw):
+        uid = self.next_uid
+        self.next_uid += 1
+        self.messages.append((uid, sender, raw))
+        return uid
+
+    def search(self, criteria):
+        highest = self.messages[-1][0] if self.messages else 0
+        tokens = tokenize(criteria)
+        uids, sender = None, None
+        while tokens:
+            key = tokens.pop(0).upper()
+            if key == 'UID':
+                uids = parse_set(tokens.pop(0), highest)
+            elif key == 'FROM':
+                sender = tokens.pop(0).lower()
+        return [uid for uid, who, raw in self.messages
+                if (uids is None or uid in uids) and (sender is None or sender in who.lower())]
+
+
+class IMAPHandler(SocketServer.StreamRequestHandler):
+    # Buffer each reply and send it in one go, or Nagle stalls every command.
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def send(self, line):
+        data = line + '\r\n'
+        self.server.stats['bytes'] += len(data)
+        self.wfile.write(data)
+
+    def setup(self):
+        SocketServer.StreamRequestHandler.setup(self)
+        self.server.connections.add(self.connection)
+
+    def finish(self):
+        self.server.connections.discard(self.connection)
+        SocketServer.StreamRequestHandler.finish(self)
+
+    def handle(self):
+        self.mailbox = None
+        self.user = None
+        self.send('* OK FakeIMAP ready')
+        while True:
+            self.wfile.flush()
+            line = self.rfile.readline()
+            if not line:
+                return
+            line = line.rstrip('\r\n')
+            # Literals (e.g. a password with odd characters) follow the line.
+            match = literal_pattern.search(line)
+            if match:
+                self.send('+ go ahead')
+                self.wfile.flush()
+                line = line[:match.start()] + '"%s"' % self.rfile.read(int(match.group(1)))
+                line += self.rfile.readline().rstrip('\r\n')
+
+            tag, _, rest = line.partition(' ')
+            command, _, args = rest.partition(' ')
+            command = command.upper()
+            self.server.stats['commands'] += 1
+            if command == 'UID':
+                command, _, args = args.partition(' ')
+                command = 'UID_' + command.upper()
+
+            if self.server.delay:
+                time.sleep(self.server.delay)
+            handler = getattr(self, 'do_' + command, None)
+            if handler is None:
+                self.send('%s BAD unknown command %s' % (tag, command))
+                continue
+            if handler(tag, args) is False:
+                return
+
+    def do_CAPABILITY(self, tag, args):
+        self.send('* CAPABILITY IMAP4rev1' + (' IDLE' if self.server.idle else ''))
+        self.send('%s OK CAPABILITY completed' % tag)
+
+    def do_NOOP(self, tag, args):
+        self.send('%s OK NOOP completed' % tag)
+
+    def do_LOGIN(self, tag, args):
+        user, password = tokenize(args)[:2]
+        if (user, password) in self.server.logins or not self.server.logins:
+            self.user = user
+            self.send('%s OK LOGIN completed' % tag)
+        else:
+            self.send('%s NO LOGIN failed' % tag)
+
+    def do_SELECT(self, tag, args):
+        self.mailbox = self.server.mailboxes.get(self.user, self.server.mailbox)
+        self.exists = len(self.mailbox.messages)
+        self.send('* %d EXISTS' % self.exists)
+        self.send('* 0 RECENT')
+        self.send('* OK [UIDVALIDITY %d] UIDs valid' % self.mailbox.uidvalidity)
+        self.send('* OK [UIDNEXT %d] Predicted next UID' % self.mailbox.next_uid)
+        self.send('%s OK [READ-WRITE] SELECT completed' % tag)
+
+    def do_UID_SEARCH(self, tag, args):
+        self.send(' '.join(['* SEARCH'] + [str(uid) for uid in self.mailbox.search(args)]))
+        self.send('%s OK SEARCH completed' % tag)
+
+    def do_UID_FETCH(self, tag, args):
+        uid_set, _, items = args.partition(' ')
+        highest = self.mailbox.messages[-1][0] if self.mailbox.messages else 0
+        wanted = parse_set(uid_set, highest)
+        headers = re.search(r'HEADER\.FIELDS \(([^)]*)\)', items, flags=re.IGNORECASE)
+        for number, (uid, sender, raw) in enumerate(self.mailbox.messages, 1):
+            if uid not in wanted:
+                continue
+            if headers:
+                names = headers.group(1).upper().split()
+                head = raw.split('\r\n\r\n', 1)[0].split('\r\n')
+                data = ''.join(field + '\r\n' for field in head
+                               if field.split(':', 1)[0].upper() in names) + '\r\n'
+                item = 'BODY[HEADER.FIELDS (%s)]' % ' '.join(names)
+            else:
+                data, item = raw, 'RFC822'
+            self.send('* %d FETCH (UID %d %s {%d}' % (number, uid, item, len(data)))
+            self.server.stats['bytes'] += len(data)
+            self.wfile.write(data)
+            self.send(')')
+        self.send('%s OK FETCH completed' % tag)
+
+    def do_IDLE(self, tag, args):
+        if not self.server.idle:
+            self.send('%s BAD unknown command IDLE' % tag)
+            return
+        self.send('+ idling')
+        while True:
+            # Including anything that came in since this client last heard.
+            if len(self.mailbox.messages) != self.exists:
+                self.exists = len(self.mailbox.messages)
+                self.send('* %d EXISTS' % self.exists)
+            self.wfile.flush()
+            if select.select([self.connection], [], [], 0.01)[0]:
+                line = self.rfile.readline()
+                if not line:
+                    return False
+                if line.strip().upper() == 'DONE':
+                    self.send('%s OK IDLE terminated' % tag)
+                    return
+
+    def do_LOGOUT(self, tag, args):
+        self.send('* BYE FakeIMAP logging out')
+        self.send('%s OK LOGOUT completed' % tag)
+        return False
+
+
+class FakeIMAPServer(SocketServer.ThreadingTCPServer):
+    '''Serves one mailbox on a free port on localhost.'''
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, uidvalidity=1, logins=(), idle=True, delay=0):
+        SocketServer.ThreadingTCPServer.__init__(self, ('127.0.0.1', 0), IMAPHandler)
+        self.port = self.server_address[1]
+        self.mailbox = Mailbox(uidvalidity)
+        self.logins = set(logins)
+        self.mailboxes = {}
+        self.idle = idle
+        self.delay = delay
+        self.connections = set()
+        self.stats = {'commands': 0, 'bytes': 0}
+        self._thread = None
+
+    def add_message(self, sender, subject, date=None, body='Sent from my phone.', user=None):
+        '''Deliver a message, to user's own mailbox if given, returning its UID.'''
+        mailbox = self.mailbox if user is None else self.mailboxes.setdefault(user, Mailbox(self.mailbox.uidvalidity))
+        return mailbox.add(sender, make_message(sender, subject, date, body))
+
+    def drop_connections(self):
+        '''Hang up on every client, as a flaky network would.'''
+        for connection in list(self.connections):
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+    def reset_stats(self):
+        self.stats = {'commands': 0, 'bytes': 0}
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
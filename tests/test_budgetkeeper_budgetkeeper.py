@@ -4,8 +4,9 @@ from nose.tools import eq_ as eq
 from decimal import Decimal
 
 from datetime import datetime
+from dateutil.relativedelta import relativedelta
 
-from budgetkeeper.budgetkeeper import Account, Message, MONTHLY
+from budgetkeeper.budgetkeeper import Account, ConsistencyError, Message, Transaction, Purchase, Bill, DAILY, BIWEEKLY, MONTHLY
 
 class TestAccount(unittest.TestCase):
     def test___init__(self):
@@ -59,6 +60,31 @@ class TestAccount(unittest.TestCase):
         expected = Decimal(100)
         self.assertEqual(expected, result)
 
+    def test_remove_transaction(self):
+        account = Account()
+        income = account.add_income(amount=100)
+        account.add_purchase(amount=40)
+        account.remove_transaction(income)
+        self.assertNotIn(income, account.transactions)
+        self.assertEqual(account.balance, Decimal('-40.00'))
+
+    def test_update_transaction(self):
+        account = Account()
+        purchase = account.add_purchase(amount=40)
+        account.update_transaction(purchase, amount=10, description='Lunch')
+        self.assertEqual(purchase.description, 'Lunch')
+        self.assertEqual(str(purchase.amount), '10.00')
+        self.assertEqual(account.balance, Decimal('-10.00'))
+        self.assertEqual(account.balance, account.recompute_balance())
+
+    def test_check_consistency(self):
+        account = Account()
+        account.check_consistency = True
+        purchase = account.add_purchase(amount=40)
+        self.assertEqual(account.balance, Decimal('-40.00'))
+        purchase.amount = Decimal(10)
+        self.assertRaises(ConsistencyError, lambda: account.balance)
+
     def test_get_budget_totals(self):
         account = Account()
         account.add_budget('Groceries', interval=MONTHLY, limit=1000)
@@ -68,15 +94,237 @@ class TestAccount(unittest.TestCase):
         expected = {'Groceries': Decimal(100)}
         self.assertEqual(result, expected)
 
+    def test_get_budget_totals_empty(self):
+        account = Account()
+        account.add_budget('Groceries', interval=MONTHLY, limit=1000)
+        self.assertEqual(account.get_budget_totals(), {'Groceries': Decimal('0.00')})
+
+    def test_get_budget_totals_by_period(self):
+        account = Account()
+        account.add_budget('Groceries', interval=MONTHLY, limit=1000)
+        account.add_budget('Coffee', interval=DAILY, limit=5)
+        account.add_purchase(100, category='Groceries', timestamp=datetime(2012, 1, 31))
+        account.add_purchase(50, category='Groceries', timestamp=datetime(2012, 2, 29))
+        account.add_purchase(4, category='Coffee', timestamp=datetime(2012, 2, 28, 8))
+        account.add_purchase(3, category='Coffee', timestamp=datetime(2012, 2, 29, 8))
+        account.add_income(500, category='Groceries', timestamp=datetime(2012, 2, 29))
+
+        result = account.get_budget_totals(timestamp=datetime(2012, 2, 29, 12))
+        expected = {'Groceries': Decimal('50.00'), 'Coffee': Decimal('3.00')}
+        self.assertEqual(result, expected)
+
+    def test_get_budget_totals_after_edit(self):
+        account = Account()
+        account.add_budget('Groceries', interval=MONTHLY, limit=1000)
+        purchase = account.add_purchase(100, category='Groceries')
+        account.update_transaction(purchase, category='Booze')
+        self.assertEqual(account.get_budget_total('Groceries'), Decimal('0.00'))
+
     def test_parse_message(self):
-        # account = Account()
-        # self.assertEqual(expected, account.parse_message(message))
-        self.skipTest("TODO: Not Implemented")
+        account = Account()
+        account.add_budget('Candy', interval=MONTHLY)
+        account.add_budget('Groceries', interval=MONTHLY)
+        purchases = account.parse_message('Paid $3 for candy and paid $20 for groceries and bread.')
+        self.assertEqual([p.amount for p in purchases], [Decimal('3.00'), Decimal('20.00')])
+        self.assertEqual([p.category for p in purchases], ['Candy', 'Groceries'])
+
+    def test_parse_message_first_budget_wins(self):
+        account = Account()
+        account.add_budget('Food', interval=MONTHLY)
+        account.add_budget('Fast Food', interval=MONTHLY)
+        account.add_budget('Dog Food', interval=MONTHLY)
+        self.assertEqual(account.parse_message('$10 dog food').category, 'Food')
+
+        account = Account()
+        account.add_budget('Dog Food', interval=MONTHLY)
+        account.add_budget('Food', interval=MONTHLY)
+        purchase = account.parse_message('Paid $10 for dog food')
+        self.assertEqual(purchase.category, 'Dog Food')
+        self.assertEqual(purchase.description, '')
+
+    def test_parse_message_without_money(self):
+        account = Account()
+        self.assertEqual(account.parse_message('Lunch with the band'), None)
+        self.assertEqual(account.transactions, [])
+
+    def test_parse_cache(self):
+        account = Account()
+        account.add_budget('Coffee', interval=DAILY)
+        messages = ['Paid $4.50 for coffee', 'Paid $3 for coffee', '$3 coffee and $2 donut',
+                    '$1 coffee and $7 donut', 'Paid $5 for a $5 gift card', 'Paid $9 for a $1 gift card']
+        purchases = [account.parse_message(message, datetime(2012, 1, 1)) for message in messages]
+        self.assertEqual((account.parse_cache.hits, account.parse_cache.misses), (3, 3))
+
+        uncached = Account()
+        uncached.parse_cache = None
+        uncached.add_budget('Coffee', interval=DAILY)
+        expected = [uncached.parse_message(message, datetime(2012, 1, 1)) for message in messages]
+        self.assertEqual(repr(purchases), repr(expected))
+        # Amounts that end up in a description are put back in too.
+        self.assertEqual(purchases[-1].description, 'A $1 gift card')
+
+    def test_parse_cache_uncacheable(self):
+        account = Account()
+        # The text clashes with the stand-ins, so the template is never used.
+        for amount in (3, 4, 5):
+            purchase = account.parse_message('Paid $%d for item918273600' % amount)
+            self.assertEqual((purchase.amount, purchase.description), (amount, 'Item918273600'))
+        self.assertEqual((account.parse_cache.hits, account.parse_cache.misses), (0, 3))
+
+    def test_parse_cache_add_budget(self):
+        account = Account()
+        self.assertEqual(account.parse_message('Paid $3 for candy').category, None)
+        account.add_budget('Candy', interval=MONTHLY)
+        self.assertEqual(account.parse_message('Paid $4 for candy').category, 'Candy')
+        self.assertEqual(account.parse_cache.hits, 0)
+
+    def test_forecast_balance(self):
+        account = Account()
+        account.add_paycheck(1500, interval=BIWEEKLY, timestamp=datetime(2012, 1, 6, 17))
+        account.add_bill(800, interval=MONTHLY, timestamp=datetime(2012, 1, 31))
+        account.add_bill('9.99', interval=relativedelta(months=1, days=3), timestamp=datetime(2012, 1, 15))
+        account.trigger_recurring(datetime(2012, 6, 1))
+
+        when = datetime(2031, 7, 4, 12)
+        expected = account.forecast_balance(when)
+        balances = list(account.forecast([datetime(2015, 1, 1), datetime(2020, 1, 1), when]))
+        account.trigger_recurring(when)
+        self.assertEqual(expected, account.balance)
+        self.assertEqual(balances[-1], (when, account.balance))
+
+    def test_forecast_balance_hours(self):
+        for interval in (relativedelta(days=1, hours=12), relativedelta(months=1, hours=12)):
+            account = Account()
+            account.add_bill(1, interval=interval, timestamp=datetime(2012, 1, 1))
+            when = datetime(2022, 1, 1)
+            expected = account.forecast_balance(when)
+            account.trigger_recurring(when)
+            self.assertEqual(expected, account.balance)
+
+    def test_forecast_budget(self):
+        account = Account()
+        account.add_budget('Rent', interval=MONTHLY, limit=1000)
+        account.add_bill(900, category='Rent', interval=MONTHLY, timestamp=datetime(2012, 1, 1))
+        account.add_purchase(50, category='Rent', timestamp=datetime(2012, 3, 2))
+
+        self.assertRaises(KeyError, account.forecast_budget, 'Groceries')
+        forecast = account.forecast_budget('Rent', datetime(2012, 3, 1, 12))
+        self.assertEqual((forecast.spent, forecast.scheduled, forecast.over),
+                         (Decimal('50.00'), Decimal('900.00'), False))
+        account.trigger_recurring(datetime(2012, 3, 1))
+        forecast = account.forecast_budgets(datetime(2012, 3, 1, 12))['Rent']
+        self.assertEqual((forecast.spent, forecast.scheduled), (Decimal('950.00'), Decimal('0.00')))
+
+    def test_parse_messages(self):
+        account = Account()
+        account.add_budget('Groceries', interval=MONTHLY)
+        messages = (('Paid $%d for groceries.' % i, datetime(2012, 1, i)) for i in range(1, 29))
+        summary = account.parse_messages(messages, chunk_size=5)
+        self.assertEqual(summary.messages, 28)
+        self.assertEqual(summary.transactions, 28)
+        self.assertEqual(summary.failures, 0)
+        self.assertEqual(summary.total, Decimal(sum(range(1, 29))))
+        self.assertEqual(account.balance, -summary.total)
+        self.assertEqual(account.transactions[-1].timestamp, datetime(2012, 1, 28))
+        self.assertEqual(account.get_budget_total('Groceries', datetime(2012, 1, 1)), summary.total)
+
+    def test_parse_messages_parallel(self):
+        messages = ['Paid $%d for groceries and $1 for candy' % i if i % 3 else 'Lunch %d' % i
+                    for i in range(1, 200)]
+        serial, parallel = Account(), Account()
+        for account in (serial, parallel):
+            account.add_budget('Groceries', interval=MONTHLY)
+            account.add_budget('Candy', interval=MONTHLY)
+
+        expected = serial.parse_messages(messages, timestamp=datetime(2012, 1, 1), chunk_size=7)
+        result = parallel.parse_messages(messages, timestamp=datetime(2012, 1, 1), chunk_size=7, workers=3)
+        self.assertEqual(repr(result), repr(expected))
+        self.assertEqual(repr(parallel.transactions), repr(serial.transactions))
+        self.assertEqual(parallel.get_budget_totals(), serial.get_budget_totals())
 
     def test_trigger_recurring(self):
-        # account = Account()
-        # self.assertEqual(expected, account.trigger_recurring(timestamp))
-        self.skipTest("TODO: Not Implemented")
+        account = Account()
+        account.add_bill(100, description='Rent', interval=MONTHLY, timestamp=datetime(2012, 1, 31))
+        account.add_paycheck(1000, description='Pay', interval=BIWEEKLY, timestamp=datetime(2012, 1, 6))
+        account.add_bill(5, description='One off', timestamp=datetime(2012, 1, 1))
+        self.assertEqual(account.trigger_recurring(datetime(2012, 3, 31)), 8)
+        self.assertEqual([(t.__class__.__name__, t.timestamp.date().isoformat()) for t in account.transactions[3:]],
+                         [('Income', '2012-01-20'), ('Income', '2012-02-03'), ('Income', '2012-02-17'),
+                          ('Purchase', '2012-02-29'), ('Income', '2012-03-02'), ('Income', '2012-03-16'),
+                          ('Income', '2012-03-30'), ('Purchase', '2012-03-31')])
+        self.assertEqual(account.balance, account.recompute_balance())
+
+        self.assertEqual(account.trigger_recurring(datetime(2012, 3, 31)), 0)
+        self.assertEqual(account.trigger_recurring(datetime(2012, 4, 30)), 3)
+
+    def test_trigger_recurring_after_edits(self):
+        account = Account()
+        rent = account.add_bill(100, description='Rent', interval=MONTHLY, timestamp=datetime(2012, 1, 1))
+        account.trigger_recurring(datetime(2012, 2, 1))
+        account.update_transaction(rent, amount=120)
+        self.assertEqual(account.trigger_recurring(datetime(2012, 3, 1)), 1)
+        self.assertEqual(account.transactions[-1].amount, Decimal(120))
+
+        account.remove_transaction(rent)
+        self.assertEqual(account.trigger_recurring(datetime(2013, 1, 1)), 0)
+
+    def test_trigger_recurring_batches(self):
+        account = Account()
+        account.add_budget('Coffee', interval=DAILY)
+        account.add_bill('2.50', category='Coffee', interval=DAILY, timestamp=datetime(2012, 1, 1, 8))
+        self.assertEqual(account.trigger_recurring(datetime(2013, 1, 1), batch_size=50), 365)
+        self.assertEqual(account.get_budget_total('Coffee', datetime(2012, 12, 31)), Decimal('2.50'))
+        self.assertEqual(account.balance, Decimal('-915.00'))
+
+    def test_trigger_recurring_stuck_interval(self):
+        account = Account()
+        for interval in (relativedelta(), relativedelta(days=-1), relativedelta(months=1, days=-31)):
+            self.assertRaises(ValueError, account.add_bill, 10, interval=interval, timestamp=datetime(2012, 1, 1))
+            self.assertRaises(ValueError, account.add_paycheck, 10, interval=interval, timestamp=datetime(2012, 1, 1))
+        rent = account.add_bill(100, interval=MONTHLY, timestamp=datetime(2012, 1, 1))
+        self.assertRaises(ValueError, account.update_transaction, rent, interval=relativedelta())
+        self.assertEqual(account.transactions, [rent])
+
+        # Ones that got in some other way are refused when scheduled, not repeated for ever.
+        account.add_transactions([Bill(10, timestamp=datetime(2012, 1, 1), interval=relativedelta())])
+        self.assertRaises(ValueError, account.trigger_recurring, datetime(2012, 2, 1))
+
+    def test_transactions_between(self):
+        account = Account()
+        account._time_index().LOAD = 4
+        days = [(i * 7) % 31 + 1 for i in range(31)]
+        purchases = dict((day, account.add_purchase(day, timestamp=datetime(2012, 1, day))) for day in days)
+        account.remove_transaction(purchases[10])
+        account.update_transaction(purchases[20], timestamp=datetime(2012, 2, 20))
+
+        between = account.transactions_between(datetime(2012, 1, 5), datetime(2012, 1, 25))
+        self.assertEqual([trans.timestamp.day for trans in between], [d for d in range(5, 25) if d not in (10, 20)])
+        self.assertEqual(account.transactions_between(datetime(2012, 2, 1)), [purchases[20]])
+
+    def test_page_transactions(self):
+        account = Account()
+        account._time_index().LOAD = 2
+        for day in (5, 1, 3, 2, 4, 1):
+            account.add_income(day, timestamp=datetime(2012, 1, day))
+
+        pages, cursor = [], None
+        while True:
+            page, cursor = account.page_transactions(cursor, limit=4, newest_first=False)
+            pages.append([trans.amount for trans in page])
+            if cursor is None:
+                break
+        self.assertEqual(pages, [[1, 1, 2, 3], [4, 5]])
+
+        # Something landing before the cursor doesn't shift the next page.
+        page, cursor = account.page_transactions(limit=2)
+        account.add_income(6, timestamp=datetime(2012, 1, 6))
+        self.assertEqual([trans.amount for trans in account.page_transactions(cursor, limit=2)[0]], [3, 2])
+
+        # Pages never come up empty while there's more.
+        for limit in (0, -1):
+            page, cursor = account.page_transactions(limit=limit)
+            self.assertEqual([trans.amount for trans in page], [6])
+            self.assertNotEqual(cursor, None)
 
 
 def test_get_money():
@@ -105,13 +353,26 @@ def test_get_money():
 
 
 class TestMessage(unittest.TestCase):
-    pass
+    def test_get_description(self):
+        self.assertEqual(Message.get_description('Paid $14.57 for $5 worth of groceries.'), '$5 worth of groceries.')
+        self.assertEqual(Message.get_description('Bought candy for $2'), 'Candy')
+        self.assertEqual(Message.get_description('No money here'), None)
 
 
 class TestTransaction(unittest.TestCase):
     def test___init__(self):
-        # transaction = Transaction(amount, description, timestamp, category)
-        self.skipTest("TODO: Not Implemented")
+        transaction = Transaction(Decimal('4.12'), 'Coffee', datetime(2012, 1, 1), 'Food')
+        self.assertEqual(transaction.amount, Decimal('4.12'))
+        self.assertEqual(transaction.description, 'Coffee')
+        self.assertEqual(transaction.timestamp, datetime(2012, 1, 1))
+        self.assertEqual(transaction.category, 'Food')
+
+    def test_slots(self):
+        for transaction in (Transaction(1), Purchase(1), Bill(1, interval=MONTHLY)):
+            self.assertFalse(hasattr(transaction, '__dict__'))
+        self.assertEqual(repr(Bill(1, timestamp=datetime(2012, 1, 1), interval=MONTHLY)),
+                         "Bill(amount=1, category=None, description='', interval=relativedelta(months=+1), "
+                         "timestamp=datetime.datetime(2012, 1, 1, 0, 0))")
 
 class TestPayCheck(unittest.TestCase):
     def test___init__(self):
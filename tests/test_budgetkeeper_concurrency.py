@@ -0,0 +1,133 @@
+import sys
+import random
+import threading
+import unittest
+
+from decimal import Decimal
+
+from datetime import datetime, timedelta
+
+from budgetkeeper.budgetkeeper import Account, Purchase
+
+CATEGORIES = ('Groceries', 'Coffee', 'Books')
+
+
+def purchases(count, seed=0):
+    rand = random.Random(seed)
+    start = datetime(2012, 1, 1)
+    for i in xrange(count):
+        # Out of order now and then, as late mail is.
+        yield Purchase(Decimal('1.00'), 'Thing %d' % i, start + timedelta(minutes=rand.randint(0, count)),
+                       rand.choice(CATEGORIES))
+
+
+class TestConcurrency(unittest.TestCase):
+    '''Readers and writers on the same account, switching threads as often as they can.'''
+    def setUp(self):
+        self.interval = sys.getcheckinterval()
+        sys.setcheckinterval(1)
+        self.account = Account()
+        for name in CATEGORIES:
+            self.account.add_budget(name)
+        self.errors = []
+
+    def tearDown(self):
+        sys.setcheckinterval(self.interval)
+
+    def run_threads(self, writers, readers):
+        '''Run the writers to the end, and the readers over and over until they're done.'''
+        done = threading.Event()
+
+        def write(writer):
+            try:
+                writer()
+            except Exception, e:
+                self.errors.append(e)
+
+        def read(reader):
+            try:
+                while not done.is_set():
+                    reader()
+            except Exception, e:
+                self.errors.append(e)
+
+        reading = [threading.Thread(target=read, args=(reader,)) for reader in readers]
+        writing = [threading.Thread(target=write, args=(writer,)) for writer in writers]
+        for thread in reading + writing:
+            thread.start()
+        for thread in writing:
+            thread.join()
+        done.set()
+        for thread in reading:
+            thread.join()
+        if self.errors:
+            raise self.errors[0]
+
+    def check_snapshot(self):
+        snapshot = self.account.snapshot()
+        totals = snapshot.get_budget_totals()
+        # Every purchase is filed under a budget, so the two always agree.
+        self.assertEqual(-snapshot.balance, sum(totals.values()))
+        return snapshot
+
+    def test_batches_seen_whole(self):
+        versions = []
+
+        def reader():
+            snapshot = self.check_snapshot()
+            # Only ever whole chunks.
+            self.assertEqual(snapshot.balance % 100, 0)
+            versions.append(snapshot.version)
+
+        def writer():
+            self.account.add_transactions(purchases(5000), chunk_size=100)
+
+        self.run_threads([writer], [reader] * 3)
+        self.assertEqual(self.account.balance, Decimal('-5000.00'))
+        self.assertTrue(versions)
+
+    def test_writers_take_turns(self):
+        def writer(seed):
+            def write():
+                for trans in purchases(500, seed):
+                    self.account.add_purchase(trans.amount, trans.description, trans.timestamp, trans.category)
+            return write
+
+        self.run_threads([writer(seed) for seed in range(4)], [self.check_snapshot] * 2)
+        self.assertEqual(self.account.balance, Decimal('-2000.00'))
+        self.assertEqual(len(self.account.transactions), 2000)
+        self.assertEqual(self.account.verify_balance(), Decimal('-2000.00'))
+
+    def test_updates_and_removals(self):
+        self.account.add_transactions(purchases(1000))
+        moving = list(self.account.transactions[:500])
+
+        def writer():
+            rand = random.Random(1)
+            for trans in moving:
+                # Taken out of one budget and put in another: never half way.
+                self.account.update_transaction(trans, category=rand.choice(CATEGORIES),
+                                                timestamp=trans.timestamp + timedelta(days=1))
+            for trans in moving[:100]:
+                self.account.remove_transaction(trans)
+
+        self.run_threads([writer], [self.check_snapshot] * 2)
+        self.assertEqual(self.account.balance, Decimal('-900.00'))
+        self.assertEqual(self.account.recompute_balance(), Decimal('-900.00'))
+
+    def test_paging(self):
+        def reader():
+            cursor, seen = None, []
+            while True:
+                page, cursor = self.account.page_transactions(cursor, limit=97, newest_first=False)
+                seen.extend(trans.timestamp for trans in page)
+                if cursor is None:
+                    break
+            self.assertEqual(seen, sorted(seen))
+
+        def writer():
+            self.account.add_transactions(purchases(5000), chunk_size=250)
+
+        self.account.page_transactions()
+        self.run_threads([writer], [reader] * 2)
+        self.assertEqual(len(self.account.transactions_between()), 5000)
@@ -0,0 +1,109 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from decimal import Decimal
+from dateutil.relativedelta import relativedelta
+
+from datetime import datetime
+
+from budgetkeeper import export
+from budgetkeeper.budgetkeeper import Account, Income, Purchase, PayCheck, Bill, MONTHLY, BIWEEKLY
+
+
+def transactions():
+    return [Income(Decimal('1500.00'), 'Salary', datetime(2012, 1, 1), 'Work'),
+            Purchase(Decimal('100'), '', datetime(1899, 12, 31, 23, 59, 59, 999999)),
+            Purchase(Decimal(4.12), None, datetime(2012, 1, 2, 8, 15, 0, 7), None),
+            Purchase(Decimal('-0.00'), '\\N', datetime(2012, 1, 3), '\\Coffee'),
+            Purchase(Decimal('1E+30'), 'Yacht, "the big one"\nfor Bob', datetime(2012, 1, 4), 'Boats'),
+            Purchase(Decimal('123456789012345678901234567890.5'), 'caf\xc3\xa9', datetime(2038, 1, 20), 'Boats'),
+            Bill(Decimal('49.99'), 'Internet', datetime(2012, 1, 5), 'Bills', MONTHLY),
+            Bill(Decimal('10'), 'Odd', datetime(2012, 1, 6), 'Bills', relativedelta(days=-3, hours=5, microseconds=9)),
+            Bill(Decimal('10'), 'Never again', datetime(2012, 1, 7), 'Bills'),
+            PayCheck(Decimal('750.005'), 'Pay', datetime(2012, 1, 8), 'Work', BIWEEKLY)]
+
+
+def fields(trans):
+    # Decimals that compare equal can still differ; str tells them apart.
+    return (trans.__class__, str(trans.amount), trans.description, trans.timestamp,
+            trans.category, getattr(trans, 'interval', None))
+
+
+class TestExport(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def assertRoundTrip(self, path):
+        self.assertEqual(export.save(transactions(), path), len(transactions()))
+        loaded = list(export.load(path))
+        self.assertEqual([fields(trans) for trans in loaded], [fields(trans) for trans in transactions()])
+        return loaded
+
+    def test_csv(self):
+        self.assertRoundTrip(self.path('ledger.csv'))
+
+    def test_columns(self):
+        self.assertRoundTrip(self.path('ledger.bk'))
+
+    def test_columns_chunks(self):
+        path = self.path('ledger.bk')
+        with open(path, 'wb') as out:
+            export.write_columns(transactions(), out, chunk_size=3)
+        expected = [fields(trans) for trans in transactions()]
+        with export.ColumnFile(path) as columns:
+            self.assertEqual((len(columns), columns.chunks), (10, 4))
+            self.assertEqual([fields(trans) for trans in columns], expected)
+            self.assertEqual([fields(columns[row]) for row in (9, 0, 4, -1)],
+                             [expected[9], expected[0], expected[4], expected[9]])
+            self.assertRaises(IndexError, columns.__getitem__, 10)
+
+    def test_empty(self):
+        for name in ('empty.csv', 'empty.bk'):
+            self.assertEqual(export.save([], self.path(name)), 0)
+            self.assertEqual(list(export.load(self.path(name))), [])
+
+    def test_not_an_export(self):
+        with open(self.path('other.bk'), 'wb') as out:
+            out.write('x' * 100)
+        self.assertRaises(ValueError, export.ColumnFile, self.path('other.bk'))
+        with open(self.path('other.csv'), 'wb') as out:
+            out.write('date,amount\n')
+        self.assertRaises(ValueError, list, export.load(self.path('other.csv')))
+
+    def test_absolute_interval(self):
+        bill = Bill(Decimal('10'), 'Rent', datetime(2012, 1, 1), 'Bills', relativedelta(months=1, day=1))
+        self.assertRaises(ValueError, export.save, [bill], self.path('rent.csv'))
+
+    def test_account(self):
+        path = self.path('ledger.db')
+        account = Account(path)
+        account.add_budget('Bills')
+        # A balance can't hold 30 digits.
+        stored = [trans for trans in transactions() if trans.amount < 10 ** 6]
+        self.assertEqual(account.add_transactions(stored, chunk_size=4), 8)
+        # Only the recurring ones are remembered.
+        self.assertEqual(len(account._store._ids), 3)
+        account.close()
+
+        account = Account(path)
+        saved = export.save(account.iter_transactions(), self.path('ledger.bk'))
+        self.assertEqual(saved, 8)
+        # Streamed straight from disk, not read into the account.
+        self.assertEqual(account._transactions, None)
+
+        copy = Account()
+        copy.add_budget('Bills')
+        copy.add_transactions(export.load(self.path('ledger.bk')))
+        self.assertEqual(copy.balance, account.balance)
+        self.assertEqual(copy.get_budget_totals(), account.get_budget_totals())
+        self.assertEqual([fields(trans) for trans in copy.transactions],
+                         [fields(trans) for trans in stored])
+        account.close()
@@ -0,0 +1,93 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from budgetkeeper import settings
+from budgetkeeper.budgetkeeper import Account
+from budgetkeeper.get_mail import SyncState, get_mail, sync
+
+from fakeimap import FakeIMAPServer
+
+ME = 'me@example.com'
+
+
+class TestGetMail(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeIMAPServer(uidvalidity=7)
+        self.server.start()
+        self.directory = tempfile.mkdtemp()
+        self.state_path = os.path.join(self.directory, 'imap-state.json')
+
+        self.saved = dict((name, getattr(settings, name, None)) for name in
+                          ('IMAP_ENABLED', 'IMAP_USE_SSL', 'IMAP_SERVER', 'IMAP_PORT', 'IMAP_LABEL',
+                           'AUTHENTICATION_EMAIL', 'AUTHENTICATION_PASSWORD'))
+        settings.IMAP_ENABLED = True
+        settings.IMAP_USE_SSL = False
+        settings.IMAP_SERVER = '127.0.0.1'
+        settings.IMAP_PORT = self.server.port
+        settings.IMAP_LABEL = False
+        settings.AUTHENTICATION_EMAIL = ME
+        settings.AUTHENTICATION_PASSWORD = 'secret'
+
+    def tearDown(self):
+        for name, value in self.saved.items():
+            setattr(settings, name, value)
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def sync(self, batch_size=200):
+        state = SyncState.load(self.state_path)
+        subjects = [subject for batch in get_mail(state, batch_size=batch_size) for subject, timestamp in batch]
+        state.save()
+        return subjects
+
+    def test_only_new_messages(self):
+        self.server.add_message(ME, 'Paid $3 for coffee')
+        self.server.add_message('spam@example.com', 'Cheap watches $5')
+        self.server.add_message(ME, 'Paid $20 for groceries')
+        self.assertEqual(self.sync(), ['Paid $3 for coffee', 'Paid $20 for groceries'])
+        self.assertEqual(self.sync(), [])
+
+        self.server.add_message(ME, 'Paid $4 for lunch')
+        self.assertEqual(self.sync(), ['Paid $4 for lunch'])
+
+    def test_batched_fetch(self):
+        for i in range(25):
+            self.server.add_message(ME, 'Paid $%d for coffee' % i)
+        self.server.reset_stats()
+        self.assertEqual(len(self.sync(batch_size=10)), 25)
+        # CAPABILITY, LOGIN, SELECT, SEARCH, three FETCHes and LOGOUT.
+        self.assertEqual(self.server.stats['commands'], 8)
+
+    def test_timestamps(self):
+        self.server.add_message(ME, 'Paid $3 for coffee', date='Tue, 14 Feb 2012 09:30:00 -0000')
+        subject, timestamp = list(get_mail(SyncState.load(self.state_path)))[0][0]
+        self.assertEqual(timestamp.year, 2012)
+
+    def test_uidvalidity_change(self):
+        self.server.add_message(ME, 'Paid $3 for coffee')
+        self.assertEqual(len(self.sync()), 1)
+        self.server.mailbox.uidvalidity += 1
+        self.assertEqual(self.sync(), ['Paid $3 for coffee'])
+
+    def test_state_saved_once_stored(self):
+        for i in range(5):
+            self.server.add_message(ME, 'Paid $%d for coffee' % (i + 1))
+
+        class Crashing(Account):
+            def parse_messages(self, messages, **options):
+                if any('$4' in subject for subject, timestamp in messages):
+                    raise IOError('disk full')
+                return Account.parse_messages(self, messages, **options)
+
+        self.assertRaises(IOError, sync, Crashing(), SyncState.load(self.state_path), batch_size=2)
+        # Only the first batch got in, so only it is skipped next time.
+        self.assertEqual(SyncState.load(self.state_path).last_uid, 2)
+        summary = sync(Account(), SyncState.load(self.state_path), batch_size=2)
+        self.assertEqual((summary.messages, summary.transactions), (3, 3))
+        self.assertEqual(sync(Account(), SyncState.load(self.state_path)).messages, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
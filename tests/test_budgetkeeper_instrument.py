@@ -0,0 +1,63 @@
+import os
+import pstats
+import shutil
+import tempfile
+import unittest
+
+from budgetkeeper import instrument
+from budgetkeeper.budgetkeeper import Account, MONTHLY
+
+
+class TestInstrument(unittest.TestCase):
+    def setUp(self):
+        instrument.metrics.reset()
+
+    def tearDown(self):
+        instrument.enable(False)
+        instrument.metrics.reset()
+
+    def test_disabled(self):
+        account = Account()
+        account.parse_messages(['Paid $3 for coffee'])
+        self.assertEqual(instrument.snapshot(), {'enabled': False, 'counters': {}, 'stages': {}})
+
+    def test_parse_messages(self):
+        instrument.enable()
+        account = Account()
+        account.add_budget('Coffee', interval=MONTHLY)
+        account.parse_messages(['Paid $3 for coffee', 'Lunch with Bob', 'Paid $4 for coffee'], chunk_size=2)
+        account.get_budget_totals()
+
+        snapshot = instrument.snapshot()
+        self.assertEqual(snapshot['counters'], {'messages': 3, 'messages.failed': 1, 'transactions': 2})
+        self.assertEqual(snapshot['stages']['parse']['count'], 2)
+        self.assertEqual(snapshot['stages']['ledger.add']['count'], 2)
+        self.assertEqual(snapshot['stages']['budget_totals']['count'], 1)
+
+        account.record_metrics()
+        self.assertEqual(instrument.snapshot()['counters']['parse_cache.hits'], 1)
+        self.assertIn('parse', instrument.report())
+
+    def test_histogram(self):
+        histogram = instrument.Histogram()
+        for i in range(99):
+            histogram.add(0.001)
+        histogram.add(10)
+        self.assertEqual(histogram.percentile(50), 0.00128)
+        self.assertEqual(histogram.percentile(100), 10)
+        self.assertEqual(histogram.summary()['buckets'], {'0.00128': 99, '10.48576': 1})
+
+    def test_profile(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'run.prof')
+            with instrument.profile(path):
+                Account().parse_messages(['Paid $3 for coffee'])
+            stats = pstats.Stats(path)
+            self.assertTrue(any(function == 'parse_messages' for filename, line, function in stats.stats))
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+from decimal import Decimal
+
+from budgetkeeper import settings
+from budgetkeeper.budgetkeeper import Account
+from budgetkeeper.get_mail import SyncState
+from budgetkeeper.poller import MailDaemon
+
+from fakeimap import FakeIMAPServer
+
+ME = 'me@example.com'
+
+
+class TestMailDaemon(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.state_path = os.path.join(self.directory, 'imap-state.json')
+        self.saved = dict((name, getattr(settings, name, None)) for name in
+                          ('IMAP_ENABLED', 'IMAP_USE_SSL', 'IMAP_SERVER', 'IMAP_PORT', 'IMAP_LABEL',
+                           'AUTHENTICATION_EMAIL', 'AUTHENTICATION_PASSWORD'))
+        self.daemons = []
+
+    def tearDown(self):
+        for daemon in self.daemons:
+            daemon.stop()
+        for name, value in self.saved.items():
+            setattr(settings, name, value)
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def serve(self, **options):
+        self.server = FakeIMAPServer(**options)
+        self.server.start()
+        settings.IMAP_ENABLED = True
+        settings.IMAP_USE_SSL = False
+        settings.IMAP_SERVER = '127.0.0.1'
+        settings.IMAP_PORT = self.server.port
+        settings.IMAP_LABEL = False
+        settings.AUTHENTICATION_EMAIL = ME
+        settings.AUTHENTICATION_PASSWORD = 'secret'
+
+    def daemon(self, account=None, **options):
+        daemon = MailDaemon(account or Account(), SyncState.load(self.state_path), **options)
+        daemon.start()
+        self.daemons.append(daemon)
+        return daemon
+
+    def ingest(self, daemon, subject):
+        '''Deliver subject and wait for the daemon to take it in.'''
+        arrived = time.time()
+        self.server.add_message(ME, subject)
+        summary = daemon.ingest(timeout=5)
+        self.assertNotEqual(summary, None)
+        return summary, time.time() - arrived
+
+    def test_idle(self):
+        self.serve()
+        self.server.add_message(ME, 'Paid $3 for coffee')
+        daemon = self.daemon()
+        self.assertEqual(daemon.ingest(timeout=5).messages, 1)
+
+        summary, latency = self.ingest(daemon, 'Paid $4 for lunch')
+        self.assertEqual(summary.messages, 1)
+        self.assertLess(latency, 1)
+        self.assertEqual(daemon.account.balance, Decimal('-7.00'))
+        self.assertEqual(daemon.metrics.messages, 2)
+        self.assertLess(daemon.metrics.percentile(100), 1)
+
+    def test_polling_fallback(self):
+        self.serve(idle=False)
+        daemon = self.daemon(poll_interval=0.1)
+        summary, latency = self.ingest(daemon, 'Paid $4 for lunch')
+        self.assertEqual(summary.messages, 1)
+        self.assertLess(latency, 1)
+
+    def test_reconnect(self):
+        self.serve()
+        daemon = self.daemon(backoff=0.05)
+        self.ingest(daemon, 'Paid $3 for coffee')
+
+        self.server.drop_connections()
+        summary, latency = self.ingest(daemon, 'Paid $4 for lunch')
+        self.assertEqual(summary.messages, 1)
+        self.assertEqual(daemon.poller.reconnects, 1)
+        self.assertEqual(daemon.account.balance, Decimal('-7.00'))
+
+    def test_state_saved_after_ingest(self):
+        self.serve()
+        self.server.add_message(ME, 'Paid $3 for coffee')
+        daemon = self.daemon()
+        daemon.ingest(timeout=5)
+        daemon.stop()
+        self.assertEqual(SyncState.load(self.state_path).last_uid, 1)
+
+        # A new daemon carries on from there.
+        self.server.add_message(ME, 'Paid $4 for lunch')
+        account = Account()
+        daemon = self.daemon(account)
+        daemon.ingest(timeout=5)
+        self.assertEqual(account.balance, Decimal('-4.00'))
+
+    def test_bounded_queue(self):
+        self.serve()
+        for i in range(10):
+            self.server.add_message(ME, 'Paid $1 for gum')
+        daemon = self.daemon(queue_size=2, batch_size=3)
+
+        # The poller waits for room rather than queueing everything.
+        time.sleep(0.2)
+        self.assertEqual(daemon.queue.qsize(), 2)
+        messages = 0
+        while messages < 10:
+            messages += daemon.ingest(timeout=5).messages
+        self.assertEqual(daemon.account.balance, Decimal('-10.00'))
+
+
+if __name__ == '__main__':
+    unittest.main()
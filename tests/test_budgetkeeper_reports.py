@@ -0,0 +1,128 @@
+import random
+import unittest
+
+from decimal import Decimal, localcontext
+
+from datetime import date, datetime, timedelta
+
+from budgetkeeper.budgetkeeper import Account, Purchase, MONTHLY
+from budgetkeeper.reports import Report
+
+
+def make_account(size=2000, seed=1):
+    rand = random.Random(seed)
+    account = Account()
+    names = ['Groceries', 'Coffee', 'Booze']
+    for name in names:
+        account.add_budget(name, interval=MONTHLY)
+    start = datetime(2011, 12, 20)
+    for i in range(size):
+        timestamp = start + timedelta(hours=rand.randint(0, 24 * 200))
+        if i % 10 == 0:
+            account.add_income(rand.randint(100, 2000), timestamp=timestamp)
+        else:
+            account.add_purchase('%d.%02d' % (rand.randint(0, 50), rand.randint(0, 99)),
+                                 description=rand.choice(['Lunch', 'Bus', 'Book', '']),
+                                 category=rand.choice(names + [None]), timestamp=timestamp)
+    return account
+
+
+class TestReport(unittest.TestCase):
+    def setUp(self):
+        self.account = make_account()
+        self.report = self.account.report()
+        self.purchases = [trans for trans in self.account.transactions if trans.direction < 0]
+
+    def test_spending_by_category(self):
+        expected = {}
+        for trans in self.purchases:
+            if trans.category is not None:
+                expected[trans.category] = expected.get(trans.category, 0) + trans.amount
+        self.assertEqual(self.report.spending_by_category(), expected)
+
+    def test_spending_by_month(self):
+        expected = {}
+        for trans in self.purchases:
+            if trans.category is not None:
+                month = trans.timestamp.date().replace(day=1)
+                months = expected.setdefault(trans.category, {})
+                months[month] = months.get(month, 0) + trans.amount
+        self.assertEqual(self.report.spending_by_month(), expected)
+        for category in expected:
+            self.assertEqual(self.report.spending_by_month()[category][date(2012, 2, 1)],
+                             self.account._spending.total(category, date(2012, 2, 1), date(2012, 3, 1)))
+
+    def test_weeks_start_on_monday(self):
+        for weeks in self.report.spending_by_month('W').values():
+            self.assertEqual(set(day.weekday() for day in weeks), set([0]))
+
+    def test_series(self):
+        dates, totals = self.report.series('D', category='Coffee')
+        self.assertEqual(dates[1] - dates[0], timedelta(days=1))
+        days = {}
+        for trans in self.purchases:
+            if trans.category == 'Coffee':
+                day = trans.timestamp.date()
+                days[day] = days.get(day, 0) + trans.amount
+        self.assertEqual(dict((day, total) for day, total in zip(dates, totals) if total), days)
+        self.assertEqual(self.report.series('M')[0][:2], [date(2011, 12, 1), date(2012, 1, 1)])
+
+    def test_rolling_average(self):
+        dates, totals = self.report.series('D')
+        dates, averages = self.report.rolling_average(days=7)
+        self.assertEqual(averages[0], totals[0])
+        self.assertEqual(averages[10], sum(totals[4:11]) / 7)
+
+    def test_top_descriptions(self):
+        totals = {}
+        for trans in self.purchases:
+            totals[trans.description] = totals.get(trans.description, 0) + trans.amount
+        expected = sorted(totals.items(), key=lambda item: item[1], reverse=True)[:2]
+        self.assertEqual(self.report.top_descriptions(2), expected)
+
+    def test_running_balance(self):
+        ordered = sorted(self.account.transactions, key=lambda trans: trans.timestamp)
+        balance, expected = 0, []
+        for trans in ordered:
+            balance += trans.amount * trans.direction
+            expected.append(balance)
+        timestamps, balances = self.report.running_balance()
+        self.assertEqual(balances, expected)
+        self.assertEqual(balances[-1], self.account.balance)
+        self.assertEqual(timestamps, [trans.timestamp for trans in ordered])
+
+    def test_float_amounts(self):
+        account = Account()
+        account.add_budget('Bills')
+        account.add_bill(49.99, category='Bills', timestamp=datetime(2012, 1, 5))
+        account.add_income(0.1, timestamp=datetime(2012, 1, 6))
+        report = account.report()
+        self.assertEqual(report.spending_by_category(), {'Bills': Decimal(49.99)})
+        with localcontext() as context:
+            # Exactly, not to the 28 digits Decimal arithmetic keeps.
+            context.prec = 100
+            self.assertEqual(report.running_balance()[1][-1], Decimal(0.1) - Decimal(49.99))
+        self.assertEqual(report.running_balance()[1][-1].quantize(Decimal('0.01')), account.balance)
+
+    def test_sub_cent_amounts(self):
+        account = Account()
+        account.add_budget('Fees')
+        for day in (1, 2, 3):
+            account.add_income('0.005', timestamp=datetime(2012, 1, day))
+            account.add_transactions([Purchase(Decimal('0.001'), timestamp=datetime(2012, 1, day), category='Fees')])
+        report = account.report()
+        self.assertEqual(report.running_balance()[1][-1], Decimal('0.012'))
+        self.assertEqual(account.balance, Decimal('0.01'))
+        self.assertEqual(report.spending_by_category(), {'Fees': Decimal('0.003')})
+        self.assertEqual(report.series()[1], [Decimal('0.001')] * 3)
+        self.assertEqual(report.rolling_average(2)[1][-1], Decimal('0.001'))
+
+    def test_empty(self):
+        report = Report([])
+        self.assertEqual(report.spending_by_month(), {})
+        self.assertEqual(report.series(), ([], []))
+        self.assertEqual(report.running_balance(), ([], []))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from budgetkeeper import settings
+
+
+class TestSettings(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'budget-keeper.conf')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, text):
+        with open(self.path, 'w') as conf:
+            conf.write(text)
+
+    def test_read_over_defaults(self):
+        self.write('[imap]\nport=143\nlabel=budget\n\n[authentication]\npassword=1234\n')
+        config = settings.Settings([self.path])
+        self.assertEqual((config.IMAP_PORT, config.IMAP_LABEL, config.IMAP_SERVER),
+                         (143, 'budget', 'imap.gmail.com'))
+        # A password that looks like a number is still a password.
+        self.assertEqual(config.AUTHENTICATION_PASSWORD, '1234')
+
+    def test_lazy(self):
+        config = settings.Settings([self.path])
+        config.IMAP_PORT = 1143
+        self.write('[imap]\nport=143\nuse_ssl=no\n')
+        # Nothing is read until a setting that hasn't been set is wanted.
+        self.assertEqual(config.IMAP_USE_SSL, False)
+        self.assertEqual(config.IMAP_PORT, 1143)
+        self.assertRaises(AttributeError, getattr, config, 'NO_SUCH_SETTING')
+        self.assertEqual(os.listdir(self.directory), ['budget-keeper.conf'])
+
+    def test_bad_value(self):
+        self.write('[imap]\nport=lots\n')
+        with self.assertRaises(ValueError) as raised:
+            settings.Settings([self.path]).IMAP_PORT
+        self.assertIn('should be a whole number', str(raised.exception))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from decimal import Decimal
+
+from datetime import datetime
+from dateutil.relativedelta import relativedelta
+
+from budgetkeeper.budgetkeeper import Account, Bill, PayCheck, DAILY, MONTHLY, BIWEEKLY
+
+
+class TestLedger(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'ledger.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def reopen(self, account):
+        account.close()
+        return Account(self.path)
+
+    def test_round_trip(self):
+        account = Account(self.path)
+        account.add_budget('Groceries', interval=MONTHLY, limit=250, description='Food')
+        account.add_income(1000, description='Gift', timestamp=datetime(2012, 1, 1))
+        account.add_purchase('4.12', description='Coffee', timestamp=datetime(2012, 1, 2, 8, 15, 30, 5))
+        account.add_bill(100, description='Internet', interval=MONTHLY, timestamp=datetime(2012, 1, 3))
+        account.add_paycheck(1500, description='Pay', interval=BIWEEKLY, timestamp=datetime(2012, 1, 4))
+        expected = repr(account.transactions), repr(account.budgets), account.balance
+
+        account = self.reopen(account)
+        self.assertEqual((repr(account.transactions), repr(account.budgets), account.balance), expected)
+        self.assertTrue(isinstance(account.transactions[2], Bill))
+        self.assertTrue(isinstance(account.transactions[3], PayCheck))
+        self.assertEqual(account.verify_balance(), account.balance)
+
+    def test_totals_without_reading_transactions(self):
+        account = Account(self.path)
+        account.add_budget('Coffee', interval=DAILY)
+        account.parse_messages([('$3 coffee', datetime(2012, 2, 28, 8)),
+                                ('$4 coffee', datetime(2012, 2, 29, 8))])
+
+        account = self.reopen(account)
+        self.assertEqual(account.get_budget_totals(datetime(2012, 2, 29, 12)), {'Coffee': Decimal('4.00')})
+        self.assertEqual(account.balance, Decimal('-7.00'))
+        self.assertEqual(account._transactions, None)
+
+    def test_remove_and_update(self):
+        account = Account(self.path)
+        account.add_budget('Groceries', interval=MONTHLY)
+        income = account.add_income(100, timestamp=datetime(2012, 1, 1))
+        purchase = account.add_purchase(40, category='Groceries', timestamp=datetime(2012, 1, 1))
+        account = self.reopen(account)
+
+        income, purchase = account.transactions
+        account.remove_transaction(income)
+        account.update_transaction(purchase, category='Booze', amount=10)
+        account = self.reopen(account)
+        self.assertEqual(account.get_budget_total('Groceries'), Decimal('0.00'))
+        self.assertEqual(account.balance, Decimal('-10.00'))
+        self.assertEqual([p.category for p in account.transactions], ['Booze'])
+
+    def test_handed_out_before_reading(self):
+        account = Account(self.path)
+        account.add_income(10, timestamp=datetime(2012, 1, 1))
+        account = self.reopen(account)
+
+        coffee = account.add_purchase(3, timestamp=datetime(2012, 1, 2))
+        lunch = account.add_purchase(4, timestamp=datetime(2012, 1, 3))
+        self.assertEqual(account._transactions, None)
+        account.remove_transaction(coffee)
+        self.assertTrue(lunch in account.transactions)
+        account.update_transaction(lunch, amount=1)
+        self.assertEqual(account.verify_balance(), Decimal('9.00'))
+
+        account = self.reopen(account)
+        self.assertEqual([trans.amount for trans in account.transactions], [10, 1])
+
+    def test_recurring_progress(self):
+        account = Account(self.path)
+        account.add_bill(100, description='Rent', interval=MONTHLY, timestamp=datetime(2012, 1, 1))
+        self.assertEqual(account.trigger_recurring(datetime(2012, 6, 1)), 5)
+        account.add_paycheck(1000, description='Pay', interval=MONTHLY, timestamp=datetime(2012, 3, 15))
+
+        # The paycheck hasn't recurred yet, so starts from the top.
+        account = self.reopen(account)
+        self.assertEqual(account.trigger_recurring(datetime(2012, 7, 1)), 4)
+        self.assertEqual(account.balance, Decimal('-700.00') + Decimal('4000.00'))
+        self.assertEqual(account.verify_balance(), account.balance)
+
+    def test_intervals_and_old_timestamps(self):
+        account = Account(self.path)
+        account.add_bill(5, description='Meds', interval=relativedelta(hours=12), timestamp=datetime(2012, 1, 1))
+        account.add_purchase(1, description='Stamp', timestamp=datetime(1899, 12, 31, 23, 59))
+
+        account = self.reopen(account)
+        bill, stamp = account.transactions
+        self.assertEqual(bill.interval, relativedelta(hours=12))
+        self.assertEqual(stamp.timestamp, datetime(1899, 12, 31, 23, 59))
+        self.assertEqual(account.trigger_recurring(datetime(2012, 1, 2, 1)), 2)
+
+    def test_group_commit(self):
+        account = Account(self.path)
+        account._store.commit_every = 10
+        for i in range(25):
+            account.add_purchase(1, timestamp=datetime(2012, 1, 1))
+
+        # Only whole batches have reached the disk so far.
+        self.assertEqual(len(Account(self.path).transactions), 20)
+        account.flush()
+        self.assertEqual(len(Account(self.path).transactions), 25)
+
+
+    def test_parse_cache(self):
+        account = Account(self.path)
+        account.add_budget('Coffee', interval=DAILY)
+        account.parse_message('Paid $3 for coffee')
+
+        account = self.reopen(account)
+        self.assertEqual(account.parse_message('Paid $4 for coffee').category, 'Coffee')
+        self.assertEqual(account.parse_cache.hits, 1)
+
+        # A cache saved with other budgets isn't used.
+        account.close()
+        account = Account(self.path)
+        account.add_budget('Tea', interval=DAILY)
+        account = self.reopen(account)
+        self.assertEqual(len(account.parse_cache), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from decimal import Decimal
+
+from budgetkeeper import settings
+from budgetkeeper.budgetkeeper import Account
+from budgetkeeper.get_mail import MailConfig, connect
+from budgetkeeper.tenants import ConnectionPool, Tenant, load_tenants, sync_tenants
+
+from fakeimap import FakeIMAPServer
+
+
+class TestTenants(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeIMAPServer()
+        self.server.start()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def tenants(self, count, server=None):
+        server = server or self.server
+        tenants = []
+        for i in range(count):
+            email = 'user%d@example.com' % i
+            mail = MailConfig(email, 'secret', '127.0.0.1', server.port, False, False)
+            tenants.append(Tenant('user%d' % i, mail, os.path.join(self.directory, str(server.port), str(i))))
+        return tenants
+
+    def balance(self, tenant):
+        account = Account(tenant.ledger_path)
+        try:
+            return account.balance
+        finally:
+            account.close()
+
+    def test_load_tenants(self):
+        path = os.path.join(self.directory, 'tenants.conf')
+        with open(path, 'w') as f:
+            f.write('[alice]\nemail=alice@example.com\npassword=secret\n'
+                    '[bob]\nemail=bob@example.com\npassword=hunter2\nserver=imap.example.com\nport=143\n'
+                    'use_ssl=no\nlabel=budget\n')
+        alice, bob = load_tenants(path, self.directory)
+        self.assertEqual(alice.mail, MailConfig('alice@example.com', 'secret', settings.IMAP_SERVER,
+                                                settings.IMAP_PORT, settings.IMAP_USE_SSL, settings.IMAP_LABEL))
+        self.assertEqual(bob.mail, MailConfig('bob@example.com', 'hunter2', 'imap.example.com', 143, False, 'budget'))
+        self.assertEqual(bob.ledger_path, os.path.join(self.directory, 'bob', 'ledger.db'))
+
+        with open(path, 'w') as f:
+            f.write('[..]\nemail=x\npassword=y\n')
+        self.assertRaises(ValueError, load_tenants, path, self.directory)
+
+    def test_sync_tenants(self):
+        tenants = self.tenants(5)
+        for i, tenant in enumerate(tenants):
+            self.server.add_message(tenant.mail.email, 'Paid $%d for coffee' % (i + 1), user=tenant.mail.email)
+        pool = ConnectionPool(per_server=8)
+        results = sync_tenants(tenants, pool)
+        self.assertEqual([results[tenant.name].messages for tenant in tenants], [1] * 5)
+        self.assertEqual([self.balance(tenant) for tenant in tenants], [Decimal(-i) for i in range(1, 6)])
+
+        # The next sync picks up only what's new, on the same connections.
+        self.server.add_message('user0@example.com', 'Paid $10 for lunch', user='user0@example.com')
+        results = sync_tenants(tenants, pool)
+        self.assertEqual([results[tenant.name].messages for tenant in tenants], [1, 0, 0, 0, 0])
+        self.assertEqual(self.balance(tenants[0]), Decimal('-11.00'))
+        self.assertEqual((pool.opened, pool.reused), (5, 5))
+        pool.close()
+
+    def test_connections_per_server(self):
+        tenants = self.tenants(6)
+        peaks = []
+
+        def counting_connect(config):
+            peaks.append(pool._open[config.server, config.port])
+            return connect(config)
+
+        pool = ConnectionPool(per_server=2, connect=counting_connect)
+        results = sync_tenants(tenants, pool, workers=6)
+        self.assertEqual(len(results), 6)
+        self.assertEqual(max(peaks), 2)
+        self.assertEqual(len(pool._idle[('127.0.0.1', self.server.port)]), 2)
+        pool.close()
+
+    def test_dropped_connection(self):
+        tenants = self.tenants(1)
+        pool = ConnectionPool()
+        sync_tenants(tenants, pool)
+        self.server.drop_connections()
+        self.server.add_message('user0@example.com', 'Paid $3 for coffee', user='user0@example.com')
+        results = sync_tenants(tenants, pool)
+        self.assertEqual(results['user0'].messages, 1)
+        pool.close()
+
+    def test_bad_login(self):
+        server = FakeIMAPServer(logins=[('user0@example.com', 'secret')])
+        server.start()
+        try:
+            tenants = self.tenants(2, server)
+            results = sync_tenants(tenants)
+            self.assertEqual(results['user0'].messages, 0)
+            self.assertTrue(isinstance(results['user1'], Exception))
+        finally:
+            server.stop()
+
+    def test_failed_tenant(self):
+        tenants = self.tenants(3)
+        for tenant in tenants:
+            self.server.add_message(tenant.mail.email, 'Paid $3 for coffee', user=tenant.mail.email)
+        # A ledger that can't be opened.
+        os.makedirs(tenants[1].ledger_path)
+        results = sync_tenants(tenants, workers=1)
+        self.assertTrue(isinstance(results['user1'], Exception))
+        self.assertEqual([results['user0'].messages, results['user2'].messages], [1, 1])
+
+    def test_pool_error_in_use(self):
+        config = self.tenants(1)[0].mail
+        pool = ConnectionPool(per_server=1)
+        with self.assertRaises(TypeError):
+            with pool.connection(config):
+                raise TypeError('not an IMAP problem')
+        self.assertEqual(pool._open[config.server, config.port], 0)
+        with pool.connection(config) as connection:
+            self.assertFalse(connection.reused)
+        self.assertEqual(pool.opened, 2)
+        pool.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
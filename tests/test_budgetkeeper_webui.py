@@ -0,0 +1,95 @@
+import json
+import unittest
+
+from datetime import datetime
+from dateutil.relativedelta import relativedelta
+
+from tornado.testing import AsyncHTTPTestCase
+
+from budgetkeeper import instrument
+from budgetkeeper.budgetkeeper import Account, MONTHLY
+from budgetkeeper.webui.webui import make_app
+
+
+class TestWebUI(AsyncHTTPTestCase):
+    def get_app(self):
+        self.account = Account()
+        self.account.add_budget('Groceries', interval=MONTHLY, limit=200)
+        self.account.add_income(100, description='Gift', timestamp=datetime(2012, 1, 1))
+        self.account.add_purchase('14.57', category='Groceries')
+        self.cache = {}
+        return make_app(self.account, cache=self.cache)
+
+    def get_json(self, path):
+        response = self.fetch(path)
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.headers['Content-Type'], 'application/json')
+        return json.loads(response.body)
+
+    def test_balance(self):
+        self.assertEqual(self.get_json('/balance'), {'balance': '85.43'})
+
+        # Cached, but not past a change to the account.
+        self.account.add_purchase(5)
+        self.assertEqual(self.get_json('/balance'), {'balance': '80.43'})
+
+    def test_budgets(self):
+        self.assertEqual(self.get_json('/budgets'), {'Groceries': {'spent': '14.57', 'limit': '200'}})
+
+    def test_overview(self):
+        self.assertEqual(self.get_json('/')['balance'], '85.43')
+
+    def test_transactions(self):
+        # Newest first, a page at a time.
+        page = self.get_json('/transactions?limit=1')
+        self.assertEqual([trans['category'] for trans in page['transactions']], ['Groceries'])
+        page = self.get_json('/transactions?limit=1&cursor=' + page['next'])
+        self.assertEqual(page['transactions'], [{'kind': 'Income', 'amount': '100', 'description': 'Gift',
+                                                 'category': None, 'timestamp': '2012-01-01T00:00:00'}])
+        self.assertEqual(page['next'], None)
+
+    def test_transactions_interval(self):
+        self.account.add_bill(5, description='Meds', interval=relativedelta(days=1, hours=12))
+        bill = self.get_json('/transactions?limit=1')['transactions'][0]
+        self.assertEqual(bill['interval'], {'years': 0, 'months': 0, 'days': 1, 'hours': 12,
+                                            'minutes': 0, 'seconds': 0, 'microseconds': 0})
+
+    def test_cache_one_entry_per_route(self):
+        for i in range(3):
+            self.get_json('/')
+            self.get_json('/budgets')
+            self.account.add_purchase(1)
+        self.assertEqual(sorted(self.cache), ['/', '/budgets'])
+
+    def test_transactions_before_1900(self):
+        self.account.add_purchase(2, description='Stamp', timestamp=datetime(1899, 12, 30))
+        self.account.add_purchase(1, description='Postcard', timestamp=datetime(1899, 12, 31))
+        page = self.get_json('/transactions?limit=3')
+        page = self.get_json('/transactions?limit=3&cursor=' + page['next'])
+        self.assertEqual([trans['description'] for trans in page['transactions']], ['Stamp'])
+
+    def test_transactions_limit(self):
+        self.assertEqual(len(self.get_json('/transactions?limit=0')['transactions']), 1)
+        self.assertEqual(len(self.get_json('/transactions?limit=1000')['transactions']), 2)
+        self.assertEqual(self.fetch('/transactions?limit=abc').code, 400)
+
+    def test_transactions_between(self):
+        page = self.get_json('/transactions?start=2012-01-01&end=2012-02-01')
+        self.assertEqual([trans['description'] for trans in page['transactions']], ['Gift'])
+        self.assertEqual(self.fetch('/transactions?cursor=nonsense').code, 400)
+        self.assertEqual(self.fetch('/transactions?start=January').code, 400)
+
+    def test_metrics(self):
+        instrument.enable()
+        try:
+            self.get_json('/balance')
+            metrics = self.get_json('/metrics')
+        finally:
+            instrument.enable(False)
+            instrument.metrics.reset()
+        self.assertEqual(metrics['stages']['webui.BalanceView']['count'], 1)
+        self.assertEqual(metrics['parse_cache'], {'hits': 0, 'misses': 0, 'size': 0})
+
+
+if __name__ == '__main__':
+    unittest.main()